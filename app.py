@@ -1,56 +1,102 @@
 import streamlit as st # type: ignore
 from datetime import datetime, timedelta
+import json
+import os
 import sys
 
-from src.components.ingestion import fetch_all_data
-from src.components.processing import compute_metrics
-from src.components.fetch_output import write_outputs
-from src.utils.logger import logging
+from src.components.grains import available_grains, grain_columns, grain_root
+from src.utils.history_index import HistoryIndex
+from src.utils.history_store import history_version
+from src.utils.logger import logging, setup_logger
 from src.utils.exception import CustomException
 from src.config.settings import settings
+from src.config.plants import load_plants, plant_overrides
+
+setup_logger(name="dashboard")
 
 st.set_page_config(layout="wide", page_title="Broke Monitoring Dashboard")
 st.title("Broke Monitoring Dashboard")
 
-try:
-    logging.info("Manual dashboard ETL execution started.")
-    st.info("Running ingestion and processing...")
+@st.cache_resource(show_spinner=False, max_entries=4)
+def load_history(version, metrics, columns, root):
+    """
+        Builds the history index once per file version; the index is shared, uncopied, across sessions and reruns.
+        Args:
+            version (tuple): history_version() fingerprint, used only as the cache key.
+            metrics (tuple): Metric columns to index.
+            columns (tuple): Further columns shown but not totalled.
+            root (str): Partition directory of the selected plant and grain.
+    """
+    return HistoryIndex.load(list(metrics), root=root, columns=columns)
+
+@st.cache_data(show_spinner=False)
+def load_summary(mtime):
+    if not os.path.exists(settings.SUMMARY_FILE):
+        return {}
+    with open(settings.SUMMARY_FILE) as f:
+        return json.load(f)
+
+plants = load_plants()
 
-    raw_data = fetch_all_data()
-    metrics_df, summary = compute_metrics(raw_data)
-    write_outputs(metrics_df, summary)
+with st.sidebar:
+    if st.button("Run ETL now"):
+        from src.pipeline.scheduler import run_daily_pipeline
+        try:
+            logging.info("Manual dashboard ETL execution started.")
+            with st.spinner("Running ingestion and processing..."):
+                run_daily_pipeline()
+            st.success("Data processed successfully.")
+        except Exception as e:
+            err = CustomException(e, sys)
+            logging.error(str(err))
+            st.error(f"Error: {err}")
 
-    st.success("Data processed successfully.")
-except Exception as e:
-    err = CustomException(e, sys)
-    logging.error(str(err))
-    st.error(f"Error: {err}")
+summary_mtime = os.path.getmtime(settings.SUMMARY_FILE) if os.path.exists(settings.SUMMARY_FILE) else None
+summary = load_summary(summary_mtime)
+
+grains = available_grains()
+grain = st.selectbox("Select Grain", grains, index=grains.index("day"))
+history_dir, grain_dir = settings.HISTORY_DIR, settings.GRAIN_DIR
+if plants:
+    plant = st.selectbox("Select Plant", list(plants))
+    overrides = plant_overrides(plant, plants[plant])
+    history_dir, grain_dir = overrides["HISTORY_DIR"], overrides["GRAIN_DIR"]
+    summary = summary.get("plants", {}).get(plant, {})
+history_root = grain_root(grain, history_dir, grain_dir)
+metrics, columns = grain_columns(grain)
+history = load_history(history_version(history_root), tuple(metrics), tuple(columns), history_root)
+
+if history.empty:
+    st.warning("No history available yet. Run the ETL from the sidebar or wait for the scheduler.")
     st.stop()
 
+if summary:
+    st.caption(f"Last calculated date: {summary.get('last_calculated_date')}")
+    for machine, latest in summary.get("anomalies", {}).items():
+        flagged = [metric for metric, scores in latest["metrics"].items() if scores["anomaly"]]
+        if flagged:
+            st.warning(f"{machine} on {latest['date']}: unusual {', '.join(flagged)}")
+
 st.write("---")
 st.header("Explore Historical Broke Data")
 
-machine_input = st.selectbox("Select Machine", sorted(metrics_df['machine_id'].unique()))
+machine_input = st.selectbox("Select Machine", history.machines())
 
 col1, col2 = st.columns(2)
 start_date = col1.date_input("Start Date", datetime.now().date() - timedelta(days=30))
 end_date = col2.date_input("End Date", datetime.now().date())
 
-filtered = metrics_df[
-    (metrics_df['machine_id'] == machine_input) &
-    (metrics_df['calculation_date'] >= start_date) &
-    (metrics_df['calculation_date'] <= end_date)
-]
+filtered = history.rows(machine_input, start_date, end_date)
 
 if filtered.empty:
     st.warning("No data available in the selected range.")
     st.stop()
 
 st.subheader("Summary Metrics")
-for col in ['SAP_Production', 'QCS_Production', 'Reel_Production',
-            'Rewinder_Input', 'Rewinder_Output', 'Qc_Rejection', 'Handling_Loss']:
-    st.metric(col, f"{filtered[col].sum():,.2f} tons")
+totals = history.totals(machine_input, start_date, end_date)
+for col in history.metrics:
+    st.metric(col, f"{totals[col]:,.2f} tons")
 
 st.write("---")
 st.subheader("Raw Data Table")
-st.dataframe(filtered.set_index("calculation_date"))
\ No newline at end of file
+st.dataframe(filtered.set_index("calculation_date"))
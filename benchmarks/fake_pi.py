@@ -0,0 +1,44 @@
+import time
+import zlib
+import pandas as pd
+
+"""
+    In-process stand-in for PIconnect's PIServer with configurable per-call latency.
+"""
+
+class FakePIPoint:
+    def __init__(self, tag, latency):
+        self.tag = tag
+        self.latency = latency
+
+    def _value(self, timestamp):
+        # Deterministic tonnage per (tag, day) so repeated runs compare equal
+        seed = zlib.crc32(f"{self.tag}|{pd.Timestamp(timestamp).date()}".encode())
+        return 100.0 + seed % 50_000 / 100.0
+
+    def recorded_value(self, timestamp):
+        time.sleep(self.latency)
+        return pd.Series([self._value(timestamp)], index=[pd.Timestamp(timestamp)])
+
+    def recorded_values(self, start_time, end_time):
+        # One sample per hour, each equal to what recorded_value returns at that time
+        time.sleep(self.latency)
+        index = pd.date_range(pd.Timestamp(start_time).ceil("h"), pd.Timestamp(end_time), freq="h")
+        return pd.Series([self._value(timestamp) for timestamp in index], index=index)
+
+class FakePIServer:
+    """
+        Args:
+            search_latency (float): Seconds slept per tag search.
+            value_latency (float): Seconds slept per recorded_value / recorded_values call.
+    """
+
+    def __init__(self, search_latency=0.0, value_latency=0.0):
+        self.search_latency = search_latency
+        self.value_latency = value_latency
+        self.calls = 0
+
+    def search(self, tag):
+        self.calls += 1
+        time.sleep(self.search_latency)
+        return [FakePIPoint(tag, self.value_latency)]
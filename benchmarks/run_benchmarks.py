@@ -0,0 +1,165 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+"""
+    Offline benchmark harness for the ActiveQC pipeline.
+    Each (scale, stage) case runs in a fresh interpreter against a synthetic SQLite database and a fake PI
+    server, so timings and peak RSS are not polluted by earlier cases. Results are appended as JSON lines
+    tagged with the current git commit, so regressions can be compared across commits.
+
+    Usage:
+        python -m benchmarks.run_benchmarks --scales small medium
+        python -m benchmarks.run_benchmarks --rows 500000 --machines 40 --days 30 --stages compute
+"""
+
+SCALES = {
+    "small": {"rows": 10_000, "machines": 3, "days": 1},
+    "medium": {"rows": 200_000, "machines": 20, "days": 7},
+    "large": {"rows": 1_000_000, "machines": 100, "days": 30},
+}
+STAGES = ["fetch", "compute", "write", "end_to_end"]
+START_DATE = date(2025, 1, 1)
+
+def _configure(case, workdir):
+    """
+        Points settings at the synthetic database and a scratch output directory, and installs the fake PI server.
+    """
+    from benchmarks.fake_pi import FakePIServer
+    from benchmarks.synthetic import build_database, machine_config
+    from src.config.settings import settings
+    from src.utils import pi
+
+    db_path = os.path.join(case["cache_dir"], f"synthetic_v2_{case['rows']}_{case['machines']}_{case['days']}.db")
+    settings.DB_CONNECTION_STRING = build_database(db_path, case["rows"], case["machines"], case["days"], START_DATE)
+    for name, value in machine_config(case["machines"]).items():
+        setattr(settings, name, value)
+    settings.HISTORY_FILE = os.path.join(workdir, "legacy_history.feather")
+    settings.HISTORY_DIR = os.path.join(workdir, "history")
+    settings.DERIVED_DIR = os.path.join(workdir, "derived")
+    settings.GRAIN_DIR = os.path.join(workdir, "grains")
+    settings.ANOMALY_DIR = os.path.join(workdir, "anomalies")
+    settings.SUMMARY_FILE = os.path.join(workdir, "dashboard_summary.json")
+    settings.ROLLUP_FILE = os.path.join(workdir, "rollups.json")
+    settings.STATE_DIR = os.path.join(workdir, "state")
+    settings.EXTRACT_CACHE_DIR = os.path.join(workdir, "cache")
+    settings.PI_CACHE_DIR = os.path.join(workdir, "pi_cache")
+    settings.METRICS_DIR = os.path.join(workdir, "metrics")
+    settings.RUN_LOG_FILE = os.path.join(workdir, "metrics", "run_log.jsonl")
+    settings.INGEST_MODE = case["ingest_mode"]
+    pi.invalidate_pi_cache()
+    pi._server = FakePIServer(case["pi_search_latency"], case["pi_value_latency"])
+
+def _run_case(case, queue):
+    """
+        Worker entry point: runs one stage (plus any untimed prerequisites) and reports its measurements.
+    """
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            _configure(case, workdir)
+            from src.components.ingestion import fetch_all_data
+            from src.components.processing import compute_metrics
+            from src.components.fetch_output import write_outputs
+            from src.utils.instrumentation import peak_rss_mb
+
+            start, end = START_DATE, START_DATE + timedelta(days=case["days"] - 1)
+            stage = case["stage"]
+            data = metrics = None
+            if stage in ("compute", "write"):
+                data = fetch_all_data(start, end)
+            if stage == "write":
+                metrics = compute_metrics(data)
+
+            rss_before = peak_rss_mb()
+            began = time.perf_counter()
+            if stage == "fetch":
+                data = fetch_all_data(start, end)
+            elif stage == "compute":
+                metrics = compute_metrics(data)
+            elif stage == "write":
+                write_outputs(*metrics)
+            else:
+                data = fetch_all_data(start, end)
+                metrics = compute_metrics(data)
+                write_outputs(*metrics)
+            seconds = time.perf_counter() - began
+
+            rows_in = sum(len(data[k]) for k in ("sap_df", "rewinder_df", "qc_df")) if data else None
+            queue.put({
+                "seconds": round(seconds, 4),
+                "peak_rss_mb": peak_rss_mb(),
+                "peak_rss_before_mb": rss_before,
+                "rows_in": rows_in,
+                "rows_out": len(metrics[0]) if metrics else None,
+                "source_rows_per_s": round(3 * case["rows"] / seconds, 1) if seconds else None,
+            })
+    except Exception as e:
+        queue.put({"error": repr(e)})
+
+def run_case(case):
+    """
+        Runs one case in a fresh spawned interpreter and returns the result record.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    worker = ctx.Process(target=_run_case, args=(case, queue))
+    worker.start()
+    result = queue.get()
+    worker.join()
+    return {**{k: v for k, v in case.items() if k != "cache_dir"}, **result}
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ActiveQC offline benchmarks.")
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=sorted(SCALES))
+    parser.add_argument("--rows", type=int, help="Custom scale: rows per table (overrides --scales).")
+    parser.add_argument("--machines", type=int, default=10, help="Custom scale: number of machines.")
+    parser.add_argument("--days", type=int, default=1, help="Custom scale: number of business dates.")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--ingest-mode", default="rows", choices=["rows", "aggregate", "stream"])
+    parser.add_argument("--pi-search-latency", type=float, default=0.02, help="Seconds per fake PI tag search.")
+    parser.add_argument("--pi-value-latency", type=float, default=0.05, help="Seconds per fake PI value read.")
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "activeqc_bench"))
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results.jsonl"))
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    scales = {"custom": {"rows": args.rows, "machines": args.machines, "days": args.days}} if args.rows else {
+        name: SCALES[name] for name in args.scales
+    }
+    run = {
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a") as out:
+        for scale, params in scales.items():
+            for stage in args.stages:
+                case = {
+                    "scale": scale, **params, "stage": stage, "ingest_mode": args.ingest_mode,
+                    "pi_search_latency": args.pi_search_latency, "pi_value_latency": args.pi_value_latency,
+                    "cache_dir": args.cache_dir,
+                }
+                record = {**run, **run_case(case)}
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                print(f"{scale:>8} {stage:<11} {record.get('seconds', 'ERR'):>9}s  "
+                      f"peak {record.get('peak_rss_mb')} MB  {record.get('error', '')}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+from benchmarks.run_benchmarks import git_commit
+
+"""
+    Startup-time benchmark.
+    Times a cold import of each entry point's module set in a fresh interpreter, so import-time regressions
+    (heavy modules pulled in eagerly, side effects on import) show up per commit next to the pipeline benchmarks.
+    Also records the slowest imported packages reported by `python -X importtime`.
+
+    Usage:
+        python -m benchmarks.startup --repeat 7
+"""
+
+APP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+def app_imports(path=APP_FILE):
+    """
+        The project modules a script imports at top level, in import order. Imports inside functions and handlers
+        (e.g. the dashboard's "Run ETL now" button) are deferred and not part of startup.
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(module for module in modules if module.split(".")[0] == "src"))
+
+ENTRY_POINTS = {
+    # Read from app.py so the set follows the dashboard's imports; streamlit itself is left out
+    "dashboard": app_imports(),
+    "scheduler": ["src.pipeline.scheduler"],
+    "daemon": ["src.pipeline.daemon"],
+    "ingestion": ["src.components.ingestion"],
+}
+
+def _import_code(modules):
+    return "; ".join(f"import {module}" for module in modules)
+
+def time_import(modules, repeat):
+    """
+        Wall time of a cold interpreter importing `modules`, minus a bare interpreter start.
+        Returns: dict: Median and min seconds over `repeat` runs.
+    """
+    code = (
+        "import time; began = time.perf_counter(); "
+        f"{_import_code(modules)}; "
+        "print(time.perf_counter() - began)"
+    )
+    samples = [
+        float(subprocess.check_output([sys.executable, "-c", code], text=True).strip().splitlines()[-1])
+        for _ in range(repeat)
+    ]
+    return {"median_s": round(statistics.median(samples), 4), "min_s": round(min(samples), 4)}
+
+def slowest_imports(modules, top=5):
+    """
+        Third-party packages with the largest cumulative import time, from `python -X importtime`.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _import_code(modules)],
+        capture_output=True, text=True, check=True,
+    )
+    totals = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        package = name.strip().split(".")[0]
+        if not cumulative.strip().isdigit() or package in ("src", "benchmarks") or package in sys.stdlib_module_names:
+            continue
+        totals[package] = max(totals.get(package, 0), int(cumulative))
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {package: round(us / 1e6, 4) for package, us in ranked}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ActiveQC startup-time benchmark.")
+    parser.add_argument("--entry-points", nargs="+", default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=os.path.join("benchmarks", "startup_results.jsonl"))
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    run = {
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a") as out:
+        for name in args.entry_points:
+            modules = ENTRY_POINTS[name]
+            try:
+                record = {**run, "entry_point": name, **time_import(modules, args.repeat),
+                          "slowest": slowest_imports(modules)}
+            except subprocess.CalledProcessError as e:
+                record = {**run, "entry_point": name, "error": str(e)}
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            print(f"{name:<10} {record.get('median_s', 'ERR'):>8}s  {record.get('slowest', record.get('error'))}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import string
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine # type: ignore
+
+"""
+    Synthetic stand-ins for the SAP extract tables.
+    Fills a SQLite database with MB51_MATDOC, ZPR020_REWLOG and ZQM008_REJ rows shaped like the production
+    tables (only the columns the pipeline reads, plus the filter, posting-time and watermark columns), and returns the
+    machine maps and PI tags that match the generated codes.
+"""
+
+_BASE36 = string.digits + string.ascii_uppercase
+
+def machine_config(machines):
+    """
+        Machine maps and PI tags for `machines` synthetic paper machines (PM1..PMn), and the synthetic tables'
+        posting-time columns.
+        Returns: dict: Settings overrides (MACHINE_MAP_SAP, MACHINE_MAP_REWINDER, MACHINE_MAP_QC, PI_TAGS,
+            POSTING_TIME_COLUMNS).
+    """
+    ids = [f"PM{i}" for i in range(1, machines + 1)]
+    rewinder_codes = [_BASE36[i // 36] + _BASE36[i % 36] for i in range(1, machines + 1)]
+    return {
+        "MACHINE_MAP_SAP": {m: m for m in ids},
+        "MACHINE_MAP_REWINDER": dict(zip(rewinder_codes, ids)),
+        "MACHINE_MAP_QC": {f"RP{i}": m for i, m in enumerate(ids, start=1)},
+        "PI_TAGS": {m: (f"SYN_{m}_QCS:DayTonnage", f"SYN_{m}_QCS:ReelTonnage") for m in ids},
+        "POSTING_TIME_COLUMNS": {"sap": "CPUTM", "rewinder": "ERZET", "qc": "CTIME"},
+    }
+
+def generate_tables(rows, machines, days, start=date(2025, 1, 1), werks=5000, seed=0):
+    """
+        Generates the three extract tables.
+        Args:
+            rows (int): Rows per table.
+            machines (int): Number of machines.
+            days (int): Number of business dates the rows are spread over.
+            start (date): First business date.
+            werks (int): Plant code written to the werks columns.
+            seed (int): Random seed.
+        Returns: dict: Table name -> pd.DataFrame.
+    """
+    rng = np.random.default_rng(seed)
+    config = machine_config(machines)
+    dates = np.array([start + timedelta(days=i) for i in range(days)])
+    day_index = rng.integers(0, days, rows)
+    timestamps = np.sort(rng.integers(0, 86_400 * days, rows))
+
+    def pick(codes):
+        # ~2% of rows land on a location outside the machine maps, as in production
+        codes = np.array(list(codes) + ["XX9"], dtype=object)
+        weights = np.full(len(codes), 0.98 / (len(codes) - 1))
+        weights[-1] = 0.02
+        return rng.choice(codes, rows, p=weights)
+
+    budat = np.array([d.strftime("%Y%m%d") for d in dates])[day_index]
+
+    def posting_times():
+        # SAP TIMS values (HHMMSS)
+        return [f"{s // 3600:02d}{s // 60 % 60:02d}{s % 60:02d}" for s in rng.integers(0, 86_400, rows)]
+    sap = pd.DataFrame({
+        "werks": werks,
+        "BUDAT": budat,
+        "BWART": rng.choice([101, 102], rows, p=[0.97, 0.03]),
+        "CHARG": rng.integers(0, int(rows * 0.9), rows).astype(str),
+        "LGORT": pick(config["MACHINE_MAP_SAP"]),
+        "MENGE": rng.gamma(4.0, 400.0, rows).round(3),
+        "CPUTM": posting_times(),
+        "TIMESTAMP1": timestamps,
+    })
+    rewinder = pd.DataFrame({
+        "BUDAT": budat[rng.permutation(rows)],
+        "OP_CHARG": rng.integers(0, int(rows * 0.9), rows).astype(str),
+        "BATCH": ["5000" + code + "R" for code in pick(config["MACHINE_MAP_REWINDER"])],
+        "TOT_MENGE": rng.gamma(4.0, 300.0, rows).round(3),
+        "CH_REEL_WT": rng.gamma(4.0, 290.0, rows).round(3),
+        "ERZET": posting_times(),
+        "TIMESTAMP1": timestamps,
+    })
+    qc = pd.DataFrame({
+        "werks": werks,
+        "CDATE": np.array([d.strftime("%d.%m.%Y") for d in dates])[day_index[rng.permutation(rows)]],
+        "LGORT": pick(config["MACHINE_MAP_QC"]),
+        "REA_MOV": rng.choice(["Repulp", "Rework", "Downgrade"], rows),
+        "CODE": rng.choice(["Handling Loss", "Quality", "Other"], rows),
+        "FROM_QTY": rng.gamma(2.0, 50.0, rows).round(3),
+        "CTIME": posting_times(),
+        "TIMESTAMP1": timestamps,
+    })
+    return {"MB51_MATDOC": sap, "ZPR020_REWLOG": rewinder, "ZQM008_REJ": qc}
+
+def build_database(path, rows, machines, days, start=date(2025, 1, 1), werks=5000, seed=0):
+    """
+        Writes a synthetic SQLite database, reusing an existing file with the same parameters.
+        Returns: str: SQLAlchemy connection string for the database.
+    """
+    url = f"sqlite:///{os.path.abspath(path)}"
+    if os.path.exists(path):
+        return url
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    engine = create_engine(f"sqlite:///{os.path.abspath(tmp_path)}")
+    with engine.begin() as conn:
+        for name, df in generate_tables(rows, machines, days, start, werks, seed).items():
+            df.to_sql(name, conn, index=False, chunksize=50_000)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE INDEX ix_mb51_budat ON MB51_MATDOC (BUDAT)")
+        conn.exec_driver_sql("CREATE INDEX ix_rew_budat ON ZPR020_REWLOG (BUDAT)")
+        conn.exec_driver_sql("CREATE INDEX ix_qc_cdate ON ZQM008_REJ (CDATE)")
+    engine.dispose()
+    os.replace(tmp_path, path)
+    return url
@@ -0,0 +1,410 @@
+import argparse
+import json
+import math
+import os
+from bisect import bisect_right, insort
+from collections import deque
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from src.components.derived import read_derived
+from src.components.processing import METRIC_COLUMNS
+from src.config.plants import apply_overrides, load_plants, plant_overrides
+from src.config.settings import settings
+from src.utils.file_lock import output_lock
+from src.utils.history_store import KEY_COLUMNS, atomic_write_json, read_history, upsert_history
+from src.utils.logger import logging, setup_logger
+
+"""
+    Streaming anomaly detection on the daily metrics.
+    For every machine and monitored metric (settings.ANOMALY_METRICS) the state in STATE_DIR/anomaly_state.json
+    holds running statistics of the closed days so far: an EWMA mean and variance, the mean and variance of the
+    last ANOMALY_WINDOW_DAYS days, and P² sketches of the quartiles. Each day is scored against them before it is
+    folded in, in O(1) per machine and metric however long the history grows:
+        z         (value - window mean) / window standard deviation
+        ewma_z    (value - EWMA) / EWMA standard deviation
+        robust_z  (value - median) / (interquartile range / 1.349)
+    Scores and flags are stored per (calculation_date, machine_id) under settings.ANOMALY_DIR, next to the derived
+    metrics, and each machine's latest scored day goes into the dashboard summary.
+    The open business day the polling daemon passes in is scored but not folded in. Rewriting the latest folded
+    day replaces it, since the state keeps the statistics from before it. A correction to an earlier day (a
+    backfill, a late PI repair) rewinds that machine to its last checkpoint before the day, a copy of its
+    statistics kept every ANOMALY_WINDOW_DAYS, and replays only the history after it.
+
+    Usage:
+        python -m src.components.anomalies rebuild
+        python -m src.components.anomalies rebuild --plant 5000
+"""
+
+SCORES = ("z", "ewma_z", "robust_z")
+QUARTILES = (0.25, 0.5, 0.75)
+
+class P2Quantile:
+    """
+        P² estimate of one quantile (Jain & Chlamtac): five markers, O(1) memory and time per observation.
+    """
+
+    def __init__(self, p, state=None):
+        state = state or {}
+        self.p = p
+        self.heights = list(state.get("heights", []))
+        self.positions = list(state.get("positions", []))
+        self.desired = list(state.get("desired", []))
+
+    def add(self, x):
+        if not self.positions:
+            # Exact until five observations have been seen
+            insort(self.heights, x)
+            if len(self.heights) == 5:
+                self.positions = [1, 2, 3, 4, 5]
+                self.desired = [1, 1 + 2 * self.p, 1 + 4 * self.p, 3 + 2 * self.p, 5]
+            return
+        q, n = self.heights, self.positions
+        if x < q[0]:
+            q[0], k = x, 0
+        elif x >= q[4]:
+            q[4], k = x, 3
+        else:
+            k = bisect_right(q, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i, increment in enumerate((0, self.p / 2, self.p, (1 + self.p) / 2, 1)):
+            self.desired[i] += increment
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                s = 1 if d > 0 else -1
+                height = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + s * (q[i + s] - q[i]) / (n[i + s] - n[i])
+                q[i] = height
+                n[i] += s
+
+    def value(self):
+        if not self.heights:
+            return math.nan
+        if not self.positions:
+            return float(np.quantile(self.heights, self.p))
+        return self.heights[2]
+
+    def to_dict(self):
+        return {"heights": self.heights, "positions": self.positions, "desired": self.desired}
+
+class RunningStats:
+    """
+        Running statistics of one machine's metric: EWMA, rolling window (Welford with removal) and quartile sketches.
+    """
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.count = state.get("count", 0)
+        self.ewma = state.get("ewma", 0.0)
+        self.ewm_var = state.get("ewm_var", 0.0)
+        self.window = deque(state.get("window", []))
+        self.mean = state.get("mean", 0.0)
+        self.m2 = state.get("m2", 0.0)
+        self.quartiles = [P2Quantile(p, s) for p, s in zip(QUARTILES, state.get("quartiles", [None] * len(QUARTILES)))]
+
+    def add(self, x):
+        if self.count == 0:
+            self.ewma = x
+        else:
+            diff = x - self.ewma
+            increment = settings.ANOMALY_EWMA_ALPHA * diff
+            self.ewma += increment
+            self.ewm_var = (1 - settings.ANOMALY_EWMA_ALPHA) * (self.ewm_var + diff * increment)
+        self.count += 1
+
+        if len(self.window) >= settings.ANOMALY_WINDOW_DAYS:
+            y = self.window.popleft()
+            n = len(self.window)
+            if n == 0:
+                self.mean, self.m2 = 0.0, 0.0
+            else:
+                delta = y - self.mean
+                self.mean -= delta / n
+                self.m2 = max(0.0, self.m2 - delta * (y - self.mean))
+        self.window.append(x)
+        delta = x - self.mean
+        self.mean += delta / len(self.window)
+        self.m2 += delta * (x - self.mean)
+
+        for sketch in self.quartiles:
+            sketch.add(x)
+
+    def score(self, x):
+        """
+            Returns: dict: Each of SCORES for x against the days added so far; NaN where the spread is zero or unknown.
+        """
+        n = len(self.window)
+        std = math.sqrt(self.m2 / (n - 1)) if n > 1 else 0.0
+        ewm_std = math.sqrt(self.ewm_var)
+        q1, median, q3 = (sketch.value() for sketch in self.quartiles)
+        spread = (q3 - q1) / 1.349 if self.count >= 5 else 0.0
+        return {
+            "z": (x - self.mean) / std if std > 0 else math.nan,
+            "ewma_z": (x - self.ewma) / ewm_std if ewm_std > 0 else math.nan,
+            "robust_z": (x - median) / spread if spread > 0 else math.nan,
+        }
+
+    def to_dict(self):
+        return {
+            "count": self.count, "ewma": self.ewma, "ewm_var": self.ewm_var, "window": list(self.window),
+            "mean": self.mean, "m2": self.m2, "quartiles": [sketch.to_dict() for sketch in self.quartiles],
+        }
+
+def _state_path():
+    return os.path.join(settings.STATE_DIR, "anomaly_state.json")
+
+def _params(version=None):
+    # Anything that changes the stored scores or flags; a state built with other values is rebuilt
+    return {
+        "metrics": list(settings.ANOMALY_METRICS), "score": settings.ANOMALY_SCORE,
+        "alpha": settings.ANOMALY_EWMA_ALPHA, "window": settings.ANOMALY_WINDOW_DAYS,
+        "threshold": settings.ANOMALY_Z_THRESHOLD, "min_days": settings.ANOMALY_MIN_DAYS,
+        "formula_version": version or settings.DERIVED_FORMULA_VERSION,
+    }
+
+def load_anomaly_state():
+    """
+        Returns: dict | None: The persisted state, or None when there is none or it was built with other settings.
+    """
+    path = _state_path()
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    return state if state.get("params") == _params() else None
+
+def save_anomaly_state(state):
+    atomic_write_json(state, _state_path())
+
+def _machine_state(state, machine):
+    return state["machines"].setdefault(
+        machine, {"last": None, "stats": {}, "previous": {}, "checkpoints": [], "latest": None}
+    )
+
+def monitored_values(base_df, derived_df):
+    """
+        Key columns and the monitored metrics of rows as written, taken from the base rows or their derived metrics.
+        Args:
+            base_df (pd.DataFrame): Base history rows.
+            derived_df (pd.DataFrame): derive_metrics(base_df), row for row.
+        Returns: pd.DataFrame
+    """
+    values = base_df[KEY_COLUMNS].reset_index(drop=True)
+    for metric in settings.ANOMALY_METRICS:
+        source = base_df if metric in base_df.columns else derived_df
+        values[metric] = source[metric].to_numpy(dtype="float64")
+    return values
+
+def _is_open(state, day):
+    return state.get("open_day") is not None and day.isoformat() >= state["open_day"]
+
+def _checkpoint(m, day):
+    """
+        Keeps a copy of a machine's statistics after `day` once ANOMALY_WINDOW_DAYS have passed since the previous
+        copy, at most ANOMALY_CHECKPOINTS of them, so a correction replays from the last copy before it.
+    """
+    checkpoints = m["checkpoints"]
+    if checkpoints and (day - date.fromisoformat(checkpoints[-1]["date"])).days < settings.ANOMALY_WINDOW_DAYS:
+        return
+    checkpoints.append({"date": day.isoformat(), "stats": dict(m["stats"]), "previous": dict(m["previous"])})
+    del checkpoints[:-settings.ANOMALY_CHECKPOINTS]
+
+def _rewind(m, day):
+    """
+        Restores a machine's statistics to its last checkpoint before `day`, or to empty when there is none.
+        Returns: date | None: The checkpoint's date; the replay reads the history after it.
+    """
+    checkpoints = [c for c in m["checkpoints"] if c["date"] < day.isoformat()]
+    m["checkpoints"] = checkpoints
+    if not checkpoints:
+        m.update(last=None, stats={}, previous={}, latest=None)
+        return None
+    m.update(last=checkpoints[-1]["date"], stats=dict(checkpoints[-1]["stats"]), previous=dict(checkpoints[-1]["previous"]))
+    return date.fromisoformat(checkpoints[-1]["date"])
+
+def _score_row(m, machine, day, row, provisional):
+    """
+        Scores one day of a machine and, for a closed day, folds it into the machine's statistics.
+        Returns: dict: The anomaly row.
+    """
+    last = date.fromisoformat(m["last"]) if m["last"] else None
+    # The statistics the day is scored against: a rewritten latest day is scored without itself
+    basis = m["previous"] if last is not None and day == last else m["stats"]
+    if not provisional:
+        if last is not None and day == last:
+            m["stats"] = dict(m["previous"])
+            m["checkpoints"] = [c for c in m["checkpoints"] if c["date"] != m["last"]]
+        else:
+            m["previous"] = dict(m["stats"])
+            m["last"] = day.isoformat()
+
+    out = {"calculation_date": day, "machine_id": machine, "provisional": provisional}
+    latest = {"date": day.isoformat(), "provisional": provisional, "metrics": {}}
+    for metric in settings.ANOMALY_METRICS:
+        x = float(getattr(row, metric))
+        stats = RunningStats(basis.get(metric))
+        scores = stats.score(x)
+        score = scores[settings.ANOMALY_SCORE]
+        # The open day's sums only grow through the day, so only high values are flagged on it
+        exceeds = score > settings.ANOMALY_Z_THRESHOLD if provisional else abs(score) > settings.ANOMALY_Z_THRESHOLD
+        flag = bool(stats.count >= settings.ANOMALY_MIN_DAYS and not math.isnan(score) and exceeds)
+        for name, value in scores.items():
+            out[f"{metric}_{name}"] = value
+        out[f"{metric}_anomaly"] = flag
+        latest["metrics"][metric] = {
+            "value": round(x, 2), **{name: None if math.isnan(v) else round(v, 3) for name, v in scores.items()},
+            "anomaly": flag,
+        }
+        if not provisional:
+            stats.add(x)
+            m["stats"][metric] = stats.to_dict()
+    if not provisional:
+        _checkpoint(m, day)
+
+    if m["latest"] is None or day.isoformat() >= m["latest"]["date"]:
+        m["latest"] = latest
+    return out
+
+def _replay(state, starts=None):
+    """
+        Replays stored history into the statistics of machines, scoring every replayed day again.
+        Args:
+            state (dict): Anomaly state.
+            starts (dict | None): Machine -> date to replay after (None: from the first day), as set up by
+                _rewind(). None replays every machine from the first day.
+        Returns: list: The anomaly rows.
+    """
+    known = [day for day in (starts or {}).values() if day is not None]
+    first = min(known) + timedelta(days=1) if starts and len(known) == len(starts) else None
+    base_metrics = [metric for metric in settings.ANOMALY_METRICS if metric in METRIC_COLUMNS]
+    derived_metrics = [metric for metric in settings.ANOMALY_METRICS if metric not in METRIC_COLUMNS]
+    values = read_history(first, columns=base_metrics)
+    if derived_metrics and not values.empty:
+        values = values.merge(read_derived(first, columns=derived_metrics), on=KEY_COLUMNS, how="left")
+    rows = []
+    if values.empty:
+        return rows
+    values = values.assign(machine_id=values["machine_id"].astype(str))
+    if starts is not None:
+        values = values[values["machine_id"].isin(list(starts))]
+        after = values["machine_id"].map(lambda machine: starts[machine] or date.min)
+        values = values[values["calculation_date"] > after]
+    values = values.sort_values("calculation_date", kind="stable")
+    for machine, machine_rows in values.groupby("machine_id", sort=True):
+        m = _machine_state(state, machine)
+        for row in machine_rows.itertuples(index=False):
+            rows.append(_score_row(m, machine, row.calculation_date, row, _is_open(state, row.calculation_date)))
+    logging.info(f"Anomaly statistics replayed from {len(values)} history rows from {first or 'the first day'}.")
+    return rows
+
+def _write(rows):
+    if rows:
+        frame = pd.DataFrame(rows)
+        frame["machine_id"] = frame["machine_id"].astype("category")
+        upsert_history(frame, root=settings.ANOMALY_DIR)
+
+def update_anomalies(values, open_day=None):
+    """
+        Scores freshly written rows, folds the closed days into the running statistics and stores their scores.
+        A correction to a day before a machine's latest folded day replays that machine from its last checkpoint
+        before the correction.
+        Args:
+            values (pd.DataFrame): monitored_values() of the rows just written to history.
+            open_day (date | None): Business day still being posted to (the polling daemon's current day); it and
+                later days are scored without being folded in. None: every written day is closed.
+        Returns: dict: The updated state (also persisted).
+    """
+    state = load_anomaly_state()
+    if state is None:
+        return rebuild_anomalies(open_day)
+    if open_day is not None:
+        state["open_day"] = open_day.isoformat()
+    elif state.get("open_day") and (values["calculation_date"] >= date.fromisoformat(state["open_day"])).any():
+        # The open day was written as closed (daemon rollover or a scheduled run)
+        state["open_day"] = None
+
+    rows, starts = [], {}
+    values = values.assign(machine_id=values["machine_id"].astype(str)).sort_values("calculation_date", kind="stable")
+    for machine, machine_rows in values.groupby("machine_id", sort=True):
+        m = _machine_state(state, machine)
+        closed = [day for day in machine_rows["calculation_date"] if not _is_open(state, day)]
+        if m["last"] and closed and min(closed) < date.fromisoformat(m["last"]):
+            starts[machine] = _rewind(m, min(closed))
+            continue
+        for row in machine_rows.itertuples(index=False):
+            rows.append(_score_row(m, machine, row.calculation_date, row, _is_open(state, row.calculation_date)))
+    if starts:
+        rows.extend(_replay(state, starts))
+    _write(rows)
+    save_anomaly_state(state)
+    flagged = [row for row in rows if any(row[f"{metric}_anomaly"] for metric in settings.ANOMALY_METRICS)]
+    if flagged:
+        logging.warning(f"Anomalies flagged on {len(flagged)} of {len(rows)} scored days.")
+    return state
+
+def rebuild_anomalies(open_day=None, version=None):
+    """
+        Rebuilds the statistics and stored scores of every machine from the stored history. Used on first run
+        or after a change to the anomaly settings or the derived formula version.
+        Args:
+            open_day (date | None): As for update_anomalies().
+            version (int | None): Formula set the stored derived metrics were written with.
+                Defaults to settings.DERIVED_FORMULA_VERSION.
+        Returns: dict: The rebuilt state (also persisted).
+    """
+    with output_lock():
+        state = {"params": _params(version), "open_day": open_day.isoformat() if open_day else None, "machines": {}}
+        _write(_replay(state))
+        save_anomaly_state(state)
+    return state
+
+def summary_from_anomalies(state):
+    """
+        Builds the "anomalies" summary entry: each machine's latest scored day, its scores and flags.
+    """
+    return {
+        "anomalies": {
+            machine: m["latest"] for machine, m in sorted(state["machines"].items()) if m["latest"] is not None
+        }
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ActiveQC anomaly detection.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("rebuild", help="Rebuild the running statistics and scores from the stored history.")
+    rebuild.add_argument("--plant", nargs="*", help="Plants from settings.PLANTS_FILE. Defaults to every plant.")
+    args = parser.parse_args(argv)
+    plants = load_plants()
+    unknown = [plant for plant in args.plant or [] if plant not in plants]
+    if unknown:
+        parser.error(f"Unknown plant {', '.join(map(repr, unknown))}; configured plants: {', '.join(plants) or 'none'}")
+    return args
+
+def stored_open_day():
+    """
+        Returns: date | None: The open day recorded by the last write, whatever settings the state was built with.
+    """
+    if not os.path.exists(_state_path()):
+        return None
+    with open(_state_path()) as f:
+        open_day = json.load(f).get("open_day")
+    return date.fromisoformat(open_day) if open_day else None
+
+if __name__ == "__main__":
+    args = parse_args()
+    setup_logger(name="anomalies")
+    plants = load_plants()
+    if not plants:
+        with output_lock():
+            rebuild_anomalies(stored_open_day())
+    else:
+        for plant in args.plant or plants:
+            apply_overrides(plant_overrides(plant, plants[plant]))
+            with output_lock():
+                rebuild_anomalies(stored_open_day())
@@ -0,0 +1,265 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from src.components.ingestion import resolve_date_range
+from src.components.processing import METRIC_COLUMNS, STATUS_COLUMNS, _business_dates
+from src.components.queries import query_for
+from src.components.schema import is_summed
+from src.components.streaming import chunk_rows
+from src.config.settings import settings
+from src.utils.db import get_db_connection
+from src.utils.exception import CustomException
+from src.utils.instrumentation import add_bytes_read, instrumented, stage
+from src.utils.logger import logging
+from src.utils.pi import PI_STATUSES, fetch_pi_values, get_pi_server
+import pandas as pd
+import pyarrow as pa # type: ignore
+import pyarrow.compute as pc # type: ignore
+
+"""
+    Arrow-native ingestion and compute (settings.ARROW_PATH).
+    Extracts are fetched from the DB cursor straight into Arrow record batches; date parsing, deduplication,
+    machine mapping and the per-(date, machine) sums run as Arrow compute kernels, and the metrics grid is an
+    Arrow table. Only its history upsert (upsert_history_table) stays in Arrow: write_outputs converts the grid,
+    which is one row per date and machine, to pandas for the derived metrics, grains, anomalies, rollups and
+    summary. With posting-time columns configured the sums are taken per posting hour first and the hourly sums
+    are handed to the hour and shift grains as a pandas frame, as compute_metrics does.
+    The results match fetch_all_data / compute_metrics. The extract cache stores pandas frames and is not used here,
+    and "stream" mode reads rows in chunk_rows() batches like "rows".
+"""
+
+# table -> (business-date column, date format, dedup key in rows mode, raw code column, machine map setting)
+ARROW_LAYOUT = {
+    "sap": ("BUDAT", "%Y%m%d", "CHARG", "LGORT", "MACHINE_MAP_SAP"),
+    "rewinder": ("BUDAT", "%Y%m%d", "OP_CHARG", "MACHINE_CODE", "MACHINE_MAP_REWINDER"),
+    "qc": ("CDATE", "%d.%m.%Y", None, "LGORT", "MACHINE_MAP_QC"),
+}
+KEYS = ["calculation_date", "machine_id"]
+
+def read_arrow(table, start, end):
+    """
+        Reads one extract into an Arrow table, fetching rows from the cursor in chunk_rows() batches.
+        Args:
+            table (str): One of "sap", "rewinder", "qc".
+            start (date): First business date (inclusive).
+            end (date): Last business date (inclusive).
+        Returns: pa.Table: The extract with the columns of the "rows" or "aggregate" query.
+    """
+    mode = "aggregate" if settings.INGEST_MODE == "aggregate" else "rows"
+    query, params = query_for(table, start, end, mode=mode)
+    batches = []
+    with get_db_connection() as conn:
+        result = conn.execute(query, params)
+        names = list(result.keys())
+        while rows := result.fetchmany(chunk_rows()):
+            batches.append(pa.RecordBatch.from_arrays([pa.array(column) for column in zip(*rows)], names=names))
+    if not batches:
+        return pa.table({name: pa.array([], pa.null()) for name in names})
+    extract = pa.Table.from_batches(batches) if len(batches) == 1 else pa.concat_tables(
+        [pa.Table.from_batches([batch]) for batch in batches], promote_options="permissive"
+    )
+    add_bytes_read(extract.nbytes)
+    return extract
+
+def _map_codes(codes, mapping):
+    """
+        Machine id per row through a lookup over the mapping keys; unmapped codes become null.
+    """
+    indices = pc.index_in(pc.cast(codes, pa.string()), value_set=pa.array(list(mapping), pa.string()))
+    return pa.array(list(mapping.values()), pa.string()).take(indices)
+
+def _quantity(extract, column):
+    # Same extract schema as the pandas path (float32 per-row quantities); sums accumulate in float64
+    if is_summed(extract.column_names):
+        return pc.cast(extract[column], pa.float64())
+    return pc.cast(pc.cast(extract[column], pa.float32()), pa.float64())
+
+def _posting_hours(values):
+    """
+        Hour 0-23 from HHMMSS posting times (rows) or their first two characters (aggregate); -1 where invalid,
+        as schema.posting_hours and processing._grouped_sums give it.
+    """
+    text = pc.utf8_slice_codeunits(pc.cast(values, pa.string()), 0, 2)
+    numeric = pc.fill_null(pc.match_substring_regex(text, r"^[0-9]+$"), False)
+    hours = pc.cast(pc.if_else(numeric, text, "-1"), pa.int16())
+    return pc.cast(pc.if_else(pc.and_(pc.greater_equal(hours, 0), pc.less_equal(hours, 23)), hours, -1), pa.int8())
+
+def prepare_arrow(table, extract):
+    """
+        Adds calculation_date (date32) and machine_id to an extract, deduplicated per date on its batch key in rows mode,
+        and posting_hour when the extract carries posting times. Rows whose code does not map to a machine are dropped.
+    """
+    date_column, date_format, dedup_key, code_column, map_name = ARROW_LAYOUT[table]
+    days = pc.strptime(pc.cast(extract[date_column], pa.string()), format=date_format, unit="s")
+    extract = extract.append_column("calculation_date", pc.cast(days, pa.date32()))
+    if dedup_key in extract.column_names:
+        # First row per (date, key), as DataFrame.drop_duplicates keeps it
+        extract = extract.append_column("_row", pa.array(range(extract.num_rows), pa.int64()))
+        first = extract.group_by(["calculation_date", dedup_key]).aggregate([("_row", "min")])["_row_min"]
+        extract = extract.take(first.take(pc.array_sort_indices(first))).drop_columns(["_row"])
+    if table == "rewinder" and "BATCH" in extract.column_names:
+        extract = extract.append_column("MACHINE_CODE", pc.utf8_slice_codeunits(pc.cast(extract["BATCH"], pa.string()), 4, 6))
+    extract = extract.append_column("machine_id", _map_codes(extract[code_column], getattr(settings, map_name)))
+    for column in ("POSTING_TIME", "POSTING_HOUR"):
+        if column in extract.column_names:
+            extract = extract.append_column("posting_hour", _posting_hours(extract[column]))
+    return extract.filter(pc.is_valid(extract["machine_id"]))
+
+def _sums(extract, values):
+    """
+        Grouped sums of per-row quantities (kg) by (calculation_date, machine_id) and, when the extract has posting
+        hours, by posting_hour as well, in tons.
+        Args:
+            extract (pa.Table): Prepared extract.
+            values (dict): Output column -> float64 array aligned with the extract.
+        Returns: pa.Table: Key columns and one column per value.
+    """
+    keys = KEYS + (["posting_hour"] if "posting_hour" in extract.column_names else [])
+    frame = pa.table({**{key: extract[key] for key in keys}, **values})
+    grouped = frame.group_by(keys).aggregate([(name, "sum") for name in values])
+    return pa.table({
+        **{key: grouped[key] for key in keys},
+        **{name: pc.divide(grouped[f"{name}_sum"], 1000.0) for name in values},
+    })
+
+def _daily(sums):
+    """
+        Folds hourly sums from _sums into daily sums; daily sums are returned as they are.
+    """
+    if "posting_hour" not in sums.column_names:
+        return sums
+    values = [name for name in sums.column_names if name not in KEYS + ["posting_hour"]]
+    grouped = sums.group_by(KEYS).aggregate([(name, "sum") for name in values])
+    return pa.table({**{key: grouped[key] for key in KEYS}, **{name: grouped[f"{name}_sum"] for name in values}})
+
+def _hourly_frame(sums):
+    """
+        The hourly sums of every table as compute_metrics leaves them in data["hourly_sums"]: one pandas frame
+        indexed by (calculation_date, machine_id, posting_hour). Dates x machines x 24 rows at most.
+    """
+    keys = KEYS + ["posting_hour"]
+    return pd.concat([table.to_pandas().set_index(keys) for table in sums], axis=1).fillna(0)
+
+@instrumented("ingest.arrow")
+def _fetch(table, start, end):
+    return prepare_arrow(table, read_arrow(table, start, end))
+
+def fetch_all_arrow(start_date=None, end_date=None):
+    """
+        Arrow counterpart of fetch_all_data: the three extracts as prepared Arrow tables.
+        Returns: dict: sap_table, rewinder_table, qc_table, pi_server and the date range.
+        Raises: CustomException: If any error occurs during data fetching.
+    """
+    try:
+        start, end = resolve_date_range(start_date, end_date)
+        with stage("ingest") as record:
+            with ThreadPoolExecutor(max_workers=settings.INGEST_MAX_WORKERS, thread_name_prefix="ingest") as pool:
+                futures = {f"{table}_table": pool.submit(_fetch, table, start, end) for table in ARROW_LAYOUT}
+                tables = {name: future.result() for name, future in futures.items()}
+            record.rows_out = sum(t.num_rows for t in tables.values())
+        logging.info(
+            f"Fetched {tables['sap_table'].num_rows} SAP, {tables['rewinder_table'].num_rows} rewinder "
+            f"and {tables['qc_table'].num_rows} QC rows as Arrow for {start} to {end}."
+        )
+        return {
+            **tables,
+            "pi_server": get_pi_server(),
+            "date": datetime.combine(end, datetime.min.time()),
+            "start_date": start,
+            "end_date": end,
+        }
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def _index_type(count):
+    # The narrowest code width pandas gives a categorical with this many categories
+    for index_type in (pa.int8(), pa.int16(), pa.int32()):
+        if count < 2 ** (index_type.bit_width - 1) - 1:
+            return index_type
+    return pa.int64()
+
+def _categorical(values, categories):
+    """
+        Strings as a dictionary column over fixed categories, laid out as the pandas categorical would store them.
+    """
+    categories = pa.array(categories, pa.string())
+    indices = pc.cast(pc.index_in(values, value_set=categories), _index_type(len(categories)))
+    return pa.DictionaryArray.from_arrays(indices, categories)
+
+def compute_metrics_arrow(data):
+    """
+        Arrow counterpart of compute_metrics. With posting times in the extracts the hourly sums are left in
+        data["hourly_sums"] for the hour and shift grains, as a pandas frame like compute_metrics leaves.
+        Args: data (dict): As returned by fetch_all_arrow.
+        Returns:
+            pa.Table: The computed metrics for each date and machine, in the date x machine grid order.
+            dict: A summary dictionary with last calculated date and each machine's daily broke.
+    """
+    try:
+        with stage("compute") as record:
+            sap, rewinder, qc = data["sap_table"], data["rewinder_table"], data["qc_table"]
+            record.rows_in = sap.num_rows + rewinder.num_rows + qc.num_rows
+            dates = _business_dates(data)
+            machines = list(settings.PI_TAGS.keys())
+            grid = pa.table({
+                "calculation_date": pa.array([day for day in dates for _ in machines], pa.date32()),
+                "machine_id": pa.array(machines * len(dates), pa.string()),
+                "_position": pa.array(range(len(dates) * len(machines)), pa.int64()),
+            })
+
+            sap_hourly = _sums(sap, {"SAP_Production": _quantity(sap, "MENGE")})
+            rewinder_hourly = _sums(rewinder, {
+                "Rewinder_Input": _quantity(rewinder, "TOT_MENGE"),
+                "Rewinder_Output": _quantity(rewinder, "CH_REEL_WT"),
+            })
+            quantity = _quantity(qc, "FROM_QTY")
+            qc_hourly = _sums(qc, {
+                "Qc_Rejection": pc.if_else(pc.equal(pc.cast(qc["REA_MOV"], pa.string()), "Repulp"), quantity, 0.0),
+                "Handling_Loss": pc.if_else(pc.equal(pc.cast(qc["CODE"], pa.string()), "Handling Loss"), quantity, 0.0),
+            })
+            hourly = (sap_hourly, rewinder_hourly, qc_hourly)
+            if all("posting_hour" in sums.column_names for sums in hourly):
+                data["hourly_sums"] = _hourly_frame(hourly)
+            sap_sums, rewinder_sums, qc_sums = (_daily(sums) for sums in hourly)
+            sap_sums = sap_sums.set_column(2, "SAP_Production", pc.round(sap_sums["SAP_Production"], 2))
+
+            pi = data.get("pi_values")
+            if pi is None:
+                pi = fetch_pi_values(data["pi_server"], dates)
+            # The PI grid is dates x machines, small next to the extracts
+            pi = pi.reset_index()
+            pi_table = pa.table({
+                "calculation_date": pa.array(pi["calculation_date"], pa.date32()),
+                "machine_id": pa.array(pi["machine_id"].astype(str), pa.string()),
+                **{c: pa.array(pi[c], pa.float64()) for c in ("QCS_Production", "Reel_Production")},
+                **{c: pa.array(pi[c].astype(str), pa.string()) for c in STATUS_COLUMNS},
+            })
+
+            joined = grid
+            for sums in (sap_sums, pi_table, rewinder_sums, qc_sums):
+                joined = joined.join(sums, keys=KEYS, join_type="left outer")
+            joined = joined.take(pc.sort_indices(joined["_position"]))
+
+            df = pa.table({
+                "calculation_date": joined["calculation_date"],
+                "machine_id": _categorical(joined["machine_id"].combine_chunks(), sorted(machines)),
+                **{c: pc.fill_null(joined[c], 0.0) for c in METRIC_COLUMNS},
+                **{c: _categorical(pc.fill_null(joined[c], "missing").combine_chunks(), PI_STATUSES) for c in STATUS_COLUMNS},
+            })
+            record.rows_out = df.num_rows
+
+            last_day = df.filter(pc.equal(df["calculation_date"], pa.scalar(dates[-1], pa.date32())))
+            broke = pc.round(last_day[settings.BROKE_METRIC], 2).to_pylist()
+            summary = {
+                "last_calculated_date": str(dates[-1]),
+                "machines": {
+                    str(m): {"daily_broke": float(b)} for m, b in zip(last_day["machine_id"].to_pylist(), broke)
+                },
+            }
+            if "source_status" in data:
+                summary["source_status"] = data["source_status"]
+
+            return df, summary
+
+    except Exception as e:
+        raise CustomException(e, sys)
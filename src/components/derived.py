@@ -0,0 +1,131 @@
+import argparse
+import os
+import time
+from datetime import date
+import numpy as np
+import pandas as pd
+from src.config.settings import settings
+from src.config.plants import apply_overrides, load_plants, plant_overrides
+from src.utils.file_lock import output_lock
+from src.utils.history_store import (
+    KEY_COLUMNS, atomic_write_feather, list_partitions, partition_path, read_history, upsert_history,
+)
+from src.utils.logger import logging, setup_logger
+
+"""
+    Derived metrics over the stored base history.
+    The history (settings.HISTORY_DIR) holds only the base per-day, per-machine aggregates read from SAP and PI.
+    Losses and shrinkage are derived from them by a versioned formula set and stored separately under
+    settings.DERIVED_DIR, so a formula change is applied by re-deriving from local history, with no re-fetch.
+
+    Usage:
+        python -m src.components.derived recompute
+        python -m src.components.derived recompute --version 1 --plant 5000
+"""
+
+def _percent(numerator, denominator):
+    return np.divide(numerator * 100, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+# Formula sets by version. Formulas run in order and may use base columns and earlier derived columns;
+# each result is rounded to 2 decimals before later formulas use it. Never edit a released version: add one.
+FORMULAS = {
+    1: [
+        ("Actual_QCS_Production", lambda m: m["QCS_Production"] - m["Reel_Production"]),
+        ("Jumbo_Cutoff", lambda m: m["Actual_QCS_Production"] - m["SAP_Production"]),
+        ("Rewinder_Loss", lambda m: m["Rewinder_Input"] - m["Rewinder_Output"]),
+        ("Total_Loss", lambda m: m["Rewinder_Loss"] + m["Qc_Rejection"] + m["Handling_Loss"]),
+        ("Shrinkage_Percent", lambda m: _percent(m["Total_Loss"], m["Rewinder_Input"])),
+        ("Actual_Loss", lambda m: m["Jumbo_Cutoff"] + m["Total_Loss"]),
+        ("Actual_Shrinkage_Percent", lambda m: _percent(m["Actual_Loss"], m["Rewinder_Input"])),
+    ],
+}
+
+def derive_metrics(base_df, version=None):
+    """
+        Applies a formula set to base history rows with whole-column array math.
+        Args:
+            base_df (pd.DataFrame): Base history rows (key columns plus the base metrics).
+            version (int | None): Formula set. Defaults to settings.DERIVED_FORMULA_VERSION.
+        Returns: pd.DataFrame: Key columns, every derived column and formula_version.
+        Raises: ValueError: If the version is unknown.
+    """
+    version = version or settings.DERIVED_FORMULA_VERSION
+    if version not in FORMULAS:
+        raise ValueError(f"Unknown derived formula version {version}; known: {sorted(FORMULAS)}")
+    numeric = base_df.drop(columns=KEY_COLUMNS).select_dtypes("number")
+    columns = {c: numeric[c].to_numpy(dtype="float64") for c in numeric.columns}
+    derived = base_df[KEY_COLUMNS].copy()
+    for name, formula in FORMULAS[version]:
+        columns[name] = np.round(formula(columns), 2)
+        derived[name] = columns[name]
+    derived["formula_version"] = np.uint8(version)
+    return derived
+
+def upsert_derived(base_df, version=None):
+    """
+        Derives and stores the metrics for freshly written base rows.
+        Returns: pd.DataFrame: The derived rows, as from derive_metrics.
+    """
+    derived = derive_metrics(base_df, version)
+    upsert_history(derived, root=settings.DERIVED_DIR)
+    return derived
+
+def read_derived(start_date=None, end_date=None, columns=None):
+    """
+        Reads derived metric rows; see read_history for the arguments.
+    """
+    return read_history(start_date, end_date, columns, root=settings.DERIVED_DIR)
+
+def recompute_derived(version=None):
+    """
+        Re-derives every derived column across the full history from the stored base aggregates, one month at a time.
+        Derived partitions without a matching base partition are removed, the hour, shift and month grains
+        are re-derived with the same formula set and the anomaly statistics are rebuilt on the new values.
+        Args: version (int | None): Formula set. Defaults to settings.DERIVED_FORMULA_VERSION.
+        Returns: int: Number of rows written.
+    """
+    version = version or settings.DERIVED_FORMULA_VERSION
+    began = time.perf_counter()
+    with output_lock():
+        months = list_partitions(settings.HISTORY_DIR)
+        rows = 0
+        for month in months:
+            first = date.fromisoformat(f"{month}-01")
+            base = read_history(first, (pd.Timestamp(first) + pd.offsets.MonthEnd(0)).date())
+            atomic_write_feather(derive_metrics(base, version), partition_path(month, settings.DERIVED_DIR))
+            rows += len(base)
+        for month in set(list_partitions(settings.DERIVED_DIR)) - set(months):
+            os.remove(partition_path(month, settings.DERIVED_DIR))
+        from src.components.anomalies import rebuild_anomalies, stored_open_day
+        from src.components.grains import rederive_grains
+        rederive_grains(version)
+        rebuild_anomalies(stored_open_day(), version)
+        logging.info(
+            f"Derived metrics v{version} recomputed for {rows} rows in {len(months)} months "
+            f"in {time.perf_counter() - began:.2f}s."
+        )
+    return rows
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ActiveQC derived metrics.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    recompute = commands.add_parser("recompute", help="Re-derive every derived column from the stored history.")
+    recompute.add_argument("--version", type=int, choices=sorted(FORMULAS), help="Formula set. Defaults to DERIVED_FORMULA_VERSION.")
+    recompute.add_argument("--plant", nargs="*", help="Plants from settings.PLANTS_FILE. Defaults to every plant.")
+    args = parser.parse_args(argv)
+    plants = load_plants()
+    unknown = [plant for plant in args.plant or [] if plant not in plants]
+    if unknown:
+        parser.error(f"Unknown plant {', '.join(map(repr, unknown))}; configured plants: {', '.join(plants) or 'none'}")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    setup_logger(name="derived")
+    plants = load_plants()
+    if not plants:
+        recompute_derived(args.version)
+    else:
+        for plant in args.plant or plants:
+            apply_overrides(plant_overrides(plant, plants[plant]))
+            recompute_derived(args.version)
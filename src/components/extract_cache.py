@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import time
+from datetime import date, timedelta
+import pandas as pd
+from src.components.queries import DATE_COLUMNS, fingerprint_query_for
+from src.config.settings import settings
+from src.utils.db import get_db_connection
+from src.utils.history_store import atomic_write_feather, atomic_write_json
+from src.utils.logger import logging, setup_logger
+
+"""
+    On-disk cache of raw SAP extracts.
+    Each table's filtered extract is stored per business date as EXTRACT_CACHE_DIR/<mode>/<werks>/<table>/<date>.feather
+    with a <date>.json sidecar. A date older than settings.EXTRACT_CACHE_SETTLE_DAYS is sealed when it is cached and
+    is then served without touching SQL Server. Open dates are revalidated with one grouped (row count, max
+    watermark) query and re-read only when that fingerprint changed. The size and age limits are applied once per
+    fetch, after every table's extract is in (ingestion.fetch_all_data); an entry that disappears in between is
+    simply re-read.
+
+    Usage:
+        python -m src.components.extract_cache invalidate --tables sap qc --start 2025-01-01 --end 2025-01-31
+        python -m src.components.extract_cache evict
+"""
+
+DATE_FORMATS = {"sap": "%Y%m%d", "rewinder": "%Y%m%d", "qc": "%d.%m.%Y"}
+
+def _entry_dir(table, mode):
+    return os.path.join(settings.EXTRACT_CACHE_DIR, mode, str(settings.WERKS), table)
+
+def _entry_paths(table, day, mode):
+    base = os.path.join(_entry_dir(table, mode), day.isoformat())
+    return base + ".feather", base + ".json"
+
+def _load_meta(table, day, mode):
+    data_path, meta_path = _entry_paths(table, day, mode)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _load_entry(table, day, mode):
+    """
+        Returns a cached extract, or None when it was evicted or invalidated since its sidecar was read.
+    """
+    data_path, meta_path = _entry_paths(table, day, mode)
+    try:
+        df = pd.read_feather(data_path)
+        # Last access time drives least-recently-used eviction
+        os.utime(meta_path)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Cached {table} extract for {day} is gone or unreadable, re-reading it: {e}")
+        return None
+    return df
+
+def _store_entry(table, day, mode, df, sealed, fingerprint):
+    data_path, meta_path = _entry_paths(table, day, mode)
+    atomic_write_feather(df, data_path)
+    atomic_write_json({"sealed": sealed, "fingerprint": fingerprint, "cached_at": time.time()}, meta_path)
+
+def _fingerprints(table, start, end):
+    """
+        Per-date [row count, max watermark] of the source for open dates, or None when it cannot be queried.
+    """
+    try:
+        query, params = fingerprint_query_for(table, start, end)
+        with get_db_connection() as conn:
+            rows = pd.read_sql(query, conn, params=params)
+    except Exception as e:
+        logging.warning(f"Could not revalidate cached {table} extracts, re-reading open dates: {e}")
+        return None
+    days = pd.to_datetime(rows["BUSINESS_DATE"].astype(str), format=DATE_FORMATS[table]).dt.date
+    return {
+        day.isoformat(): [int(count), None if pd.isna(mark) else str(mark)]
+        for day, count, mark in zip(days, rows["ROW_COUNT"], rows["WATERMARK"])
+    }
+
+def _split_by_date(table, df):
+    days = pd.to_datetime(df[DATE_COLUMNS[table]].astype(str), format=DATE_FORMATS[table]).dt.date
+    return {day: part.reset_index(drop=True) for day, part in df.groupby(days, sort=False)}
+
+def _contiguous_runs(days):
+    runs = []
+    for day in sorted(days):
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+def cached_extract(table, start, end, mode, read):
+    """
+        Returns a table's extract for a date range, serving cached dates from disk and reading the rest through `read`.
+        Args:
+            table (str): One of "sap", "rewinder", "qc".
+            start (date): First business date (inclusive).
+            end (date): Last business date (inclusive).
+            mode (str): Ingest mode the extract was read in; part of the cache key.
+            read (callable): read(start, end) -> pd.DataFrame reading a contiguous range from SQL Server.
+        Returns: pd.DataFrame: The extract for every date in the range, in date order.
+    """
+    settled = date.today() - timedelta(days=settings.EXTRACT_CACHE_SETTLE_DAYS)
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    metas = {day: _load_meta(table, day, mode) for day in days}
+
+    open_days = [day for day in days if day > settled]
+    fingerprints = _fingerprints(table, open_days[0], open_days[-1]) if open_days else {}
+
+    def _fresh(day):
+        meta = metas[day]
+        if meta is None:
+            return False
+        if meta["sealed"]:
+            return True
+        # Cached while open: a closed date must be re-read once more before it is sealed
+        return day > settled and fingerprints is not None and meta["fingerprint"] == fingerprints.get(day.isoformat(), [0, None])
+
+    frames = {day: _load_entry(table, day, mode) for day in days if _fresh(day)}
+    frames = {day: df for day, df in frames.items() if df is not None}
+    missing = [day for day in days if day not in frames]
+
+    for run_start, run_end in _contiguous_runs(missing):
+        df = read(run_start, run_end)
+        parts = _split_by_date(table, df)
+        for offset in range((run_end - run_start).days + 1):
+            day = run_start + timedelta(days=offset)
+            part = parts.get(day, df.iloc[0:0])
+            fingerprint = (fingerprints or {}).get(day.isoformat(), [0, None]) if day > settled else None
+            _store_entry(table, day, mode, part, day <= settled, fingerprint)
+            frames[day] = part
+
+    logging.info(f"Extract cache {table}: {len(days) - len(missing)} of {len(days)} dates served from disk.")
+    return pd.concat([frames[day] for day in days], ignore_index=True)
+
+def _entries(root=None):
+    """
+        Yields (mode, werks, table, day, data_path, meta_path) for every cached entry.
+    """
+    root = root or settings.EXTRACT_CACHE_DIR
+    if not os.path.isdir(root):
+        return
+    for mode in os.listdir(root):
+        for werks in os.listdir(os.path.join(root, mode)):
+            for table in os.listdir(os.path.join(root, mode, werks)):
+                directory = os.path.join(root, mode, werks, table)
+                for name in os.listdir(directory):
+                    if name.endswith(".feather"):
+                        base = os.path.join(directory, name[:-len(".feather")])
+                        yield mode, werks, table, date.fromisoformat(name[:-len(".feather")]), base + ".feather", base + ".json"
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def evict_extracts(max_mb=None, max_age_days=None):
+    """
+        Removes entries unused for longer than max_age_days, then least recently used entries until the cache fits max_mb.
+        Args:
+            max_mb (int | None): Size cap. Defaults to settings.EXTRACT_CACHE_MAX_MB.
+            max_age_days (int | None): Age cap on last use. Defaults to settings.EXTRACT_CACHE_MAX_AGE_DAYS.
+        Returns: int: Number of entries removed.
+    """
+    max_bytes = (max_mb if max_mb is not None else settings.EXTRACT_CACHE_MAX_MB) * 1024 * 1024
+    max_age = (max_age_days if max_age_days is not None else settings.EXTRACT_CACHE_MAX_AGE_DAYS) * 86400
+    now = time.time()
+    entries = []
+    for *_, data_path, meta_path in _entries():
+        try:
+            used = os.path.getmtime(meta_path) if os.path.exists(meta_path) else os.path.getmtime(data_path)
+            entries.append((used, os.path.getsize(data_path), data_path, meta_path))
+        except FileNotFoundError:
+            continue
+
+    entries.sort()
+    total = sum(size for _, size, _, _ in entries)
+    removed = 0
+    for used, size, data_path, meta_path in entries:
+        if now - used <= max_age and total <= max_bytes:
+            break
+        _remove(data_path, meta_path)
+        total -= size
+        removed += 1
+    if removed:
+        logging.info(f"Evicted {removed} cached extracts; {total / 1024 / 1024:.1f} MB remain.")
+    return removed
+
+def invalidate_extracts(tables=None, start=None, end=None, werks=None):
+    """
+        Removes cached extracts so they are re-read from SQL Server on next use.
+        Args:
+            tables (iterable | None): Tables to drop. None drops every table.
+            start (date | None): First business date to drop (inclusive). None means unbounded.
+            end (date | None): Last business date to drop (inclusive). None means unbounded.
+            werks (int | str | None): Plant to drop. None drops every plant.
+        Returns: int: Number of entries removed.
+    """
+    removed = 0
+    for _, entry_werks, table, day, data_path, meta_path in list(_entries()):
+        if tables and table not in tables:
+            continue
+        if werks is not None and entry_werks != str(werks):
+            continue
+        if (start and day < start) or (end and day > end):
+            continue
+        _remove(data_path, meta_path)
+        removed += 1
+    logging.info(f"Invalidated {removed} cached extracts.")
+    return removed
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ActiveQC raw extract cache maintenance.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    invalidate = commands.add_parser("invalidate", help="Drop cached extracts so they are re-read.")
+    invalidate.add_argument("--tables", nargs="+", choices=sorted(DATE_FORMATS), help="Defaults to every table.")
+    invalidate.add_argument("--start", type=date.fromisoformat, help="First business date (YYYY-MM-DD).")
+    invalidate.add_argument("--end", type=date.fromisoformat, help="Last business date (YYYY-MM-DD).")
+    invalidate.add_argument("--werks", help="SAP plant. Defaults to every plant.")
+    evict = commands.add_parser("evict", help="Apply the size and age limits now.")
+    evict.add_argument("--max-mb", type=int)
+    evict.add_argument("--max-age-days", type=int)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    setup_logger(name="extract_cache")
+    if args.command == "invalidate":
+        count = invalidate_extracts(args.tables, args.start, args.end, args.werks)
+    else:
+        count = evict_extracts(args.max_mb, args.max_age_days)
+    print(f"{count} cached extracts removed.")
@@ -1,26 +1,79 @@
-import pandas as pd
 import json
 import os
+import pandas as pd
 from src.config.settings import settings
+from src.components.anomalies import monitored_values, summary_from_anomalies, update_anomalies
+from src.components.derived import upsert_derived
+from src.components.grains import write_grains
+from src.components.pi_repair import sync_repair_queue
+from src.components.rollups import load_rollups, update_rollups, summary_from_rollups
+from src.utils.file_lock import output_lock
+from src.utils.history_store import upsert_history, upsert_history_table, atomic_write_json
+from src.utils.instrumentation import stage
 from src.utils.logger import logging
 
-def write_outputs(df, summary):
+def write_outputs(df, summary, hourly=None, open_day=None):
     """
-        Write the DataFrame and summary to disk.
+        Upsert the DataFrame into the partitioned history, derive its loss metrics, update the hour, shift and month
+        grains, queue its unread PI cells for repair, score it for anomalies, update the rollups and write the
+        summary to disk.
+        Rows are keyed on (calculation_date, machine_id), so a recomputed day replaces its old values and
+        the rollups receive only the difference. Everything is written under output_lock, so the scheduler, the
+        polling daemon and the PI repair never interleave their writes.
         Args:
-            df (pd.DataFrame): The DataFrame to write.
-            summary (dict): The summary dictionary to write.
+            df (pd.DataFrame | pa.Table): The metrics to write. Of an Arrow table (settings.ARROW_PATH) only the
+                history upsert is Arrow-native; it and the replaced rows are converted to pandas for the other outputs.
+            summary (dict): The summary dictionary from compute_metrics; its totals are replaced by the rollups.
+            hourly (pd.DataFrame | None): data["hourly_sums"] from compute_metrics, for the hour and shift grains.
+            open_day (date | None): Business day still being posted to (the polling daemon's); it is scored for
+                anomalies without being folded into their statistics, and the month grain takes only its difference.
+        Returns: dict: The summary as written.
         Raises: Exception: If writing to disk fails.
     """
-    os.makedirs(os.path.dirname(settings.HISTORY_FILE), exist_ok=True)
-
-    if os.path.exists(settings.HISTORY_FILE):
-        old_df = pd.read_feather(settings.HISTORY_FILE)
-        df = pd.concat([old_df, df], ignore_index=True).drop_duplicates()
+    with output_lock(), stage("write") as record:
+        record.rows_in = len(df)
+        rollups = load_rollups()
+        if isinstance(df, pd.DataFrame):
+            previous = upsert_history(df)
+        else:
+            previous = upsert_history_table(df).to_pandas()
+            df = df.to_pandas()
+        derived = upsert_derived(df)
+        write_grains(df, hourly, previous if open_day is not None else None)
+        sync_repair_queue(df)
+        anomalies = update_anomalies(monitored_values(df, derived), open_day)
+        rollups = update_rollups(df, previous, rollups)
 
-    df.to_feather(settings.HISTORY_FILE)
+        summary = {**summary, **summary_from_rollups(rollups), **summary_from_anomalies(anomalies)}
+        atomic_write_json(summary, settings.SUMMARY_FILE)
 
-    with open(settings.SUMMARY_FILE, "w") as f:
-        json.dump(summary, f, indent=4)
+    logging.info("Data upserted into history partitions, derived metrics, anomaly scores and rollups updated and JSON summary written.")
+    return summary
 
-    logging.info("Data written to feather and JSON summary.")
+def write_plant_summary(plant_summaries, path=None):
+    """
+        Merges per-plant summaries into the cross-plant dashboard summary.
+        Plants missing from plant_summaries (e.g. because their run failed) keep their last written entry.
+        Args:
+            plant_summaries (dict): Plant -> summary as returned by write_outputs.
+            path (str | None): Destination. Defaults to settings.SUMMARY_FILE.
+        Returns: dict: The merged summary as written.
+    """
+    path = path or settings.SUMMARY_FILE
+    previous = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                previous = json.load(f).get("plants", {})
+        except (OSError, ValueError) as e:
+            logging.warning(f"Previous summary {path} could not be read, rebuilding it: {e}")
+    plants = {**previous, **plant_summaries}
+    dates = [s["last_calculated_date"] for s in plants.values() if s.get("last_calculated_date")]
+    merged = {
+        "last_calculated_date": max(dates) if dates else None,
+        "metric": settings.BROKE_METRIC,
+        "plants": dict(sorted(plants.items())),
+    }
+    atomic_write_json(merged, path)
+    logging.info(f"Cross-plant summary written for {len(plants)} plants.")
+    return merged
@@ -0,0 +1,208 @@
+import os
+from datetime import date
+import numpy as np
+import pandas as pd
+from src.components.derived import derive_metrics
+from src.components.processing import METRIC_COLUMNS
+from src.components.queries import posting_time_column
+from src.config.settings import settings
+from src.utils.file_lock import output_lock
+from src.utils.history_store import (
+    KEY_COLUMNS, atomic_write_feather, list_partitions, partition_path, read_history, upsert_history,
+)
+from src.utils.logger import logging
+
+"""
+    Metrics at several time grains: hour, shift, day and month.
+    The day grain is the history itself (settings.HISTORY_DIR). The hour and shift grains are built from the
+    hourly sums compute_metrics leaves in data["hourly_sums"], so every grain comes out of the same single pass
+    over the extracts; they are written only when settings.POSTING_TIME_COLUMNS are configured. The month grain
+    is summed from the daily history. Every grain other than day has its own month partitions under
+    settings.GRAIN_DIR/<grain>, derived columns included, so the dashboard switches grain by reading another
+    directory.
+    PI tonnage is a daily totaliser: the hour and shift grains carry the SAP, rewinder and QC metrics and the
+    shrinkage that follows from them, not the PI-based losses.
+"""
+
+GRAINS = ("hour", "shift", "day", "month")
+# Sub-day grains: grain -> bucket column added to the key
+BUCKET_COLUMNS = {"hour": "hour", "shift": "shift"}
+SUB_DAY_METRICS = ["SAP_Production", "Rewinder_Input", "Rewinder_Output", "Qc_Rejection", "Handling_Loss"]
+# Derived columns that need no PI value
+SUB_DAY_DERIVED = ["Rewinder_Loss", "Total_Loss", "Shrinkage_Percent"]
+
+def grain_root(grain, history_dir=None, grain_dir=None):
+    """
+        Partition directory of a grain, under settings.HISTORY_DIR / settings.GRAIN_DIR unless given.
+    """
+    if grain == "day":
+        return history_dir or settings.HISTORY_DIR
+    return os.path.join(grain_dir or settings.GRAIN_DIR, grain)
+
+def grain_keys(grain):
+    return KEY_COLUMNS + ([BUCKET_COLUMNS[grain]] if grain in BUCKET_COLUMNS else [])
+
+def available_grains():
+    """
+        The grains the pipeline writes: hour and shift only with posting-time columns configured.
+    """
+    return tuple(grain for grain in GRAINS if grain not in BUCKET_COLUMNS or posting_time_column("sap"))
+
+def grain_columns(grain):
+    """
+        Columns of a grain as the dashboard reads them.
+        Returns: tuple: (additive metrics, other columns: the bucket and percentages, which do not sum).
+    """
+    if grain in BUCKET_COLUMNS:
+        return SUB_DAY_METRICS + ["Rewinder_Loss", "Total_Loss"], [BUCKET_COLUMNS[grain], "Shrinkage_Percent"]
+    if grain == "month":
+        return list(METRIC_COLUMNS), ["Shrinkage_Percent", "Actual_Shrinkage_Percent"]
+    return list(METRIC_COLUMNS), []
+
+def shift_calendar(spec=None):
+    """
+        Parses a shift calendar such as "A=6,B=14,C=22".
+        Args: spec (str | None): Defaults to settings.SHIFT_CALENDAR.
+        Returns: tuple: (shift names in calendar order, np.ndarray of the shift name for each hour 0-23).
+        Raises: ValueError: If the calendar is malformed or its start hours are not strictly increasing within 0-23.
+    """
+    spec = spec or settings.SHIFT_CALENDAR
+    try:
+        shifts = [(name.strip(), int(start)) for name, start in (item.split("=") for item in spec.split(","))]
+    except ValueError:
+        raise ValueError(f"Malformed shift calendar {spec!r}; expected name=start_hour,...") from None
+    starts = [start for _, start in shifts]
+    if starts != sorted(set(starts)) or starts[0] < 0 or starts[-1] > 23:
+        raise ValueError(f"Shift start hours in {spec!r} must be strictly increasing within 0-23")
+    # Hours before the first start belong to the last shift
+    by_hour = np.full(24, shifts[-1][0], dtype=object)
+    for name, start in shifts:
+        by_hour[start:] = name
+    return [name for name, _ in shifts], by_hour
+
+def _bucket_frame(hourly, grain, dates, machines):
+    """
+        Sums hourly sums into a grain's buckets over the full date x machine x bucket grid (empty buckets are 0).
+    """
+    bucket = BUCKET_COLUMNS[grain]
+    rows = hourly.reset_index()
+    rows = rows[rows["posting_hour"] >= 0]
+    hours = rows["posting_hour"].astype("int64").to_numpy()
+    if grain == "hour":
+        buckets = list(range(24))
+        rows = rows.assign(hour=hours)
+    else:
+        buckets, by_hour = shift_calendar()
+        rows = rows.assign(shift=by_hour[hours])
+    rows = rows.assign(machine_id=rows["machine_id"].astype(str))
+    sums = rows.groupby(["calculation_date", "machine_id", bucket])[SUB_DAY_METRICS].sum()
+    grid = pd.MultiIndex.from_product([dates, machines, buckets], names=grain_keys(grain))
+    frame = sums.reindex(grid, fill_value=0.0).reset_index()
+    frame["SAP_Production"] = frame["SAP_Production"].round(2)
+    frame["machine_id"] = frame["machine_id"].astype("category")
+    if grain == "shift":
+        frame["shift"] = pd.Categorical(frame["shift"], categories=buckets)
+    return frame
+
+def _with_sub_day_derived(frame, version=None):
+    # The PI columns are unknown below a day; the formulas that need them come out NaN and are not kept
+    derived = derive_metrics(frame.assign(QCS_Production=np.nan, Reel_Production=np.nan), version)
+    for column in SUB_DAY_DERIVED + ["formula_version"]:
+        frame[column] = derived[column].to_numpy()
+    return frame
+
+def _write_month(month, sums, version=None):
+    # sums: per-machine METRIC_COLUMNS totals of the month, machine_id as a column
+    sums.insert(0, "calculation_date", date.fromisoformat(f"{month}-01"))
+    derived = derive_metrics(sums, version)
+    frame = pd.concat([sums, derived.drop(columns=KEY_COLUMNS)], axis=1)
+    frame["machine_id"] = frame["machine_id"].astype(str).astype("category")
+    atomic_write_feather(frame, partition_path(month, grain_root("month")))
+
+def _month_bounds(month):
+    first = date.fromisoformat(f"{month}-01")
+    return first, (pd.Timestamp(first) + pd.offsets.MonthEnd(0)).date()
+
+def refresh_months(months, version=None):
+    """
+        Rebuilds month-grain partitions from the daily history: per-machine totals and their derived metrics.
+        Args:
+            months (iterable): Month keys (YYYY-MM).
+            version (int | None): Formula set. Defaults to settings.DERIVED_FORMULA_VERSION.
+    """
+    for month in months:
+        base = read_history(*_month_bounds(month), columns=METRIC_COLUMNS)
+        if base.empty:
+            continue
+        _write_month(month, base.groupby("machine_id", observed=True)[METRIC_COLUMNS].sum().reset_index(), version)
+
+def _monthly_sums(rows):
+    rows = rows.assign(
+        month=pd.to_datetime(rows["calculation_date"]).dt.strftime("%Y-%m"), machine_id=rows["machine_id"].astype(str)
+    )
+    return rows.groupby(["month", "machine_id"])[METRIC_COLUMNS].sum()
+
+def update_months(df, previous, version=None):
+    """
+        Adds the difference between freshly written daily rows and the rows they replaced to their month-grain rows,
+        so only the month partitions are read, not the month's daily history. Months without a partition yet are
+        rebuilt with refresh_months.
+        Args:
+            df (pd.DataFrame): Daily rows as just written to the history.
+            previous (pd.DataFrame): The history rows they replaced, as returned by upsert_history.
+            version (int | None): Formula set. Defaults to settings.DERIVED_FORMULA_VERSION.
+    """
+    delta = _monthly_sums(df)
+    if not previous.empty:
+        delta = delta.sub(_monthly_sums(previous), fill_value=0)
+    for month, change in delta.groupby(level="month"):
+        if not os.path.exists(partition_path(month, grain_root("month"))):
+            refresh_months([month], version)
+            continue
+        stored = read_history(*_month_bounds(month), root=grain_root("month"))
+        sums = stored.assign(machine_id=stored["machine_id"].astype(str)).set_index("machine_id")[METRIC_COLUMNS]
+        sums = sums.add(change.droplevel("month"), fill_value=0)
+        _write_month(month, sums.rename_axis("machine_id").reset_index(), version)
+
+def write_grains(df, hourly=None, previous=None):
+    """
+        Brings every grain up to date with freshly written daily rows.
+        Args:
+            df (pd.DataFrame): Daily rows as just written to the history.
+            hourly (pd.DataFrame | None): data["hourly_sums"] from compute_metrics. None leaves the hour and
+                shift grains as they are (e.g. PI repairs, which change no sub-day metric).
+            previous (pd.DataFrame | None): The history rows df replaced. Given, the month grain is updated by the
+                difference (update_months) instead of re-summed from the history, as the polling daemon does for
+                its open day; the day's close re-sums it.
+    """
+    if df.empty:
+        return
+    if hourly is not None:
+        dates = sorted(set(df["calculation_date"]))
+        machines = list(dict.fromkeys(df["machine_id"].astype(str)))
+        for grain in BUCKET_COLUMNS:
+            frame = _with_sub_day_derived(_bucket_frame(hourly, grain, dates, machines))
+            upsert_history(frame, root=grain_root(grain), keys=grain_keys(grain))
+    if previous is not None:
+        update_months(df, previous)
+    else:
+        refresh_months(sorted(set(pd.to_datetime(df["calculation_date"]).dt.strftime("%Y-%m"))))
+
+def rederive_grains(version=None):
+    """
+        Re-derives the derived columns of every stored grain, e.g. after a formula version change.
+        Args: version (int | None): Formula set. Defaults to settings.DERIVED_FORMULA_VERSION.
+    """
+    with output_lock():
+        for grain in BUCKET_COLUMNS:
+            root = grain_root(grain)
+            for month in list_partitions(root):
+                frame = read_history(*_month_bounds(month), root=root)
+                frame = frame.drop(columns=SUB_DAY_DERIVED + ["formula_version"], errors="ignore")
+                frame = _with_sub_day_derived(frame, version)
+                atomic_write_feather(frame, partition_path(month, root))
+        months = list_partitions(settings.HISTORY_DIR)
+        refresh_months(months, version)
+        for month in set(list_partitions(grain_root("month"))) - set(months):
+            os.remove(partition_path(month, grain_root("month")))
+    logging.info("Derived columns of the hour, shift and month grains recomputed.")
@@ -1,62 +1,244 @@
+import asyncio
+import threading
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from src.components.extract_cache import cached_extract, evict_extracts
+from src.components.queries import posting_time_column, query_for
+from src.components.schema import apply_extract_schema, map_codes, posting_hours
+from src.components.streaming import read_streaming
 from src.utils.db import get_db_connection
+from src.utils.instrumentation import add_bytes_read, instrumented, stage
 from src.utils.logger import logging
+from src.utils.pi import fetch_pi_values, get_pi_server
 from src.utils.exception import CustomException
 from src.config.settings import settings
-from PIconnect.PI import PIServer # type: ignore
 import sys
 
-def fetch_all_data():
+def resolve_date_range(start_date=None, end_date=None):
     """
-        Fetch all relevant data from the database and PI server.
-        Returns: dict: Contains DataFrames for SAP, Rewinder, QC data and PI server connection.
+        Normalise an optional start/end pair into two datetime.date objects.
+        Args:
+            start_date (date | datetime | str | None): First business date (inclusive). Defaults to yesterday.
+            end_date (date | datetime | str | None): Last business date (inclusive). Defaults to start_date.
+        Returns: tuple: (start_date, end_date) as datetime.date.
+        Raises: ValueError: If end_date falls before start_date.
+    """
+    def _to_date(value):
+        if isinstance(value, str):
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        if isinstance(value, datetime):
+            return value.date()
+        return value
+
+    start = _to_date(start_date) or (datetime.now() - timedelta(days=1)).date()
+    end = _to_date(end_date) or start
+    if end < start:
+        raise ValueError(f"end_date {end} is before start_date {start}")
+    return start, end
+
+def _read_source(table, start, end):
+    if settings.INGEST_MODE == "stream":
+        return read_streaming(table, start, end)
+    query, params = query_for(table, start, end)
+    with get_db_connection() as conn:
+        return pd.read_sql(query, conn, params=params)
+
+def _read(table, start, end):
+    if settings.EXTRACT_CACHE:
+        # Extracts split by posting hour are cached apart from those cached before the split
+        mode = f"{settings.INGEST_MODE}-hourly" if posting_time_column(table) else settings.INGEST_MODE
+        df = cached_extract(table, start, end, mode, lambda s, e: _read_source(table, s, e))
+    else:
+        df = _read_source(table, start, end)
+    add_bytes_read(df.memory_usage(index=False).sum())
+    return df
+
+def prepare_sap(sap_df):
+    """
+        Adds calculation_date and machine to a SAP production extract (MB51_MATDOC), deduplicated per date on CHARG.
+    """
+    sap_df['calculation_date'] = pd.to_datetime(sap_df['BUDAT'].astype(str), format="%Y%m%d").dt.date
+    if 'CHARG' in sap_df.columns:
+        sap_df = sap_df.drop_duplicates(subset=['calculation_date', 'CHARG'])
+    sap_df['machine'] = map_codes(sap_df['LGORT'], settings.MACHINE_MAP_SAP)
+    return apply_extract_schema(posting_hours(sap_df))
+
+def prepare_rewinder(rewinder_df):
+    """
+        Adds calculation_date and Machine to a rewinder log extract (ZPR020_REWLOG), deduplicated per date on OP_CHARG.
+    """
+    rewinder_df['calculation_date'] = pd.to_datetime(rewinder_df['BUDAT'].astype(str), format="%Y%m%d").dt.date
+    if 'OP_CHARG' in rewinder_df.columns:
+        rewinder_df = rewinder_df.drop_duplicates(subset=['calculation_date', 'OP_CHARG'])
+        rewinder_df['MACHINE_CODE'] = rewinder_df['BATCH'].str.slice(4, 6)
+    # Aggregate and stream modes return the machine code already sliced out of BATCH
+    rewinder_df['Machine'] = map_codes(rewinder_df['MACHINE_CODE'], settings.MACHINE_MAP_REWINDER, 'Unknown')
+    return apply_extract_schema(posting_hours(rewinder_df))
+
+def prepare_qc(qc_df):
+    """
+        Adds calculation_date and Machine to a QC rejection extract (ZQM008_REJ).
+    """
+    qc_df['calculation_date'] = pd.to_datetime(qc_df['CDATE'], format="%d.%m.%Y").dt.date
+    qc_df['Machine'] = map_codes(qc_df['LGORT'], settings.MACHINE_MAP_QC)
+    return apply_extract_schema(posting_hours(qc_df))
+
+@instrumented("ingest.sap")
+def fetch_sap(start, end):
+    """
+        SAP production postings (MB51_MATDOC) between two business dates.
+    """
+    return prepare_sap(_read("sap", start, end))
+
+@instrumented("ingest.rewinder")
+def fetch_rewinder(start, end):
+    """
+        Rewinder log (ZPR020_REWLOG) between two business dates.
+    """
+    return prepare_rewinder(_read("rewinder", start, end))
+
+@instrumented("ingest.qc")
+def fetch_qc(start, end):
+    """
+        QC rejections (ZQM008_REJ) between two business dates.
+    """
+    return prepare_qc(_read("qc", start, end))
+
+EXTRACTS = {
+    "sap_df": fetch_sap,
+    "rewinder_df": fetch_rewinder,
+    "qc_df": fetch_qc,
+}
+
+def _evict_extracts():
+    # Once per fetch, after every table's extract is in, so no table's read races the eviction
+    if not settings.EXTRACT_CACHE:
+        return
+    try:
+        evict_extracts()
+    except OSError as e:
+        logging.warning(f"Extract cache eviction failed: {e}")
+
+def fetch_all_data(start_date=None, end_date=None):
+    """
+        Fetch all relevant data from the database and PI server for a range of business dates.
+        Each table is queried once with a range predicate, and the extracts run concurrently on pooled connections.
+        Args:
+            start_date (date | str | None): First business date (inclusive). Defaults to yesterday.
+            end_date (date | str | None): Last business date (inclusive). Defaults to start_date.
+        Returns: dict: Contains DataFrames for SAP, Rewinder, QC data, PI server connection and the date range.
         Raises: CustomException: If any error occurs during data fetching.
     """
     try:
-        conn = get_db_connection()
-        calculation_date_dt = datetime.now() - timedelta(days=1)
-        date_db = calculation_date_dt.strftime("%Y%m%d")
-        date_qc = calculation_date_dt.strftime("%d.%m.%Y")
-
-        # SAP data
-        query_sap = f"""
-        SELECT * FROM MB51_MATDOC 
-        WHERE werks = 5000 
-        AND BUDAT LIKE {date_db} 
-        AND BWART BETWEEN 101 AND 102 
-        AND LGORT LIKE 'PM%'"""
-        sap_df = pd.read_sql(query_sap, conn)
-        sap_df = sap_df.drop_duplicates(subset='CHARG')
-        sap_df['machine'] = sap_df['LGORT'].map(settings.MACHINE_MAP_SAP)
-
-        # Rewinder data
-        query_rew = f"SELECT * FROM ZPR020_REWLOG WHERE BUDAT = '{date_db}'"
-        rewinder_df = pd.read_sql(query_rew, conn)
-        rewinder_df = rewinder_df.drop_duplicates(subset='OP_CHARG')
-        rewinder_df['Machine'] = rewinder_df['BATCH'].apply(lambda x: settings.MACHINE_MAP_REWINDER.get(x[4:6], 'Unknown'))
-
-        # QC data
-        query_qc = f"SELECT * FROM ZQM008_REJ WHERE werks = 5000 AND CDATE = '{date_qc}'"
-        qc_df = pd.read_sql(query_qc, conn)
-        qc_df['Machine'] = qc_df['LGORT'].map(settings.MACHINE_MAP_QC)
-
-        conn.close()
-
-        # PI server
+        start, end = resolve_date_range(start_date, end_date)
+
+        with stage("ingest") as record:
+            with ThreadPoolExecutor(max_workers=settings.INGEST_MAX_WORKERS, thread_name_prefix="ingest") as pool:
+                futures = {name: pool.submit(extract, start, end) for name, extract in EXTRACTS.items()}
+                frames = {name: future.result() for name, future in futures.items()}
+            record.rows_out = sum(len(df) for df in frames.values())
+        _evict_extracts()
+
+        logging.info(
+            f"Fetched {len(frames['sap_df'])} SAP, {len(frames['rewinder_df'])} rewinder "
+            f"and {len(frames['qc_df'])} QC rows for {start} to {end}."
+        )
+
+        # PI server (connection and tag resolutions are cached for the process lifetime)
+        pi_server = get_pi_server()
+
+        return {
+            **frames,
+            "pi_server": pi_server,
+            "date": datetime.combine(end, datetime.min.time()),
+            "start_date": start,
+            "end_date": end,
+        }
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+async def _gather_sources(start, end):
+    """
+        Runs the SQL extracts and the whole PI path (connect, resolve tags, read values) side by side, each in
+        its own worker thread and bounded by settings.SOURCE_TIMEOUTS. A failed or timed-out extract cancels
+        everything else; a failed or timed-out PI read only leaves PI tonnage at zero.
+    """
+    loop = asyncio.get_running_loop()
+    dates = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    cancel_pi = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(EXTRACTS) + 1, thread_name_prefix="async-ingest")
+
+    def _pi():
+        pi_server = get_pi_server()
+        return pi_server, fetch_pi_values(pi_server, dates, cancel=cancel_pi)
+
+    async def _bounded(source, func, *args):
+        timeout = settings.SOURCE_TIMEOUTS.get(source) or None
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(executor, func, *args), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{source} did not finish within {timeout}s") from None
+
+    def _submit(source, func, *args):
+        return asyncio.ensure_future(_bounded(source, func, *args))
+
+    extracts = {name: _submit(name[:-3], extract, start, end) for name, extract in EXTRACTS.items()}
+    pi_task = _submit("pi", _pi)
+    try:
+        with stage("ingest") as record:
+            frames = dict(zip(extracts, await asyncio.gather(*extracts.values())))
+            record.rows_out = sum(len(df) for df in frames.values())
+        status = {name[:-3]: "ok" for name in frames}
+
         try:
-            pi_server = PIServer(settings.PI_SERVER_ADDRESS)
+            pi_server, pi_values = await pi_task
+            status["pi"] = "ok"
+        except TimeoutError as e:
+            logging.warning(f"{e}; publishing without PI tonnage.")
+            pi_server, pi_values, status["pi"] = None, fetch_pi_values(None, dates), "timeout"
         except Exception as e:
-            logging.warning("PI Server unavailable.")
-            pi_server = None
+            logging.warning(f"PI read failed, publishing without PI tonnage: {e}")
+            pi_server, pi_values, status["pi"] = None, fetch_pi_values(None, dates), "error"
+        return frames, pi_server, pi_values, status
+    finally:
+        cancel_pi.set()
+        for task in [*extracts.values(), pi_task]:
+            task.cancel()
+        # Threads stuck in a driver call cannot be interrupted; do not wait for them
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def fetch_all_data_async(start_date=None, end_date=None):
+    """
+        Async counterpart of fetch_all_data: overlaps the PI connection handshake, tag resolution and value
+        reads with the SQL extracts, so end-to-end latency is roughly that of the slowest source.
+        Args:
+            start_date (date | str | None): First business date (inclusive). Defaults to yesterday.
+            end_date (date | str | None): Last business date (inclusive). Defaults to start_date.
+        Returns: dict: As fetch_all_data, plus pi_values (PI tonnage per date and machine) and
+            source_status (source -> "ok" | "timeout" | "error").
+        Raises: CustomException: If an SQL extract fails or times out.
+    """
+    try:
+        start, end = resolve_date_range(start_date, end_date)
+        frames, pi_server, pi_values, status = asyncio.run(_gather_sources(start, end))
+        _evict_extracts()
+
+        logging.info(
+            f"Fetched {len(frames['sap_df'])} SAP, {len(frames['rewinder_df'])} rewinder "
+            f"and {len(frames['qc_df'])} QC rows for {start} to {end}; PI {status['pi']}."
+        )
 
         return {
-            "sap_df": sap_df,
-            "rewinder_df": rewinder_df,
-            "qc_df": qc_df,
+            **frames,
             "pi_server": pi_server,
-            "date": calculation_date_dt
+            "pi_values": pi_values,
+            "source_status": status,
+            "date": datetime.combine(end, datetime.min.time()),
+            "start_date": start,
+            "end_date": end,
         }
 
     except Exception as e:
-        raise CustomException(e, sys)
\ No newline at end of file
+        raise CustomException(e, sys)
@@ -0,0 +1,139 @@
+import json
+import os
+import time
+from datetime import date
+import pandas as pd
+from src.config.settings import settings
+from src.utils.file_lock import output_lock
+from src.utils.history_store import atomic_write_json, read_history
+from src.utils.logger import logging
+from src.utils.pi import PI_STATUS_COLUMNS, get_pi_server, read_pi_cells
+
+"""
+    Repair queue for PI values that could not be read.
+    Every history row carries the provenance of its PI values (PI_STATUS_COLUMNS). Cells that are "missing" or
+    "failed" are queued in STATE_DIR/pi_repair_queue.json and re-read on their own, with exponential backoff;
+    a repaired value is patched into its history row, and the derived metrics and rollups follow through
+    write_outputs, without re-reading any SAP table. The patch reads and rewrites history rows, so it runs under
+    output_lock like the writers it could otherwise overwrite.
+"""
+
+def _queue_path():
+    return os.path.join(settings.STATE_DIR, "pi_repair_queue.json")
+
+def _key(day, machine, column):
+    return f"{day}|{machine}|{column}"
+
+def _backoff(attempts):
+    return min(settings.PI_REPAIR_BACKOFF_SECONDS * 2 ** attempts, settings.PI_REPAIR_MAX_BACKOFF_SECONDS)
+
+def load_repair_queue():
+    """
+        Returns: dict: Cell key -> {"date", "machine", "column", "status", "attempts", "next_attempt_at"}.
+    """
+    path = _queue_path()
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_repair_queue(queue):
+    atomic_write_json(queue, _queue_path())
+
+def sync_repair_queue(df, now=None):
+    """
+        Queues the PI cells of freshly written rows that are not "ok" and drops queued cells that now are.
+        Cells already queued keep their attempt count and schedule.
+        Args: df (pd.DataFrame): Metric rows with key and status columns. Rows without status columns are ignored.
+        Returns: int: Number of queued cells.
+    """
+    now = now or time.time()
+    queue = load_repair_queue()
+    before = dict(queue)
+    for column, status_column in PI_STATUS_COLUMNS.items():
+        if status_column not in df.columns:
+            continue
+        statuses = df[status_column].astype(object)
+        for day, machine, status in zip(df["calculation_date"], df["machine_id"].astype(str), statuses):
+            key = _key(day, machine, column)
+            if status == "ok":
+                queue.pop(key, None)
+            elif status in ("missing", "failed") and key not in queue:
+                queue[key] = {
+                    "date": str(day), "machine": machine, "column": column, "status": status,
+                    "attempts": 0, "next_attempt_at": now + _backoff(0),
+                }
+    if queue != before:
+        save_repair_queue(queue)
+    return len(queue)
+
+def _patch_history(values):
+    """
+        Writes repaired PI values into their history rows and pushes them through write_outputs.
+        Args: values (dict): (date, machine, column) -> value.
+        Returns: dict: The summary as rewritten.
+    """
+    from src.components.fetch_output import write_outputs
+    days = sorted({day for day, _, _ in values})
+    history = read_history(days[0], days[-1])
+    positions = {key: i for i, key in enumerate(zip(history["calculation_date"], history["machine_id"].astype(str)))}
+    touched = set()
+    for (day, machine, column), value in values.items():
+        i = positions.get((day, machine))
+        if i is None:
+            continue
+        history.iloc[i, history.columns.get_loc(column)] = value
+        history.iloc[i, history.columns.get_loc(PI_STATUS_COLUMNS[column])] = "ok"
+        touched.add(i)
+
+    summary = {}
+    if os.path.exists(settings.SUMMARY_FILE):
+        with open(settings.SUMMARY_FILE) as f:
+            summary = json.load(f)
+    return write_outputs(history.iloc[sorted(touched)].reset_index(drop=True), summary)
+
+def repair_pi_cells(now=None):
+    """
+        Re-reads the queued PI cells that are due and patches every value that now reads "ok".
+        Cells that fail again are rescheduled with exponential backoff and dropped after
+        settings.PI_REPAIR_MAX_ATTEMPTS; their history rows keep the "missing" / "failed" status.
+        Returns: dict | None: The rewritten summary, or None when nothing was repaired.
+    """
+    now = now or time.time()
+    queue = load_repair_queue()
+    due = {key: entry for key, entry in queue.items() if entry["next_attempt_at"] <= now}
+    if not due:
+        return None
+
+    cells = {key: (date.fromisoformat(e["date"]), e["machine"], e["column"]) for key, e in due.items()}
+    cells = {key: cell for key, cell in cells.items() if cell[1] in settings.PI_TAGS}
+    pi_server = get_pi_server()
+    results = read_pi_cells(pi_server, list(cells.values())) if pi_server and cells else {}
+
+    # The PI reads above run unlocked; the queue and history are re-read under the lock, so a cell a newer write
+    # has dropped in the meantime is not patched over it
+    with output_lock():
+        queue = load_repair_queue()
+        repaired = {}
+        for key in due:
+            entry = queue.get(key)
+            if entry is None:
+                continue
+            value, status = results.get(cells.get(key), (None, "missing"))
+            if status == "ok":
+                repaired[cells[key]] = value
+                del queue[key]
+                continue
+            entry["attempts"] += 1
+            entry["status"] = status
+            if entry["attempts"] >= settings.PI_REPAIR_MAX_ATTEMPTS:
+                logging.warning(f"Giving up on PI {entry['column']} for {entry['machine']} on {entry['date']} after {entry['attempts']} attempts.")
+                del queue[key]
+            else:
+                entry["next_attempt_at"] = now + _backoff(entry["attempts"])
+        save_repair_queue(queue)
+
+        logging.info(f"PI repair: {len(repaired)} of {len(due)} due cells repaired, {len(queue)} still queued.")
+        if not repaired:
+            return None
+        return _patch_history(repaired)
@@ -1,63 +1,113 @@
 import pandas as pd
-from src.utils.logger import logging
+from datetime import timedelta
+from src.components.schema import apply_metrics_schema
 from src.utils.exception import CustomException
+from src.utils.instrumentation import stage
+from src.utils.pi import PI_STATUS_COLUMNS, fetch_pi_values
 from src.config.settings import settings
 import sys
 
+METRIC_COLUMNS = [
+    "SAP_Production",
+    "QCS_Production",
+    "Reel_Production",
+    "Rewinder_Input",
+    "Rewinder_Output",
+    "Qc_Rejection",
+    "Handling_Loss",
+]
+# Provenance of the PI-sourced metrics: "ok", "missing" or "failed" (see src/components/pi_repair.py)
+STATUS_COLUMNS = list(PI_STATUS_COLUMNS.values())
+
+def _business_dates(data):
+    start = data.get('start_date', data['date'].date())
+    end = data.get('end_date', data['date'].date())
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+def _grouped_sums(df, machine_col, values):
+    """
+    Single grouped aggregation of one source table.
+    Args:
+        df (pd.DataFrame): Source extract with a calculation_date column and, with sub-day grains on, posting_hour.
+        machine_col (str): Name of the mapped machine column.
+        values (dict): Output column name -> pd.Series of per-row quantities (kg) aligned with df.
+    Returns: pd.DataFrame: Sums in tons indexed by (calculation_date, machine_id[, posting_hour]).
+        Rows without a valid posting hour are summed under hour -1.
+    """
+    # Quantities may be stored as float32; accumulate in float64
+    frame = pd.DataFrame(values, index=df.index).astype("float64")
+    frame["calculation_date"] = df["calculation_date"]
+    frame["machine_id"] = df[machine_col]
+    keys = ["calculation_date", "machine_id"]
+    if "posting_hour" in df.columns:
+        frame["posting_hour"] = df["posting_hour"].fillna(-1)
+        keys.append("posting_hour")
+    return frame.groupby(keys, sort=False, observed=True).sum() / 1000
+
+def _daily(sums):
+    """
+    Folds hourly sums from _grouped_sums into daily sums; daily sums are returned as they are.
+    """
+    if "posting_hour" not in sums.index.names:
+        return sums
+    return sums.groupby(level=["calculation_date", "machine_id"], sort=False, observed=True).sum()
+
 def compute_metrics(data):
     """
-    Computes daily and monthly metrics for each machine based on the provided data.
-    Args: data (dict): Contains DataFrames for SAP, Rewinder, QC data and PI server connection.
+    Computes daily metrics for each (date, machine) pair based on the provided data.
+    Each source table is aggregated once, grouped by (calculation_date, machine) and, when the extracts carry
+    posting hours, by hour as well; the daily sums are folded from the hourly ones and joined onto the full
+    date x machine grid. The hourly sums are left in data["hourly_sums"] for the hour and shift grains.
+    Args: data (dict): Contains DataFrames for SAP, Rewinder, QC data, PI server connection and the date range.
     Returns:
-        pd.DataFrame: A DataFrame containing the computed metrics for each machine.
-        dict: A summary dictionary with last calculated date and machine-specific metrics.
+        pd.DataFrame: A DataFrame containing the computed metrics for each date and machine.
+        dict: A summary dictionary with last calculated date and each machine's daily broke.
     """
     try:
-        df_list = []
-
-        for machine in settings.PI_TAGS.keys():
-            m = {
-                "calculation_date": data['date'].date(),
-                "machine_id": machine,
-                "SAP_Production": round(data['sap_df'][data['sap_df']['machine'] == machine]['MENGE'].sum() / 1000, 2),
-                "QCS_Production": 0,
-                "Reel_Production": 0,
-                "Rewinder_Input": 0,
-                "Rewinder_Output": 0,
-                "Qc_Rejection": 0,
-                "Handling_Loss": 0,
-            }
+        with stage("compute") as record:
+            record.rows_in = sum(len(data[k]) for k in ('sap_df', 'rewinder_df', 'qc_df'))
+            dates = _business_dates(data)
+            index = pd.MultiIndex.from_product([dates, list(settings.PI_TAGS.keys())], names=["calculation_date", "machine_id"])
+
+            sap_df, rewinder_df, qc_df = data['sap_df'], data['rewinder_df'], data['qc_df']
+            sap_sums = _grouped_sums(sap_df, 'machine', {"SAP_Production": sap_df['MENGE']})
+            rew_sums = _grouped_sums(rewinder_df, 'Machine', {
+                "Rewinder_Input": rewinder_df['TOT_MENGE'],
+                "Rewinder_Output": rewinder_df['CH_REEL_WT'],
+            })
+            qc_sums = _grouped_sums(qc_df, 'Machine', {
+                "Qc_Rejection": qc_df['FROM_QTY'].where(qc_df['REA_MOV'] == 'Repulp', 0),
+                "Handling_Loss": qc_df['FROM_QTY'].where(qc_df['CODE'] == 'Handling Loss', 0),
+            })
+            sap, rew, qc = _daily(sap_sums).round(2), _daily(rew_sums), _daily(qc_sums)
+            if all("posting_hour" in s.index.names for s in (sap_sums, rew_sums, qc_sums)):
+                data['hourly_sums'] = pd.concat([sap_sums, rew_sums, qc_sums], axis=1).fillna(0)
+
+            # Async orchestration reads PI alongside the SQL extracts and passes the values in
+            pi = data.get('pi_values')
+            if pi is None:
+                pi = fetch_pi_values(data['pi_server'], dates)
+
+            df = pd.concat([sap, pi, rew, qc], axis=1).reindex(index)
+            df[METRIC_COLUMNS] = df[METRIC_COLUMNS].fillna(0)
+            for column in STATUS_COLUMNS:
+                df[column] = df[column].fillna("missing")
+            df = apply_metrics_schema(df[METRIC_COLUMNS + STATUS_COLUMNS].reset_index())
+
+            record.rows_out = len(df)
 
-            try:
-                if data['pi_server']:
-                    qcs_tag, reel_tag = settings.PI_TAGS[machine]
-                    m["QCS_Production"] = float(data['pi_server'].search(qcs_tag)[0].recorded_value(data['date']))
-                    m["Reel_Production"] = float(data['pi_server'].search(reel_tag)[0].recorded_value(data['date']))
-            except Exception as e:
-                logging.warning(f"PI fetch failed for {machine}: {e}")
-
-            rew = data['rewinder_df'][data['rewinder_df']['Machine'] == machine]
-            m["Rewinder_Input"] = rew['TOT_MENGE'].sum() / 1000
-            m["Rewinder_Output"] = rew['CH_REEL_WT'].sum() / 1000
-
-            qc = data['qc_df'][data['qc_df']['Machine'] == machine]
-            m["Qc_Rejection"] = qc[qc['REA_MOV'] == 'Repulp']['FROM_QTY'].sum() / 1000
-            m["Handling_Loss"] = qc[qc['CODE'] == 'Handling Loss']['FROM_QTY'].sum() / 1000
-
-            df_list.append(m)
-
-        df = pd.DataFrame(df_list)
-        summary = {
-            "last_calculated_date": str(data['date'].date()),
-            "machines": {
-                m: {
-                    "daily_broke": round(df[df['machine_id'] == m]['Qc_Rejection'].sum(), 2),
-                    "monthly_broke": round(df[df['machine_id'] == m]['Qc_Rejection'].sum(), 2)
-                } for m in df['machine_id'].unique()
+            # Month-to-date and rolling totals need history; write_outputs fills them from the rollups
+            last_day = df[df['calculation_date'] == dates[-1]].set_index('machine_id')[settings.BROKE_METRIC].round(2)
+            summary = {
+                "last_calculated_date": str(dates[-1]),
+                "machines": {
+                    str(m): {"daily_broke": float(broke)} for m, broke in last_day.items()
+                }
             }
-        }
+            if 'source_status' in data:
+                summary["source_status"] = data['source_status']
 
-        return df, summary
+            return df, summary
 
     except Exception as e:
-        raise CustomException(e, sys)
\ No newline at end of file
+        raise CustomException(e, sys)
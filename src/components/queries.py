@@ -0,0 +1,220 @@
+import re
+from datetime import timedelta
+from functools import lru_cache
+from src.config.settings import settings
+
+"""
+    SQL for the three SAP extracts.
+    Queries select only the columns compute_metrics needs and take every value as a bound parameter, so the
+    statement text is identical from run to run and SQL Server can reuse its plan. Each table also has an
+    "aggregate" form that deduplicates and sums on the server and returns one row per (date, location).
+    With posting-time columns configured (settings.POSTING_TIME_COLUMNS), rows also carry POSTING_TIME and
+    aggregates are split per POSTING_HOUR, for the hour and shift grains.
+"""
+
+# Columns read from each table in "rows" mode
+SAP_COLUMNS = ["BUDAT", "CHARG", "LGORT", "MENGE"]
+REWINDER_COLUMNS = ["BUDAT", "OP_CHARG", "BATCH", "TOT_MENGE", "CH_REEL_WT"]
+QC_COLUMNS = ["CDATE", "LGORT", "REA_MOV", "CODE", "FROM_QTY"]
+
+# SQL Server caps a statement at 2100 parameters; longer QC ranges fall back to a CONVERT predicate
+MAX_QC_DATE_PARAMS = 2000
+
+_SAP_FILTER = """
+    FROM MB51_MATDOC
+    WHERE werks = :werks
+    AND BUDAT BETWEEN :start_budat AND :end_budat
+    AND BWART BETWEEN 101 AND 102
+    AND LGORT LIKE 'PM%'"""
+
+_REWINDER_FILTER = """
+    FROM ZPR020_REWLOG
+    WHERE BUDAT BETWEEN :start_budat AND :end_budat"""
+
+_QC_FILTER_IN = """
+    FROM ZQM008_REJ
+    WHERE werks = :werks
+    AND CDATE IN :cdates"""
+
+_QC_FILTER_CONVERT = """
+    FROM ZQM008_REJ
+    WHERE werks = :werks
+    AND CONVERT(date, CDATE, 104) BETWEEN :start_date AND :end_date"""
+
+# Templates are completed by _format: {posting_time} selects the posting-time column, {posting_hour} its hour,
+# {hour} carries that hour through a subquery and {group_hour} adds it to GROUP BY; all are empty without one
+_ROWS = {
+    "sap": f"SELECT {', '.join(SAP_COLUMNS)}{{posting_time}} {_SAP_FILTER}",
+    "rewinder": f"SELECT {', '.join(REWINDER_COLUMNS)}{{posting_time}} {_REWINDER_FILTER}",
+    "qc": f"SELECT {', '.join(QC_COLUMNS)}{{posting_time}} {{qc_filter}}",
+}
+
+_AGGREGATE = {
+    "sap": f"""
+    SELECT BUDAT, LGORT{{hour}}, SUM(MENGE) AS MENGE, COUNT(*) AS ROW_COUNT
+    FROM (
+        SELECT BUDAT, LGORT, MENGE{{posting_hour}}, ROW_NUMBER() OVER (PARTITION BY BUDAT, CHARG ORDER BY (SELECT NULL)) AS rn
+        {_SAP_FILTER}
+    ) d
+    WHERE rn = 1
+    GROUP BY BUDAT, LGORT{{hour}}""",
+    "rewinder": f"""
+    SELECT BUDAT, MACHINE_CODE{{hour}}, SUM(TOT_MENGE) AS TOT_MENGE, SUM(CH_REEL_WT) AS CH_REEL_WT, COUNT(*) AS ROW_COUNT
+    FROM (
+        SELECT BUDAT, SUBSTRING(BATCH, 5, 2) AS MACHINE_CODE, TOT_MENGE, CH_REEL_WT{{posting_hour}},
+               ROW_NUMBER() OVER (PARTITION BY BUDAT, OP_CHARG ORDER BY (SELECT NULL)) AS rn
+        {_REWINDER_FILTER}
+    ) d
+    WHERE rn = 1
+    GROUP BY BUDAT, MACHINE_CODE{{hour}}""",
+    "qc": """
+    SELECT CDATE, LGORT, REA_MOV, CODE{posting_hour}, SUM(FROM_QTY) AS FROM_QTY, COUNT(*) AS ROW_COUNT
+    {qc_filter}
+    GROUP BY CDATE, LGORT, REA_MOV, CODE{group_hour}""",
+}
+
+def posting_time_column(table):
+    """
+        The table's posting-time column, or None when sub-day grains are off (any table lacks one).
+        Raises: ValueError: If a configured column name is not a plain identifier.
+    """
+    columns = settings.POSTING_TIME_COLUMNS
+    if not all(columns.values()):
+        return None
+    column = columns[table]
+    if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", column):
+        raise ValueError(f"Invalid posting-time column {column!r} for {table!r}")
+    return column
+
+def _format(sql, qc_filter, posting_time):
+    hour = f"SUBSTRING({posting_time}, 1, 2)" if posting_time else ""
+    return sql.format(
+        qc_filter=qc_filter,
+        posting_time=f", {posting_time} AS POSTING_TIME" if posting_time else "",
+        posting_hour=f", {hour} AS POSTING_HOUR" if posting_time else "",
+        hour=", POSTING_HOUR" if posting_time else "",
+        group_hour=f", {hour}" if posting_time else "",
+    )
+
+@lru_cache(maxsize=None)
+def build_query(table, mode="rows", qc_in_list=True, posting_time=None):
+    """
+        Returns the (cached) parameterised statement for a table.
+        Args:
+            table (str): One of "sap", "rewinder", "qc".
+            mode (str): "rows" for projected raw rows, "aggregate" for server-side per-location sums.
+            qc_in_list (bool): QC only. Filter CDATE with an expanding IN list instead of CONVERT.
+            posting_time (str | None): Posting-time column to select (rows) or split the sums by (aggregate).
+        Returns: TextClause: Statement ready for pd.read_sql.
+        Raises: ValueError: If the table or mode is unknown.
+    """
+    templates = {"rows": _ROWS, "aggregate": _AGGREGATE}.get(mode)
+    if templates is None or table not in templates:
+        raise ValueError(f"Unknown query {table!r} in mode {mode!r}")
+    from sqlalchemy import bindparam, text # type: ignore
+    sql = _format(templates[table], _QC_FILTER_IN if qc_in_list else _QC_FILTER_CONVERT, posting_time)
+    if table == "qc" and qc_in_list:
+        return text(sql).bindparams(bindparam("cdates", expanding=True))
+    return text(sql)
+
+@lru_cache(maxsize=None)
+def build_delta_query(table, watermark_column, bounded=True, posting_time=None):
+    """
+        Returns the (cached) row-level statement for one business date, limited to rows past a high-water mark.
+        SAP and rewinder compare with >=: rows committed late with the same mark as the last poll's newest row are
+        re-read, and the poller drops the ones it already folded by their keys. QC rows have no key to drop
+        repeats by, so QC compares with a strict >, and such late QC rows wait for the next full run of the day.
+        Args:
+            table (str): One of "sap", "rewinder", "qc".
+            watermark_column (str): Monotonic column (load timestamp or document key) compared with :watermark.
+            bounded (bool): False for the first poll of a day, which reads every row and only records the mark.
+            posting_time (str | None): Posting-time column to select as POSTING_TIME.
+        Returns: TextClause: Statement with the watermark column selected as WATERMARK.
+        Raises: ValueError: If the table is unknown or the column name is not a plain identifier.
+    """
+    if table not in _ROWS or not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", watermark_column):
+        raise ValueError(f"Unknown delta query {table!r} on {watermark_column!r}")
+    from sqlalchemy import bindparam, text # type: ignore
+    sql = _format(_ROWS[table], _QC_FILTER_IN, posting_time)
+    sql = sql.replace("SELECT ", f"SELECT {watermark_column} AS WATERMARK, ", 1)
+    if bounded:
+        sql += f"\n    AND {watermark_column} {'>' if table == 'qc' else '>='} :watermark"
+    query = text(sql)
+    if table == "qc":
+        query = query.bindparams(bindparam("cdates", expanding=True))
+    return query
+
+# Business-date column of each table, used to group fingerprints and split extracts per date
+DATE_COLUMNS = {"sap": "BUDAT", "rewinder": "BUDAT", "qc": "CDATE"}
+
+@lru_cache(maxsize=None)
+def build_fingerprint_query(table, watermark_column, qc_in_list=True):
+    """
+        Returns the (cached) statement giving, per business date, the row count and highest watermark of an extract.
+        Used to revalidate cached extracts of open dates without re-reading their rows.
+        Args:
+            table (str): One of "sap", "rewinder", "qc".
+            watermark_column (str): Monotonic column (load timestamp or document key).
+            qc_in_list (bool): QC only. Filter CDATE with an expanding IN list instead of CONVERT.
+        Returns: TextClause: Statement returning BUSINESS_DATE, ROW_COUNT and WATERMARK.
+        Raises: ValueError: If the table is unknown or the column name is not a plain identifier.
+    """
+    if table not in DATE_COLUMNS or not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", watermark_column):
+        raise ValueError(f"Unknown fingerprint query {table!r} on {watermark_column!r}")
+    from sqlalchemy import bindparam, text # type: ignore
+    date_column = DATE_COLUMNS[table]
+    filters = {"sap": _SAP_FILTER, "rewinder": _REWINDER_FILTER,
+               "qc": _QC_FILTER_IN if qc_in_list else _QC_FILTER_CONVERT}
+    sql = (f"SELECT {date_column} AS BUSINESS_DATE, COUNT(*) AS ROW_COUNT, MAX({watermark_column}) AS WATERMARK"
+           f" {filters[table]}\n    GROUP BY {date_column}")
+    query = text(sql)
+    if table == "qc" and qc_in_list:
+        query = query.bindparams(bindparam("cdates", expanding=True))
+    return query
+
+def fingerprint_query_for(table, start, end):
+    """
+        Per-date fingerprint statement and parameters for a range of business dates.
+        Returns: tuple: (TextClause, dict of parameters).
+    """
+    params, qc_in_list = _range_params(table, start, end)
+    return build_fingerprint_query(table, settings.WATERMARK_COLUMNS[table], qc_in_list), params
+
+def query_for(table, start, end, mode=None, watermark=None):
+    """
+        Returns the statement and bound parameters for one table over a business-date range.
+        Args:
+            table (str): One of "sap", "rewinder", "qc".
+            start (date): First business date (inclusive).
+            end (date): Last business date (inclusive).
+            mode (str | None): "rows", "aggregate" or "delta". Defaults to settings.INGEST_MODE.
+            watermark (object | None): Delta mode only. Last high-water mark seen; None reads the whole range.
+        Returns: tuple: (TextClause, dict of parameters).
+    """
+    mode = mode or settings.INGEST_MODE
+    query, params = _range_query(table, start, end, "rows" if mode == "delta" else mode)
+    if mode == "delta":
+        query = build_delta_query(table, settings.WATERMARK_COLUMNS[table], watermark is not None, posting_time_column(table))
+        if watermark is not None:
+            params["watermark"] = watermark
+    return query, params
+
+def _range_params(table, start, end):
+    if table == "qc":
+        days = (end - start).days + 1
+        qc_in_list = days <= MAX_QC_DATE_PARAMS
+        if qc_in_list:
+            params = {"cdates": [(start + timedelta(days=i)).strftime("%d.%m.%Y") for i in range(days)]}
+        else:
+            params = {"start_date": start.isoformat(), "end_date": end.isoformat()}
+        params["werks"] = settings.WERKS
+        return params, qc_in_list
+
+    params = {"start_budat": start.strftime("%Y%m%d"), "end_budat": end.strftime("%Y%m%d")}
+    if table == "sap":
+        params["werks"] = settings.WERKS
+    return params, True
+
+def _range_query(table, start, end, mode):
+    params, qc_in_list = _range_params(table, start, end)
+    return build_query(table, mode, qc_in_list, posting_time_column(table)), params
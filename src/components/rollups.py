@@ -0,0 +1,145 @@
+import os
+import json
+from datetime import date, timedelta
+import pandas as pd
+from src.config.settings import settings
+from src.utils.file_lock import output_lock
+from src.utils.history_store import atomic_write_json, read_history
+from src.utils.logger import logging
+
+"""
+    Materialised per-machine rollups of the broke metric (settings.BROKE_METRIC).
+    The state holds, per machine, the last ROLLING_WINDOW_DAYS daily values plus running month-to-date and
+    year-to-date totals as of the latest calculated date. New or corrected days are applied as deltas
+    against the values they replace, so the dashboard summary is produced in O(machines), independent of
+    how much history has accumulated.
+"""
+
+ROLLING_WINDOWS = (7, 30)
+ROLLING_WINDOW_DAYS = max(ROLLING_WINDOWS)
+
+def _empty_state():
+    return {"metric": settings.BROKE_METRIC, "as_of": None, "machines": {}}
+
+def load_rollups():
+    """
+        Loads the rollup state, rebuilding it from history when no state file exists or the metric changed.
+    """
+    if os.path.exists(settings.ROLLUP_FILE):
+        with open(settings.ROLLUP_FILE) as f:
+            state = json.load(f)
+        if state.get("metric") == settings.BROKE_METRIC:
+            return state
+    return rebuild_rollups(save=False)
+
+def save_rollups(state):
+    atomic_write_json(state, settings.ROLLUP_FILE)
+
+def _machine_state(state, machine):
+    return state["machines"].setdefault(machine, {"daily": {}, "month_to_date": 0.0, "year_to_date": 0.0})
+
+def _advance(state, new_as_of):
+    """
+        Moves the as-of date forward: resets month/year totals on boundaries and expires window days.
+    """
+    old_as_of = date.fromisoformat(state["as_of"]) if state["as_of"] else None
+    window_start = (new_as_of - timedelta(days=ROLLING_WINDOW_DAYS - 1)).isoformat()
+    for machine in state["machines"].values():
+        if old_as_of is None or old_as_of.year != new_as_of.year:
+            machine["year_to_date"] = 0.0
+        if old_as_of is None or (old_as_of.year, old_as_of.month) != (new_as_of.year, new_as_of.month):
+            machine["month_to_date"] = 0.0
+        machine["daily"] = {d: v for d, v in machine["daily"].items() if d >= window_start}
+    state["as_of"] = new_as_of.isoformat()
+
+def _apply_delta(state, machine, day, delta):
+    as_of = date.fromisoformat(state["as_of"])
+    m = _machine_state(state, machine)
+    if day.year == as_of.year:
+        m["year_to_date"] += delta
+        if day.month == as_of.month:
+            m["month_to_date"] += delta
+    if (as_of - day).days < ROLLING_WINDOW_DAYS:
+        key = day.isoformat()
+        m["daily"][key] = m["daily"].get(key, 0.0) + delta
+
+def update_rollups(new_rows, previous_rows=None, state=None):
+    """
+        Applies new or corrected (calculation_date, machine_id) rows to the rollup state as deltas.
+        Args:
+            new_rows (pd.DataFrame): Rows just written to history.
+            previous_rows (pd.DataFrame | None): The history rows they replaced, if any.
+            state (dict | None): Rollup state. Loaded from disk when omitted.
+        Returns: dict: The updated state (also persisted).
+    """
+    state = state or load_rollups()
+    metric = settings.BROKE_METRIC
+    new = new_rows.set_index(["calculation_date", "machine_id"])[metric].astype(float)
+    if previous_rows is not None and not previous_rows.empty:
+        old = previous_rows.set_index(["calculation_date", "machine_id"])[metric].astype(float)
+        delta = new.sub(old.reindex(new.index), fill_value=0)
+    else:
+        delta = new
+
+    for (day, machine), value in sorted(delta.items(), key=lambda item: item[0][0]):
+        if state["as_of"] is None or day > date.fromisoformat(state["as_of"]):
+            _advance(state, day)
+        _apply_delta(state, str(machine), day, value)
+
+    save_rollups(state)
+    return state
+
+def rebuild_rollups(save=True):
+    """
+        Recomputes the rollup state from the current year of history and the rolling window, which early in the
+        year reaches back into the previous one. Used on first run or after a formula change.
+    """
+    with output_lock():
+        state = _empty_state()
+        history = read_history(columns=[settings.BROKE_METRIC])
+        if not history.empty:
+            as_of = max(history["calculation_date"])
+            first = min(date(as_of.year, 1, 1), as_of - timedelta(days=ROLLING_WINDOW_DAYS - 1))
+            history = history[history["calculation_date"] >= first]
+            _advance(state, as_of)
+            for row in history.itertuples(index=False):
+                value = float(getattr(row, settings.BROKE_METRIC))
+                _apply_delta(state, str(row.machine_id), row.calculation_date, value)
+            logging.info(f"Rollups rebuilt from {len(history)} history rows as of {as_of}.")
+        if save:
+            save_rollups(state)
+    return state
+
+def rollup_table(state):
+    """
+        Returns the materialised rollups as a DataFrame with one row per machine.
+    """
+    as_of = state["as_of"]
+    rows = []
+    for machine, m in sorted(state["machines"].items()):
+        row = {"machine_id": machine, "day": m["daily"].get(as_of, 0.0)}
+        for window in ROLLING_WINDOWS:
+            start = (date.fromisoformat(as_of) - timedelta(days=window - 1)).isoformat()
+            row[f"rolling_{window}d"] = sum(v for d, v in m["daily"].items() if d >= start)
+        row["month_to_date"] = m["month_to_date"]
+        row["year_to_date"] = m["year_to_date"]
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def summary_from_rollups(state):
+    """
+        Builds the dashboard summary from the rollup state.
+    """
+    return {
+        "last_calculated_date": state["as_of"],
+        "metric": state["metric"],
+        "machines": {
+            row.machine_id: {
+                "daily_broke": round(row.day, 2),
+                "monthly_broke": round(row.month_to_date, 2),
+                "rolling_7d_broke": round(row.rolling_7d, 2),
+                "rolling_30d_broke": round(row.rolling_30d, 2),
+                "yearly_broke": round(row.year_to_date, 2),
+            } for row in rollup_table(state).itertuples(index=False)
+        } if state["as_of"] else {}
+    }
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+"""
+    Compact dtypes for extract and metrics frames.
+    Low-cardinality codes (storage locations, movement reasons, machines) are held as categoricals and
+    per-row quantities are downcast, which cuts memory per row on large extracts. Aggregations upcast back to
+    float64 so totals keep full precision. Aggregate and stream extracts, which carry ROW_COUNT, hold sums
+    rather than rows: there are few of them and float32 would round them, so they stay float64.
+"""
+
+CATEGORY_COLUMNS = ["LGORT", "REA_MOV", "CODE", "MACHINE_CODE", "machine", "Machine", "machine_id"]
+QUANTITY_COLUMNS = ["MENGE", "TOT_MENGE", "CH_REEL_WT", "FROM_QTY"]
+COUNT_COLUMNS = ["ROW_COUNT"]
+
+def map_codes(codes, mapping, default=None):
+    """
+        Maps raw location/batch codes to machines through a lookup table over the distinct codes only.
+        Args:
+            codes (pd.Series): Raw codes, one per row.
+            mapping (dict): Code -> machine.
+            default (str | None): Value for codes missing from the mapping. None leaves them missing.
+        Returns: pd.Series: Categorical machine ids aligned with codes.
+    """
+    raw = pd.Categorical(codes)
+    lookup = np.array([mapping.get(code, default) for code in raw.categories] + [default], dtype=object)
+    categories = sorted(set(mapping.values()) | ({default} if default is not None else set()))
+    # codes == -1 (missing input) picks the trailing default entry
+    mapped = pd.Categorical(lookup[raw.codes], categories=categories)
+    return pd.Series(mapped, index=codes.index)
+
+def posting_hours(df):
+    """
+        Replaces the POSTING_TIME (rows) or POSTING_HOUR (aggregate, stream) column with posting_hour, 0-23.
+        Frames without either are returned unchanged.
+    """
+    for column in ("POSTING_TIME", "POSTING_HOUR"):
+        if column in df.columns:
+            hours = pd.to_numeric(df.pop(column).astype(str).str.slice(0, 2), errors="coerce")
+            df["posting_hour"] = hours.where(hours.between(0, 23)).astype("Int8")
+    return df
+
+def is_summed(columns):
+    """
+        True for aggregate and stream extracts, whose quantities are per-group sums rather than per-row values.
+    """
+    return "ROW_COUNT" in columns
+
+def apply_extract_schema(df):
+    """
+        Casts code columns to categoricals and downcasts count columns and, in row extracts, quantity columns in place.
+        Args: df (pd.DataFrame): Extract frame from ingestion.
+        Returns: pd.DataFrame: The same frame with compact dtypes.
+    """
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+    quantity_dtype = "float64" if is_summed(df.columns) else "float32"
+    for column in QUANTITY_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(quantity_dtype)
+    for column in COUNT_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], downcast="unsigned")
+    return df
+
+def apply_metrics_schema(df):
+    """
+        Stores machine_id as a categorical on the metrics frame; metric columns stay float64.
+    """
+    if "machine_id" in df.columns:
+        df["machine_id"] = df["machine_id"].astype("category")
+    return df
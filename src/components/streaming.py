@@ -0,0 +1,136 @@
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from src.components.queries import posting_time_column, query_for
+from src.config.settings import settings
+from src.utils.db import get_db_connection
+from src.utils.logger import logging
+
+"""
+    Bounded-memory streaming extracts.
+    Rows are read in chunks sized from settings.INGEST_MEMORY_LIMIT_MB, deduplicated across chunks against a
+    compact set of 64-bit key hashes, and folded into running per-(date, location) sums. Dedup keys include the
+    business date, so keyed tables are read one date at a time and only that date's hashes are held. The result
+    has the same shape as the server-side "aggregate" extracts, so compute_metrics consumes it unchanged.
+"""
+
+# table -> (dedup key columns, group columns, value columns)
+STREAM_LAYOUT = {
+    "sap": (["BUDAT", "CHARG"], ["BUDAT", "LGORT"], ["MENGE"]),
+    "rewinder": (["BUDAT", "OP_CHARG"], ["BUDAT", "MACHINE_CODE"], ["TOT_MENGE", "CH_REEL_WT"]),
+    "qc": (None, ["CDATE", "LGORT", "REA_MOV", "CODE"], ["FROM_QTY"]),
+}
+
+# Rough in-memory size of one projected extract row (object strings dominate)
+ROW_BYTES_ESTIMATE = 400
+
+def group_columns(table):
+    """
+        Columns a table's stream is summed by: its STREAM_LAYOUT groups, plus POSTING_HOUR with sub-day grains on.
+    """
+    return STREAM_LAYOUT[table][1] + (["POSTING_HOUR"] if posting_time_column(table) else [])
+
+def stream_columns(table, chunk):
+    """
+        Adds the columns that are grouped on but not selected: the rewinder machine code and the posting hour.
+    """
+    if table == "rewinder":
+        chunk = chunk.assign(MACHINE_CODE=chunk["BATCH"].str.slice(4, 6))
+    if "POSTING_TIME" in chunk.columns:
+        chunk = chunk.assign(POSTING_HOUR=chunk.pop("POSTING_TIME").astype(str).str.slice(0, 2))
+    return chunk
+
+def chunk_rows():
+    """
+        Rows per chunk so that every concurrently running extract stays within INGEST_MEMORY_LIMIT_MB.
+    """
+    budget = settings.INGEST_MEMORY_LIMIT_MB * 1024 * 1024 // max(settings.INGEST_MAX_WORKERS, 1)
+    return max(1000, budget // ROW_BYTES_ESTIMATE)
+
+class SeenKeys:
+    """
+        Compact set of row keys, stored as a sorted array of 64-bit hashes (8 bytes per key). New hashes are merged
+        in by position, so a chunk costs a linear copy of the set rather than a re-sort.
+    """
+
+    def __init__(self, hashes=None):
+        self._hashes = np.empty(0, dtype=np.uint64) if hashes is None else np.asarray(hashes, dtype=np.uint64)
+
+    @property
+    def hashes(self):
+        return self._hashes
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def filter_new(self, keys):
+        """
+            Returns a boolean mask of rows whose key has not been seen before, and remembers them.
+            Args: keys (pd.DataFrame): Key columns of one chunk.
+            Returns: np.ndarray: True for rows to keep.
+        """
+        hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+        position = np.searchsorted(self._hashes, hashes)
+        position[position == len(self._hashes)] = 0
+        seen = (self._hashes[position] == hashes) if len(self._hashes) else np.zeros(len(hashes), dtype=bool)
+        keep = ~seen & ~pd.Series(hashes).duplicated().to_numpy()
+        new = np.sort(hashes[keep])
+        self._hashes = np.insert(self._hashes, np.searchsorted(self._hashes, new), new)
+        return keep
+
+class RunningSums:
+    """
+        Per-group running totals that chunks are folded into.
+    """
+
+    def __init__(self, group_columns, value_columns, totals=None):
+        self.group_columns = group_columns
+        self.value_columns = value_columns
+        self.totals = totals
+
+    def add(self, chunk):
+        if chunk.empty:
+            return
+        partial = chunk.groupby(self.group_columns, dropna=False)[self.value_columns].agg("sum")
+        partial["ROW_COUNT"] = chunk.groupby(self.group_columns, dropna=False).size()
+        self.totals = partial if self.totals is None else self.totals.add(partial, fill_value=0)
+
+    def frame(self):
+        if self.totals is None:
+            return pd.DataFrame(columns=self.group_columns + self.value_columns + ["ROW_COUNT"])
+        return self.totals.reset_index()
+
+def read_streaming(table, start, end):
+    """
+        Streams one extract in chunks and returns its per-(date, location) sums.
+        Keyed tables are read one business date at a time, each with its own SeenKeys, which is dropped when
+        the date is done; QC has no key and is read in one pass.
+        Args:
+            table (str): One of "sap", "rewinder", "qc".
+            start (date): First business date (inclusive).
+            end (date): Last business date (inclusive).
+        Returns: pd.DataFrame: Aggregated extract in the layout of the "aggregate" queries.
+    """
+    key_columns, _, value_columns = STREAM_LAYOUT[table]
+    if key_columns:
+        ranges = [(start + timedelta(days=i),) * 2 for i in range((end - start).days + 1)]
+    else:
+        ranges = [(start, end)]
+    sums = RunningSums(group_columns(table), value_columns)
+    size, rows, kept = chunk_rows(), 0, 0
+
+    with get_db_connection() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=size)
+        for first, last in ranges:
+            query, params = query_for(table, first, last, mode="rows")
+            seen = SeenKeys() if key_columns else None
+            for chunk in pd.read_sql(query, conn, params=params, chunksize=size):
+                rows += len(chunk)
+                if seen is not None:
+                    chunk = chunk[seen.filter_new(chunk[key_columns])]
+                chunk = stream_columns(table, chunk)
+                kept += len(chunk)
+                sums.add(chunk)
+
+    logging.info(f"Streamed {rows} {table} rows in chunks of {size}, {kept} kept after deduplication.")
+    return sums.frame()
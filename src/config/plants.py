@@ -0,0 +1,63 @@
+import json
+import os
+from src.config.settings import settings
+
+"""
+    Per-plant configuration.
+    Every pipeline module reads plant-specific values (WERKS, machine maps, PI tags, output paths) from the shared
+    settings object, so a plant is selected by applying its overrides to settings in the process that runs it.
+"""
+
+PLANT_KEYS = ("WERKS", "MACHINE_MAP_SAP", "MACHINE_MAP_REWINDER", "MACHINE_MAP_QC", "PI_TAGS")
+
+def load_plants(path=None):
+    """
+        Reads the plant definitions from settings.PLANTS_FILE.
+        Args: path (str | None): Plants file. Defaults to settings.PLANTS_FILE.
+        Returns: dict: Plant -> config dict, in file order. Empty when no plants file is configured.
+        Raises: ValueError: If a plant is missing one of PLANT_KEYS (WERKS defaults to the plant id).
+    """
+    path = path or settings.PLANTS_FILE
+    if not path:
+        return {}
+    with open(path) as f:
+        plants = json.load(f)
+    for plant, config in plants.items():
+        missing = [key for key in PLANT_KEYS if key != "WERKS" and key not in config]
+        if missing:
+            raise ValueError(f"Plant {plant!r} in {path} is missing {', '.join(missing)}")
+    return plants
+
+def plant_overrides(plant, config):
+    """
+        Settings overrides that select one plant: its SAP plant filter, machine maps, PI tags and output paths.
+        Args:
+            plant (str): Plant id, also the name of its directory under settings.PLANT_DATA_DIR.
+            config (dict): The plant's entry from load_plants().
+        Returns: dict: Settings attribute -> value.
+    """
+    root = os.path.join(settings.PLANT_DATA_DIR, str(plant))
+    return {
+        "PLANT": str(plant),
+        "WERKS": int(config.get("WERKS", plant)),
+        "MACHINE_MAP_SAP": dict(config["MACHINE_MAP_SAP"]),
+        "MACHINE_MAP_REWINDER": dict(config["MACHINE_MAP_REWINDER"]),
+        "MACHINE_MAP_QC": dict(config["MACHINE_MAP_QC"]),
+        "PI_TAGS": {machine: tuple(tags) for machine, tags in config["PI_TAGS"].items()},
+        "HISTORY_FILE": os.path.join(root, "daily_metrics_history.feather"),
+        "HISTORY_DIR": os.path.join(root, "history"),
+        "DERIVED_DIR": os.path.join(root, "derived"),
+        "GRAIN_DIR": os.path.join(root, "grains"),
+        "ANOMALY_DIR": os.path.join(root, "anomalies"),
+        "SUMMARY_FILE": os.path.join(root, "dashboard_summary.json"),
+        "ROLLUP_FILE": os.path.join(root, "rollups.json"),
+        "STATE_DIR": os.path.join(root, "state"),
+    }
+
+def apply_overrides(overrides):
+    """
+        Points the process-wide settings at one plant, given its plant_overrides().
+        Only call this in a process dedicated to that plant.
+    """
+    for name, value in overrides.items():
+        setattr(settings, name, value)
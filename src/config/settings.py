@@ -13,9 +13,133 @@ class Settings:
     DB_CONNECTION_STRING = os.getenv("DB_CONNECTION_STRING", "")
     PI_SERVER_ADDRESS = os.getenv("PI_SERVER_ADDRESS", "")
 
-    HISTORY_FILE = "data/daily_metrics_history.feather"
+    # Connection pool for the long-lived SQLAlchemy engine
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    # SAP plant filtered by the extract queries
+    WERKS = int(os.getenv("WERKS", "5000"))
+    # "rows" pulls projected raw rows; "aggregate" deduplicates and sums per location on the server;
+    # "stream" reads rows in bounded chunks and folds them into running sums client-side
+    INGEST_MODE = os.getenv("INGEST_MODE", "rows")
+    # Fetch, aggregate and upsert the history through Arrow tables instead of DataFrames; the other outputs are
+    # written from a pandas copy of the metrics grid (src/components/arrow_path.py)
+    ARROW_PATH = os.getenv("ARROW_PATH", "false").lower() == "true"
+    # Memory ceiling shared by the concurrently streaming extracts
+    INGEST_MEMORY_LIMIT_MB = int(os.getenv("INGEST_MEMORY_LIMIT_MB", "256"))
+
+    # Raw extract cache: one file per (mode, plant, table, business date). Dates older than the settle window are
+    # immutable once cached and never re-read; open dates are re-read only when their row count / max watermark changed
+    EXTRACT_CACHE = os.getenv("EXTRACT_CACHE", "true").lower() == "true"
+    EXTRACT_CACHE_DIR = "data/cache/extracts"
+    EXTRACT_CACHE_SETTLE_DAYS = int(os.getenv("EXTRACT_CACHE_SETTLE_DAYS", "3"))
+    # Eviction: least recently used entries beyond the size cap, and entries unused for longer than the age cap
+    EXTRACT_CACHE_MAX_MB = int(os.getenv("EXTRACT_CACHE_MAX_MB", "2048"))
+    EXTRACT_CACHE_MAX_AGE_DAYS = int(os.getenv("EXTRACT_CACHE_MAX_AGE_DAYS", "90"))
+
+    # Polling daemon: seconds between polls and the monotonic column used as each table's high-water mark
+    POLL_INTERVAL_SECONDS = int(os.getenv("POLL_INTERVAL_SECONDS", "60"))
+    WATERMARK_COLUMNS = {
+        "sap": os.getenv("WATERMARK_COLUMN_SAP", "TIMESTAMP1"),
+        "rewinder": os.getenv("WATERMARK_COLUMN_REWINDER", "TIMESTAMP1"),
+        "qc": os.getenv("WATERMARK_COLUMN_QC", "TIMESTAMP1"),
+    }
+    # Posting-time column (SAP TIMS, HHMMSS) of each table, e.g. UZEIT on MB51. Rows are bucketed by posting hour
+    # into the hour and shift grains. Off unless all three are set: the column names differ between SAP systems
+    POSTING_TIME_COLUMNS = {
+        "sap": os.getenv("POSTING_TIME_COLUMN_SAP", ""),
+        "rewinder": os.getenv("POSTING_TIME_COLUMN_REWINDER", ""),
+        "qc": os.getenv("POSTING_TIME_COLUMN_QC", ""),
+    }
+    # Shift calendar as name=start hour, in order through the business date; the last shift also takes the
+    # hours before the first shift starts
+    SHIFT_CALENDAR = os.getenv("SHIFT_CALENDAR", "A=6,B=14,C=22")
+    # Upper bound on SAP table extracts running at the same time
+    INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "3"))
+    # "threads" runs the SQL extracts concurrently and reads PI during compute; "async" also overlaps the PI
+    # connection, tag resolution and value reads with the extracts, each source bounded by SOURCE_TIMEOUTS
+    ORCHESTRATION = os.getenv("ORCHESTRATION", "threads")
+    # Seconds each source may take in async mode (0 = no limit). A PI timeout publishes with zero PI tonnage
+    SOURCE_TIMEOUTS = {
+        "sap": float(os.getenv("SOURCE_TIMEOUT_SAP", "600")),
+        "rewinder": float(os.getenv("SOURCE_TIMEOUT_REWINDER", "600")),
+        "qc": float(os.getenv("SOURCE_TIMEOUT_QC", "600")),
+        "pi": float(os.getenv("SOURCE_TIMEOUT_PI", "120")),
+    }
+
+    # Plants run by the scheduler. PLANTS_FILE points at a JSON object mapping plant -> {"WERKS", "MACHINE_MAP_SAP",
+    # "MACHINE_MAP_REWINDER", "MACHINE_MAP_QC", "PI_TAGS"}; each plant's outputs live under PLANT_DATA_DIR/<plant>.
+    # Without it the single plant configured in this class is run, with its outputs in the paths below.
+    PLANTS_FILE = os.getenv("PLANTS_FILE", "")
+    PLANT_DATA_DIR = "data/plants"
+    # Plant this process runs for, set from plant_overrides(); recorded on each run log record. Empty without plants
+    PLANT = ""
+    # Plants processed at the same time, each in its own process with its own DB pool
+    PLANT_MAX_WORKERS = int(os.getenv("PLANT_MAX_WORKERS", "2"))
+
+    HISTORY_FILE = "data/daily_metrics_history.feather"  # legacy single-file history, migrated into HISTORY_DIR
+    HISTORY_DIR = "data/history"
+    # Losses and shrinkage derived from the history by a versioned formula set (src/components/derived.py)
+    DERIVED_DIR = "data/derived"
+    DERIVED_FORMULA_VERSION = int(os.getenv("DERIVED_FORMULA_VERSION", "1"))
+    # Hour, shift and month aggregates, one partition directory per grain (the day grain is HISTORY_DIR)
+    GRAIN_DIR = "data/grains"
+    # Anomaly scores and flags per day and machine (src/components/anomalies.py). Each monitored metric is scored
+    # against running statistics of the earlier days: an EWMA (ANOMALY_EWMA_ALPHA), the last ANOMALY_WINDOW_DAYS
+    # days and quartile sketches. A day is flagged when its ANOMALY_SCORE ("z", "ewma_z" or "robust_z") exceeds
+    # ANOMALY_Z_THRESHOLD in absolute value, once ANOMALY_MIN_DAYS days have been seen
+    ANOMALY_DIR = "data/anomalies"
+    ANOMALY_METRICS = os.getenv("ANOMALY_METRICS", "Qc_Rejection,Total_Loss,Shrinkage_Percent").split(",")
+    ANOMALY_SCORE = os.getenv("ANOMALY_SCORE", "ewma_z")
+    ANOMALY_EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", "0.1"))
+    ANOMALY_WINDOW_DAYS = int(os.getenv("ANOMALY_WINDOW_DAYS", "30"))
+    ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3.0"))
+    ANOMALY_MIN_DAYS = int(os.getenv("ANOMALY_MIN_DAYS", "14"))
+    # Copies of the statistics kept per machine, one every ANOMALY_WINDOW_DAYS; a correction to an earlier day
+    # replays from the last copy before it (from the first day when it predates them all)
+    ANOMALY_CHECKPOINTS = int(os.getenv("ANOMALY_CHECKPOINTS", "12"))
     SUMMARY_FILE = "data/dashboard_summary.json"
+    ROLLUP_FILE = "data/rollups.json"
+    STATE_DIR = "data/state"
+    # Seconds a writer waits for STATE_DIR/outputs.lock, held by whichever of the scheduler, the polling daemon and
+    # the PI repair is writing the outputs
+    OUTPUT_LOCK_TIMEOUT_SECONDS = int(os.getenv("OUTPUT_LOCK_TIMEOUT_SECONDS", "600"))
+    # Per-run stage metrics: JSON-lines run log and node_exporter textfiles
+    METRICS_DIR = "data/metrics"
+    RUN_LOG_FILE = "data/metrics/run_log.jsonl"
+    # Seconds between resident-memory samples while a stage runs
+    RSS_SAMPLE_SECONDS = float(os.getenv("RSS_SAMPLE_SECONDS", "0.05"))
+    # History column summed into the daily/monthly/rolling broke figures
+    BROKE_METRIC = os.getenv("BROKE_METRIC", "Qc_Rejection")
     LOG_DIR = "tests/logs"
+    # One log file per entry point (LOG_NAME by default), written by a background thread and rotated by
+    # time (LOG_ROTATE_WHEN) or size (LOG_MAX_MB), keeping LOG_BACKUP_COUNT old files. LOG_FORMAT: "text" or "json".
+    LOG_NAME = os.getenv("LOG_NAME", "activeqc")
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    LOG_ROTATION = os.getenv("LOG_ROTATION", "time")
+    LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+    LOG_MAX_MB = int(os.getenv("LOG_MAX_MB", "50"))
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "14"))
+
+    # Hour of the following morning at which the PI day tonnage totalisers close
+    PI_DAY_END_HOUR = int(os.getenv("PI_DAY_END_HOUR", "6"))
+    # Upper bound on concurrent PI value reads
+    PI_MAX_WORKERS = int(os.getenv("PI_MAX_WORKERS", "8"))
+    # PI cells that could not be read are queued in STATE_DIR and retried with exponential backoff
+    PI_REPAIR_BACKOFF_SECONDS = int(os.getenv("PI_REPAIR_BACKOFF_SECONDS", "300"))
+    PI_REPAIR_MAX_BACKOFF_SECONDS = int(os.getenv("PI_REPAIR_MAX_BACKOFF_SECONDS", "21600"))
+    PI_REPAIR_MAX_ATTEMPTS = int(os.getenv("PI_REPAIR_MAX_ATTEMPTS", "12"))
+    # Local PI value cache (src/utils/pi_cache.py): per-tag recorded values filled by range reads. Each cell reads
+    # the PI_CACHE_LOOKBACK_HOURS before its timestamp, ranges are read in chunks of at most PI_CACHE_FETCH_DAYS,
+    # and values newer than PI_CACHE_SETTLE_MINUTES are read live. PI_TIMEZONE is the zone of naive PI timestamps.
+    PI_CACHE = os.getenv("PI_CACHE", "true").lower() == "true"
+    PI_CACHE_DIR = "data/cache/pi"
+    PI_CACHE_LOOKBACK_HOURS = int(os.getenv("PI_CACHE_LOOKBACK_HOURS", "24"))
+    PI_CACHE_FETCH_DAYS = int(os.getenv("PI_CACHE_FETCH_DAYS", "31"))
+    PI_CACHE_SETTLE_MINUTES = int(os.getenv("PI_CACHE_SETTLE_MINUTES", "60"))
+    PI_TIMEZONE = os.getenv("PI_TIMEZONE", "UTC")
 
     MACHINE_MAP_SAP = {'PM1': 'PM1', 'PM3': 'PM3', 'PM4': 'PM4'}
     MACHINE_MAP_REWINDER = {'01': 'PM1', '03': 'PM3', '04': 'PM4'}
@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+from src.components.fetch_output import write_outputs
+from src.components.ingestion import prepare_sap, prepare_rewinder, prepare_qc
+from src.components.pi_repair import repair_pi_cells
+from src.components.processing import compute_metrics
+from src.components.queries import query_for
+from src.components.streaming import STREAM_LAYOUT, RunningSums, SeenKeys, group_columns, stream_columns
+from src.config.plants import apply_overrides, load_plants, plant_overrides
+from src.config.settings import settings
+from src.utils.db import get_db_connection
+from src.utils.exception import CustomException
+from src.utils.history_store import atomic_write_feather, atomic_write_json, atomic_write_npy
+from src.utils.instrumentation import pipeline_run, stage
+from src.utils.logger import logging, setup_logger
+from src.utils.pi import get_pi_server
+
+"""
+    Incremental polling daemon for the current business day.
+    Each poll reads only the rows past the per-table high-water marks (settings.WATERMARK_COLUMNS), folds them
+    into the day's running per-location sums, recomputes the day's metrics from those sums and republishes them.
+    Watermarks, sums and seen keys are persisted under settings.STATE_DIR so a restart resumes where it left off.
+    SAP and rewinder rows are read from their watermark inclusive and deduplicated on their keys; QC rows have no
+    key and are read strictly past it (see queries.build_delta_query).
+"""
+
+PREPARE = {"sap": prepare_sap, "rewinder": prepare_rewinder, "qc": prepare_qc}
+# Layout of poller.json and its state files; bump it when either changes, and older states are discarded on load
+STATE_FORMAT = 1
+
+def _encode_watermark(value):
+    if value is None:
+        return None
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return {"type": "datetime", "value": pd.Timestamp(value).isoformat()}
+    if isinstance(value, (int, np.integer)):
+        return {"type": "int", "value": int(value)}
+    return {"type": "str", "value": str(value)}
+
+def _decode_watermark(encoded):
+    if encoded is None:
+        return None
+    if encoded["type"] == "datetime":
+        return pd.Timestamp(encoded["value"]).to_pydatetime()
+    return encoded["value"]
+
+class IncrementalPoller:
+    """
+        Keeps the current business day's per-table high-water marks and running aggregates.
+    """
+
+    def __init__(self, business_date, watermarks=None, seen=None, sums=None, generation=0):
+        self._reset(business_date)
+        self.watermarks.update(watermarks or {})
+        self.seen.update(seen or {})
+        self.sums.update(sums or {})
+        self.generation = generation
+
+    def _reset(self, business_date):
+        self.business_date = business_date
+        self.watermarks = {table: None for table in STREAM_LAYOUT}
+        self.seen = {table: SeenKeys() for table, layout in STREAM_LAYOUT.items() if layout[0]}
+        self.sums = {table: RunningSums(group_columns(table), layout[2]) for table, layout in STREAM_LAYOUT.items()}
+
+    @staticmethod
+    def _path(name):
+        return os.path.join(settings.STATE_DIR, name)
+
+    @classmethod
+    def load(cls, today=None):
+        """
+            Restores the persisted poller state, or starts a fresh one for today when none exists.
+            A state left over from an earlier day is closed out by the next poll(); a state in another
+            STATE_FORMAT, or one that cannot be read, restarts its day from scratch, which re-reads every row of it.
+        """
+        state_file = cls._path("poller.json")
+        if not os.path.exists(state_file):
+            return cls(today or date.today())
+        try:
+            with open(state_file) as f:
+                state = json.load(f)
+            business_date = date.fromisoformat(state["business_date"])
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Unreadable poller state ({e}), starting afresh.")
+            return cls(today or date.today())
+        if state.get("format") != STATE_FORMAT:
+            logging.warning(f"Poller state is in another format, restarting {business_date}.")
+            return cls(business_date)
+        try:
+            return cls._restore(state, business_date)
+        except (OSError, ValueError, EOFError, KeyError) as e:
+            logging.warning(f"Unreadable poller state files ({e}), restarting {business_date}.")
+            return cls(business_date)
+
+    @classmethod
+    def _restore(cls, state, business_date):
+        watermarks = {table: _decode_watermark(value) for table, value in state["watermarks"].items()}
+        seen = {table: SeenKeys(np.load(cls._path(name))) for table, name in state["seen"].items()}
+        sums = {}
+        for table, (_, _, value_columns) in STREAM_LAYOUT.items():
+            groups = group_columns(table)
+            totals = pd.read_feather(cls._path(state["sums"][table])) if table in state["sums"] else None
+            sums[table] = RunningSums(groups, value_columns, None if totals is None else totals.set_index(groups))
+        return cls(business_date, watermarks, seen, sums, state["generation"])
+
+    def save(self):
+        """
+            Persists the state. Seen keys and sums go to files named after a new generation, and poller.json,
+            replaced last, switches to them in one atomic step: a crash at any point leaves the previous
+            generation's watermarks, sums and seen keys together.
+        """
+        generation = self.generation + 1
+        seen_files = {table: f"poller_{table}_seen.{generation}.npy" for table in self.seen}
+        sum_files = {table: f"poller_{table}.{generation}.feather" for table, sums in self.sums.items()
+                     if sums.totals is not None}
+        for table, name in seen_files.items():
+            atomic_write_npy(self.seen[table].hashes, self._path(name))
+        for table, name in sum_files.items():
+            atomic_write_feather(self.sums[table].frame(), self._path(name))
+        atomic_write_json({
+            "format": STATE_FORMAT,
+            "business_date": self.business_date.isoformat(),
+            "generation": generation,
+            "watermarks": {table: _encode_watermark(value) for table, value in self.watermarks.items()},
+            "seen": seen_files,
+            "sums": sum_files,
+        }, self._path("poller.json"))
+        self.generation = generation
+        current = set(seen_files.values()) | set(sum_files.values())
+        for name in os.listdir(settings.STATE_DIR):
+            if name.startswith("poller_") and name.endswith((".npy", ".feather")) and name not in current:
+                os.remove(self._path(name))
+
+    def _fetch_delta(self, table):
+        query, params = query_for(table, self.business_date, self.business_date, mode="delta", watermark=self.watermarks[table])
+        with get_db_connection() as conn:
+            return pd.read_sql(query, conn, params=params)
+
+    def _apply(self, table, rows):
+        if rows.empty:
+            return 0
+        self.watermarks[table] = rows["WATERMARK"].max()
+        rows = rows.drop(columns="WATERMARK")
+        if table in self.seen:
+            rows = rows[self.seen[table].filter_new(rows[STREAM_LAYOUT[table][0]])]
+        self.sums[table].add(stream_columns(table, rows))
+        return len(rows)
+
+    def poll_deltas(self):
+        """
+            Reads every table's rows past its watermark and folds them into the running sums.
+            Returns: int: Number of new rows applied.
+        """
+        with stage("poll") as record:
+            with ThreadPoolExecutor(max_workers=settings.INGEST_MAX_WORKERS, thread_name_prefix="poll") as pool:
+                deltas = dict(zip(STREAM_LAYOUT, pool.map(self._fetch_delta, STREAM_LAYOUT)))
+            record.rows_in = sum(len(rows) for rows in deltas.values())
+            applied = sum(self._apply(table, rows) for table, rows in deltas.items())
+            record.rows_out = applied
+        logging.info(f"Polled {self.business_date}: {applied} new rows, watermarks {self.watermarks}.")
+        return applied
+
+    def publish(self, open_day=None):
+        """
+            Recomputes the day's metrics from the running sums and upserts them.
+            Only the business day's rows are written: its history, derived and hour/shift rows, its anomaly scores
+            and rollup delta, and, while the day is open, the difference it makes to its month-grain row.
+            Args: open_day (date | None): The business day when it is still being posted to.
+        """
+        frames = {f"{table}_df": PREPARE[table](self.sums[table].frame()) for table in STREAM_LAYOUT}
+        data = {
+            **frames,
+            "pi_server": get_pi_server(),
+            "date": datetime.combine(self.business_date, datetime.min.time()),
+            "start_date": self.business_date,
+            "end_date": self.business_date,
+        }
+        metrics_df, summary = compute_metrics(data)
+        write_outputs(metrics_df, summary, data.get("hourly_sums"), open_day)
+
+    def poll(self, today=None):
+        """
+            One polling cycle: closes out the previous day on rollover, then applies and republishes today's deltas.
+        """
+        today = today or date.today()
+        if today != self.business_date:
+            self.poll_deltas()
+            self.save()
+            self.publish()
+            logging.info(f"Business day {self.business_date} closed by the poller.")
+            self._reset(today)
+        self.poll_deltas()
+        self.save()
+        self.publish(open_day=self.business_date)
+
+def run_polling_daemon(interval=None, once=False, run_name="poll"):
+    """
+        Polls SAP for new rows every `interval` seconds and republishes the current day's metrics.
+        Args:
+            interval (int | None): Seconds between polls. Defaults to settings.POLL_INTERVAL_SECONDS.
+            once (bool): Run a single poll and return.
+            run_name (str): Name the polls are recorded under in the run log and metrics textfile.
+    """
+    interval = interval or settings.POLL_INTERVAL_SECONDS
+    poller = IncrementalPoller.load()
+    logging.info(f"Polling daemon started for {poller.business_date}, interval {interval}s.")
+    while True:
+        try:
+            with pipeline_run(run_name):
+                poller.poll()
+                repair_pi_cells()
+        except Exception as e:
+            logging.error(str(CustomException(e, sys)))
+        if once:
+            break
+        time.sleep(interval)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ActiveQC incremental polling daemon.")
+    parser.add_argument("--interval", type=int, help="Seconds between polls.")
+    parser.add_argument("--once", action="store_true", help="Run a single poll and exit.")
+    parser.add_argument("--plant", help="Plant from settings.PLANTS_FILE to poll; run one daemon per plant.")
+    args = parser.parse_args()
+    setup_logger(name=f"daemon_{args.plant}" if args.plant else "daemon")
+    if args.plant:
+        plants = load_plants()
+        if args.plant not in plants:
+            parser.error(f"Unknown plant {args.plant!r}; configured plants: {', '.join(plants) or 'none'}")
+        apply_overrides(plant_overrides(args.plant, plants[args.plant]))
+    run_polling_daemon(args.interval, args.once, f"poll_{args.plant}" if args.plant else "poll")
@@ -1,10 +1,119 @@
-from src.components.ingestion import fetch_all_data
-from src.components.processing import compute_metrics
-from src.components.fetch_output import write_outputs
-from src.utils.logger import logging
+from src.config.plants import apply_overrides, load_plants, plant_overrides
+from src.config.settings import settings
+from src.utils.logger import logging, process_log_queue, setup_logger, setup_worker_logger
 from src.utils.exception import CustomException
+from src.utils.instrumentation import pipeline_run
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import multiprocessing
 import sys
 
+"""
+    Pipeline entry points. The pandas / SQLAlchemy-heavy components are imported inside each run so that
+    importing this module (e.g. from the dashboard or for --help) stays cheap.
+    With a plants file configured (settings.PLANTS_FILE) every run fans the plants out across a process pool
+    and merges their summaries into the cross-plant summary; otherwise the single configured plant runs in-process.
+"""
+
+def _run(run_name, start_date=None, end_date=None):
+    from src.components.ingestion import fetch_all_data, fetch_all_data_async
+    from src.components.processing import compute_metrics
+    from src.components.fetch_output import write_outputs
+    from src.components.pi_repair import repair_pi_cells
+    fetch = fetch_all_data_async if settings.ORCHESTRATION == "async" else fetch_all_data
+    if settings.ARROW_PATH:
+        from src.components.arrow_path import compute_metrics_arrow as compute_metrics, fetch_all_arrow as fetch
+    with pipeline_run(run_name):
+        raw_data = fetch(start_date, end_date)
+        metrics_df, summary = compute_metrics(raw_data)
+        summary = write_outputs(metrics_df, summary, raw_data.get("hourly_sums"))
+        # Retry earlier unread PI cells that are due; only those values are re-read
+        summary = repair_pi_cells() or summary
+    return metrics_df, summary
+
+def run_pi_repair():
+    """
+        Re-reads only the queued PI cells that are due, for every configured plant, and patches them in place.
+    """
+    from src.components.pi_repair import repair_pi_cells
+    try:
+        plants = load_plants()
+        for plant, config in (plants or {None: None}).items():
+            if plant is not None:
+                apply_overrides(plant_overrides(plant, config))
+            with pipeline_run(f"pi_repair_{plant}" if plant else "pi_repair"):
+                repair_pi_cells()
+    except Exception as e:
+        err = CustomException(e, sys)
+        logging.error(str(err))
+        raise err
+
+def run_plant_pipeline(plant, overrides, run_name, start_date=None, end_date=None):
+    """
+        Process-pool worker: runs one plant end to end with its settings applied. Its log records go to the
+        parent's log file through the pool initializer (setup_worker_logger).
+        Args:
+            plant (str): Plant id.
+            overrides (dict): The plant's plant_overrides(), computed by the parent.
+            run_name (str): "daily" or "backfill"; the run is recorded as <run_name>_<plant>.
+            start_date (date | str | None): First business date (inclusive).
+            end_date (date | str | None): Last business date (inclusive).
+        Returns: dict: The plant's summary as written.
+        Raises: RuntimeError: If the plant's run fails. CustomException cannot cross the process boundary.
+    """
+    apply_overrides(overrides)
+    try:
+        metrics_df, summary = _run(f"{run_name}_{plant}", start_date, end_date)
+        logging.info(f"Plant {plant}: {len(metrics_df)} rows written.")
+        return summary
+    except Exception as e:
+        err = CustomException(e, sys)
+        logging.error(f"Plant {plant}: {err}")
+        raise RuntimeError(str(err)) from None
+
+def run_plants_pipeline(run_name, start_date=None, end_date=None, plants=None):
+    """
+        Runs every plant in its own process, at most settings.PLANT_MAX_WORKERS at a time so the shared
+        database sees a bounded number of concurrent extracts, then writes the cross-plant summary.
+        A failing plant does not stop the others; its last summary entry is kept.
+        Args:
+            run_name (str): "daily" or "backfill".
+            start_date (date | str | None): First business date (inclusive). Defaults to yesterday.
+            end_date (date | str | None): Last business date (inclusive). Defaults to start_date.
+            plants (dict | None): Plant -> config. Defaults to load_plants().
+        Returns: dict: Plant -> summary for the plants that succeeded.
+        Raises: RuntimeError: If any plant failed, after the others have been written.
+    """
+    from src.components.ingestion import resolve_date_range
+    from src.components.fetch_output import write_plant_summary
+    plants = plants or load_plants()
+    start, end = resolve_date_range(start_date, end_date)
+    workers = max(1, min(settings.PLANT_MAX_WORKERS, len(plants)))
+    logging.info(f"Running {len(plants)} plants for {start} to {end} on {workers} processes.")
+
+    summaries, failed = {}, []
+    # spawn: workers must not inherit pooled DB connections, PI handles or threads from the parent
+    context = multiprocessing.get_context("spawn")
+    with process_log_queue(context) as log_queue, ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=setup_worker_logger, initargs=(log_queue,),
+    ) as pool:
+        futures = {
+            pool.submit(run_plant_pipeline, plant, plant_overrides(plant, config), run_name, start, end): plant
+            for plant, config in plants.items()
+        }
+        for future in as_completed(futures):
+            plant = futures[future]
+            try:
+                summaries[plant] = future.result()
+            except Exception as e:
+                failed.append(plant)
+                logging.error(f"Plant {plant} failed: {e}")
+
+    write_plant_summary(summaries)
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(plants)} plants failed: {', '.join(sorted(failed))}")
+    return summaries
+
 def run_daily_pipeline():
     """
         Main function to run the daily ETL pipeline.
@@ -12,14 +121,52 @@ def run_daily_pipeline():
     """
     try:
         logging.info("Scheduled ETL run started.")
-        raw_data = fetch_all_data()
-        metrics_df, summary = compute_metrics(raw_data)
-        write_outputs(metrics_df, summary)
+        plants = load_plants()
+        if plants:
+            run_plants_pipeline("daily", plants=plants)
+        else:
+            _run("daily")
         logging.info("Scheduled ETL run completed successfully.")
     except Exception as e:
         err = CustomException(e, sys)
         logging.error(str(err))
         raise err
 
+def run_backfill_pipeline(start_date, end_date):
+    """
+        Rebuild history for every business date between start_date and end_date (inclusive).
+        Each source table is pulled once for the whole range and all (date, machine) rows are computed in one pass.
+        Args:
+            start_date (date | str): First business date, ISO formatted when given as a string.
+            end_date (date | str): Last business date, ISO formatted when given as a string.
+    """
+    try:
+        logging.info(f"Backfill ETL run started for {start_date} to {end_date}.")
+        plants = load_plants()
+        if plants:
+            summaries = run_plants_pipeline("backfill", start_date, end_date, plants)
+            logging.info(f"Backfill ETL run completed successfully for {len(summaries)} plants.")
+        else:
+            metrics_df, _ = _run("backfill", start_date, end_date)
+            logging.info(f"Backfill ETL run completed successfully: {len(metrics_df)} rows written.")
+    except Exception as e:
+        err = CustomException(e, sys)
+        logging.error(str(err))
+        raise err
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ActiveQC ETL pipeline.")
+    parser.add_argument("--start", help="Backfill start date (YYYY-MM-DD). Omit for the daily run.")
+    parser.add_argument("--end", help="Backfill end date (YYYY-MM-DD). Defaults to --start.")
+    parser.add_argument("--repair-pi", action="store_true", help="Only retry queued PI cells that are due.")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    run_daily_pipeline()
+    args = parse_args()
+    setup_logger(name="scheduler")
+    if args.repair_pi:
+        run_pi_repair()
+    elif args.start:
+        run_backfill_pipeline(args.start, args.end or args.start)
+    else:
+        run_daily_pipeline()
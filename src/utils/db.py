@@ -1,19 +1,59 @@
-from sqlalchemy import create_engine # type: ignore
+import threading
 from src.config.settings import settings
 from src.utils.logger import logging
 
 """
-    Establishes a connection to the database.
-    Returns:
-        Connection object to interact with the database.
-    Raises:
-        Exception: If the connection fails, an exception is raised with the error details.
+    Process-wide SQLAlchemy engine registry.
+    Engines are created once per connection string and reused, so connection pooling, dialect setup and
+    the TDS handshake are paid only on first use instead of on every scheduled run. SQLAlchemy itself is
+    imported on first use, so importing this module stays cheap.
 """
 
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_engine(connection_string=None):
+    """
+        Returns the long-lived engine for a connection string, creating it on first use.
+        Args:
+            connection_string (str | None): Defaults to settings.DB_CONNECTION_STRING.
+        Returns:
+            Engine: Pooled SQLAlchemy engine configured from the DB_POOL_* settings.
+    """
+    url = connection_string or settings.DB_CONNECTION_STRING
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            from sqlalchemy import create_engine # type: ignore
+            engine = create_engine(
+                url,
+                pool_size=settings.DB_POOL_SIZE,
+                max_overflow=settings.DB_MAX_OVERFLOW,
+                pool_recycle=settings.DB_POOL_RECYCLE,
+                pool_pre_ping=settings.DB_POOL_PRE_PING,
+            )
+            _engines[url] = engine
+        return engine
+
+def dispose_engines():
+    """
+        Closes every pooled connection and forgets the engines, e.g. after a fork or a credentials change.
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
 def get_db_connection():
+    """
+        Establishes a connection to the database.
+        Returns:
+            Connection object to interact with the database, checked out from the shared pool.
+        Raises:
+            Exception: If the connection fails, an exception is raised with the error details.
+    """
     try:
-        engine = create_engine(settings.DB_CONNECTION_STRING)
-        return engine.connect()
+        return get_engine().connect()
     except Exception as e:
         logging.error(f"Error establishing database connection: {e}")
         raise
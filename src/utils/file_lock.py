@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from src.config.settings import settings
+from src.utils.logger import logging
+
+"""
+    Inter-process lock over the outputs (history, derived metrics, grains, anomaly scores, rollups, PI repair queue
+    and summary). The scheduler, the polling daemon, the PI repair and the rebuild commands each read and rewrite
+    parts of them; holding STATE_DIR/outputs.lock makes those read-modify-write cycles take turns. The lock is an
+    OS file lock, so it is released when its holder dies, and re-entrant within a process.
+"""
+
+_local = threading.local()
+_thread_lock = threading.Lock()
+
+def _try_lock(f):
+    if os.name == "nt":
+        import msvcrt
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    import fcntl
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+def _unlock(f):
+    if os.name == "nt":
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def output_lock(timeout=None):
+    """
+        Holds the outputs lock of the current settings.STATE_DIR (one per plant).
+        Args: timeout (float | None): Seconds to wait. Defaults to settings.OUTPUT_LOCK_TIMEOUT_SECONDS.
+        Raises: TimeoutError: If another writer holds the lock for longer.
+    """
+    if getattr(_local, "depth", 0):
+        _local.depth += 1
+        try:
+            yield
+        finally:
+            _local.depth -= 1
+        return
+    timeout = settings.OUTPUT_LOCK_TIMEOUT_SECONDS if timeout is None else timeout
+    path = os.path.join(settings.STATE_DIR, "outputs.lock")
+    os.makedirs(settings.STATE_DIR, exist_ok=True)
+    deadline = time.monotonic() + timeout
+    # Threads of one process share its file locks; they queue on the thread lock first
+    if not _thread_lock.acquire(timeout=timeout):
+        raise TimeoutError(f"Timed out after {timeout}s waiting for {path}")
+    try:
+        with open(path, "a+b") as f:
+            waited = False
+            while not _try_lock(f):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out after {timeout}s waiting for {path}")
+                if not waited:
+                    logging.info(f"Waiting for another writer to release {path}.")
+                    waited = True
+                time.sleep(0.1)
+            _local.depth = 1
+            try:
+                yield
+            finally:
+                _local.depth = 0
+                _unlock(f)
+    finally:
+        _thread_lock.release()
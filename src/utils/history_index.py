@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+from src.utils.history_store import read_history_table
+
+"""
+    In-memory query index over the history.
+    Rows are kept sorted by (machine_id, calculation_date) so each machine is one contiguous block, and every
+    metric has a per-machine running total. A date-range total is then two binary searches and a subtraction,
+    and a date-range slice is a positional slice of the sorted frame, independent of how long the history is.
+"""
+
+class HistoryIndex:
+    """
+        Read-only history index built once per history version and shared by every dashboard query.
+    """
+
+    def __init__(self, df, metrics):
+        self.metrics = [m for m in metrics if m in df.columns]
+        df = df.assign(machine_id=df["machine_id"].astype(str))
+        self.frame = df.sort_values(["machine_id", "calculation_date"], kind="stable").reset_index(drop=True)
+
+        machines = self.frame["machine_id"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, machines[1:] != machines[:-1]]) if len(machines) else np.array([], dtype=int)
+        stops = np.r_[starts[1:], len(machines)]
+        self._blocks = {machines[s]: (int(s), int(e)) for s, e in zip(starts, stops)}
+        self._days = pd.to_datetime(self.frame["calculation_date"]).to_numpy().astype("datetime64[D]")
+
+        # Inclusive running totals restarting at each machine block; accumulated in float64
+        values = pd.DataFrame(self.frame[self.metrics].to_numpy(dtype="float64"), columns=self.metrics)
+        self._cumsum = values.groupby(machines, sort=False).cumsum().to_numpy()
+
+    @classmethod
+    def load(cls, metrics, root=None, columns=()):
+        """
+            Builds the index from the persisted history. Partitions are memory-mapped and converted to one DataFrame
+            in a single pass (no per-partition frames), releasing each Arrow column as it is converted.
+            Args:
+                metrics (list): Metric columns to index.
+                root (str | None): Partition directory. Defaults to settings.HISTORY_DIR.
+                columns (iterable): Further columns to carry in the rows but not total (e.g. buckets, percentages).
+        """
+        table = read_history_table(columns=list(metrics) + list(columns), root=root)
+        return cls(table.to_pandas(split_blocks=True, self_destruct=True), metrics)
+
+    @property
+    def empty(self):
+        return self.frame.empty
+
+    def machines(self):
+        return sorted(self._blocks)
+
+    def _span(self, machine, start_date=None, end_date=None):
+        """
+            Positional [first, stop) span of a machine's rows between two dates (inclusive), by binary search.
+        """
+        if machine not in self._blocks:
+            return 0, 0
+        first, stop = self._blocks[machine]
+        days = self._days[first:stop]
+        lo = first if start_date is None else first + int(np.searchsorted(days, np.datetime64(start_date, "D"), "left"))
+        hi = stop if end_date is None else first + int(np.searchsorted(days, np.datetime64(end_date, "D"), "right"))
+        return lo, max(lo, hi)
+
+    def rows(self, machine, start_date=None, end_date=None):
+        """
+            A machine's rows between two dates (inclusive), as a positional slice of the sorted frame (no row copy).
+        """
+        lo, hi = self._span(machine, start_date, end_date)
+        return self.frame.iloc[lo:hi]
+
+    def totals(self, machine, start_date=None, end_date=None):
+        """
+            Sum of every indexed metric over a machine's rows between two dates (inclusive).
+            Returns: pd.Series: Metric -> total.
+        """
+        lo, hi = self._span(machine, start_date, end_date)
+        if hi == lo:
+            return pd.Series(0.0, index=self.metrics)
+        before = self._cumsum[lo - 1] if lo > self._blocks[machine][0] else 0.0
+        return pd.Series(self._cumsum[hi - 1] - before, index=self.metrics)
@@ -0,0 +1,313 @@
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from src.config.settings import settings
+from src.utils.instrumentation import add_bytes_read, add_bytes_written
+from src.utils.logger import logging
+
+"""
+    Month-partitioned metrics history.
+    Each calendar month lives in its own feather file under settings.HISTORY_DIR, named YYYY-MM.feather.
+    Writes are upserts keyed on (calculation_date, machine_id): only the partitions touched by the new rows
+    are rewritten, and every file is replaced atomically so readers never see a half-written partition.
+    upsert_history / read_history work on DataFrames; upsert_history_table / read_history_table are their
+    Arrow counterparts for the Arrow path (settings.ARROW_PATH), which never build an intermediate DataFrame.
+"""
+
+KEY_COLUMNS = ["calculation_date", "machine_id"]
+
+def atomic_write_feather(df, path):
+    """
+        Writes a DataFrame or Arrow table to a feather file via a temporary file and an atomic rename.
+        Args:
+            df (pd.DataFrame | pa.Table): The DataFrame or table to write.
+            path (str): Destination file path.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(df, pd.DataFrame):
+                df.reset_index(drop=True).to_feather(f)
+            else:
+                import pyarrow.feather as feather # type: ignore
+                feather.write_feather(df.unify_dictionaries().combine_chunks(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        add_bytes_written(os.path.getsize(tmp_path))
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def atomic_write_json(obj, path):
+    """
+        Writes a JSON document via a temporary file and an atomic rename.
+        Args:
+            obj (dict): The object to serialise.
+            path (str): Destination file path.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(obj, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        add_bytes_written(os.path.getsize(tmp_path))
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def atomic_write_npy(array, path):
+    """
+        Writes a NumPy array to a .npy file via a temporary file and an atomic rename.
+        Args:
+            array (np.ndarray): The array to write.
+            path (str): Destination file path.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+            f.flush()
+            os.fsync(f.fileno())
+        add_bytes_written(os.path.getsize(tmp_path))
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def partition_path(month, root=None):
+    """
+        Returns the partition file for a month key (YYYY-MM).
+    """
+    return os.path.join(root or settings.HISTORY_DIR, f"{month}.feather")
+
+def list_partitions(root=None):
+    """
+        Returns the sorted month keys (YYYY-MM) that have a partition on disk.
+    """
+    root = root or settings.HISTORY_DIR
+    if not os.path.isdir(root):
+        return []
+    return sorted(name[:-len(".feather")] for name in os.listdir(root) if name.endswith(".feather"))
+
+def history_version(root=None):
+    """
+        Returns a cheap fingerprint of the partition files (name, size, mtime) that changes whenever any partition is rewritten.
+    """
+    root = root or settings.HISTORY_DIR
+    version = []
+    for month in list_partitions(root):
+        stat = os.stat(partition_path(month, root))
+        version.append((month, stat.st_size, stat.st_mtime_ns))
+    return tuple(version)
+
+def _read_partition_table(path, columns=None, memory_map=True):
+    import pyarrow.feather as feather # type: ignore
+    add_bytes_read(os.path.getsize(path))
+    return feather.read_table(path, columns=columns, memory_map=memory_map)
+
+def _read_partition(path, columns=None):
+    return _read_partition_table(path, columns).to_pandas()
+
+def _month_keys(dates):
+    return pd.to_datetime(pd.Series(dates)).dt.strftime("%Y-%m")
+
+def _normalise_dates(df):
+    df = df.copy()
+    df["calculation_date"] = pd.to_datetime(df["calculation_date"]).dt.date
+    return df
+
+def _concat_keep_categories(frames):
+    """
+        Concatenates frames and restores categorical columns whose categories differed between inputs.
+    """
+    df = pd.concat(frames, ignore_index=True)
+    for column in df.columns:
+        if any(isinstance(f[column].dtype, pd.CategoricalDtype) for f in frames if column in f.columns):
+            df[column] = df[column].astype("category")
+    return df
+
+def migrate_legacy_history(root=None):
+    """
+        Splits the legacy single-file history (settings.HISTORY_FILE) into monthly partitions.
+        Runs only when the partition directory does not exist yet; unreadable legacy files are skipped.
+    """
+    root = root or settings.HISTORY_DIR
+    if os.path.isdir(root) or not os.path.exists(settings.HISTORY_FILE):
+        return
+    try:
+        legacy = pd.read_feather(settings.HISTORY_FILE)
+    except Exception as e:
+        logging.warning(f"Legacy history file {settings.HISTORY_FILE} could not be read, not migrating: {e}")
+        return
+    os.makedirs(root, exist_ok=True)
+    if not legacy.empty:
+        legacy = _normalise_dates(legacy).drop_duplicates(subset=KEY_COLUMNS, keep="last")
+        for month, part in legacy.groupby(_month_keys(legacy["calculation_date"]).values):
+            atomic_write_feather(part.sort_values(KEY_COLUMNS), partition_path(month, root))
+    logging.info(f"Migrated {len(legacy)} legacy history rows into {root}.")
+
+def upsert_history(df, root=None, keys=None):
+    """
+        Inserts or replaces rows keyed on (calculation_date, machine_id), rewriting only the affected months.
+        Args:
+            df (pd.DataFrame): Rows to upsert. Must contain the key columns.
+            root (str | None): Partition directory. Defaults to settings.HISTORY_DIR.
+            keys (list | None): Key columns, starting with calculation_date. Defaults to KEY_COLUMNS.
+        Returns: pd.DataFrame: The previously stored rows that were replaced (empty if all rows were new).
+    """
+    root = root or settings.HISTORY_DIR
+    keys = keys or KEY_COLUMNS
+    if root == settings.HISTORY_DIR:
+        migrate_legacy_history(root)
+    if df.empty:
+        return pd.DataFrame(columns=df.columns)
+    df = _normalise_dates(df).drop_duplicates(subset=keys, keep="last")
+
+    previous = []
+    for month, new_rows in df.groupby(_month_keys(df["calculation_date"]).values):
+        path = partition_path(month, root)
+        if os.path.exists(path):
+            old_rows = _read_partition(path)
+            replaced = pd.MultiIndex.from_frame(old_rows[keys]).isin(pd.MultiIndex.from_frame(new_rows[keys]))
+            previous.append(old_rows[replaced])
+            new_rows = _concat_keep_categories([old_rows[~replaced], new_rows])
+        atomic_write_feather(new_rows.sort_values(keys), path)
+        logging.info(f"History partition {month} written with {len(new_rows)} rows.")
+    return pd.concat(previous, ignore_index=True) if previous else pd.DataFrame(columns=df.columns)
+
+def _row_keys(table):
+    """
+        One "date|machine" string per row of an Arrow table, for key matching (Arrow joins reject dictionary keys).
+    """
+    import pyarrow as pa # type: ignore
+    import pyarrow.compute as pc # type: ignore
+    return pc.binary_join_element_wise(
+        pc.cast(table["calculation_date"], pa.string()), pc.cast(table["machine_id"], pa.string()), "|"
+    )
+
+def _sort_by_keys(table):
+    import pyarrow as pa # type: ignore
+    import pyarrow.compute as pc # type: ignore
+    keys = pa.table({"calculation_date": table["calculation_date"], "machine_id": pc.cast(table["machine_id"], pa.string())})
+    return table.take(pc.sort_indices(keys, sort_keys=[(c, "ascending") for c in KEY_COLUMNS]))
+
+def _common_schema(stored, new):
+    """
+        Schema both the stored rows and the new rows are cast to before they are concatenated: the stored column
+        types, except that a dictionary column takes the wider of the two index types (a plant that grew past
+        127 machines writes int16 codes over a partition stored with int8 codes).
+    """
+    import pyarrow as pa # type: ignore
+    stored_fields = {field.name: field for field in stored}
+    fields = []
+    for field in new:
+        old = stored_fields.get(field.name, field)
+        if pa.types.is_dictionary(old.type) and pa.types.is_dictionary(field.type) \
+                and field.type.index_type.bit_width > old.type.index_type.bit_width:
+            old = old.with_type(pa.dictionary(field.type.index_type, old.type.value_type))
+        fields.append(old)
+    names = {field.name for field in fields}
+    return pa.schema(fields + [stored_fields[name] for name in stored.names if name not in names])
+
+def upsert_history_table(table, root=None):
+    """
+        Arrow counterpart of upsert_history: upserts an Arrow table, rewriting only the affected months.
+        The new rows are cast to the stored partition's column types so both writers produce the same files.
+        Args:
+            table (pa.Table): Rows to upsert, unique on the key columns; calculation_date is date32.
+            root (str | None): Partition directory. Defaults to settings.HISTORY_DIR.
+        Returns: pa.Table: The previously stored rows that were replaced (empty if all rows were new).
+    """
+    import pyarrow as pa # type: ignore
+    import pyarrow.compute as pc # type: ignore
+    root = root or settings.HISTORY_DIR
+    if root == settings.HISTORY_DIR:
+        migrate_legacy_history(root)
+
+    months = pc.strftime(table["calculation_date"], format="%Y-%m")
+    previous = [table.slice(0, 0)]
+    for month in pc.unique(months).to_pylist():
+        new_rows = table.filter(pc.equal(months, month))
+        path = partition_path(month, root)
+        if os.path.exists(path):
+            # Not memory-mapped: the file is replaced below while these rows are still referenced
+            old_rows = _read_partition_table(path, memory_map=False)
+            schema = _common_schema(old_rows.schema, new_rows.schema)
+            new_rows = new_rows.cast(pa.schema([schema.field(name) for name in new_rows.column_names]))
+            old_rows = old_rows.cast(pa.schema([schema.field(name) for name in old_rows.column_names]))
+            replaced = pc.is_in(_row_keys(old_rows), value_set=_row_keys(new_rows))
+            previous.append(old_rows.filter(replaced))
+            new_rows = pa.concat_tables([old_rows.filter(pc.invert(replaced)), new_rows], promote_options="permissive")
+        atomic_write_feather(_sort_by_keys(new_rows), path)
+        logging.info(f"History partition {month} written with {new_rows.num_rows} rows.")
+    return pa.concat_tables(previous, promote_options="permissive")
+
+def read_history_table(start_date=None, end_date=None, columns=None, root=None):
+    """
+        Arrow counterpart of read_history. Partitions are memory-mapped and concatenated without copying, so
+        only the pages of the projected columns that are actually used are read from disk.
+        Returns: pa.Table: Matching rows, ordered by partition and then by (calculation_date, machine_id).
+    """
+    import pyarrow as pa # type: ignore
+    import pyarrow.compute as pc # type: ignore
+    root = root or settings.HISTORY_DIR
+    months = list_partitions(root)
+    if start_date is not None:
+        months = [m for m in months if m >= start_date.strftime("%Y-%m")]
+    if end_date is not None:
+        months = [m for m in months if m <= end_date.strftime("%Y-%m")]
+    if columns is not None:
+        columns = KEY_COLUMNS + [c for c in columns if c not in KEY_COLUMNS]
+
+    tables = [_read_partition_table(partition_path(m, root), columns) for m in months]
+    if not tables:
+        return pa.table({c: pa.array([], pa.null()) for c in columns or KEY_COLUMNS})
+    table = pa.concat_tables(tables, promote_options="permissive")
+    if start_date is not None:
+        table = table.filter(pc.greater_equal(table["calculation_date"], pa.scalar(start_date, pa.date32())))
+    if end_date is not None:
+        table = table.filter(pc.less_equal(table["calculation_date"], pa.scalar(end_date, pa.date32())))
+    return table
+
+def read_history(start_date=None, end_date=None, columns=None, root=None):
+    """
+        Reads history rows through memory-mapped Arrow I/O, opening only the partitions that overlap the requested range.
+        Args:
+            start_date (date | None): First date (inclusive).
+            end_date (date | None): Last date (inclusive).
+            columns (list | None): Column projection. Key columns are always included and only the requested columns are decoded.
+            root (str | None): Partition directory. Defaults to settings.HISTORY_DIR.
+        Returns: pd.DataFrame: Matching rows sorted by (calculation_date, machine_id).
+    """
+    root = root or settings.HISTORY_DIR
+    months = list_partitions(root)
+    if start_date is not None:
+        months = [m for m in months if m >= start_date.strftime("%Y-%m")]
+    if end_date is not None:
+        months = [m for m in months if m <= end_date.strftime("%Y-%m")]
+    if columns is not None:
+        columns = KEY_COLUMNS + [c for c in columns if c not in KEY_COLUMNS]
+
+    frames = [_read_partition(partition_path(m, root), columns) for m in months]
+    if not frames:
+        return pd.DataFrame(columns=columns or KEY_COLUMNS)
+    df = _concat_keep_categories(frames)
+    if start_date is not None:
+        df = df[df["calculation_date"] >= start_date]
+    if end_date is not None:
+        df = df[df["calculation_date"] <= end_date]
+    return df.reset_index(drop=True)
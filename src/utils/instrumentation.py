@@ -0,0 +1,339 @@
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from src.config.settings import settings
+from src.utils.logger import logging
+
+"""
+    Lightweight per-stage instrumentation.
+    pipeline_run() wraps one pipeline execution; stage() / instrumented() wrap its stages and record wall time,
+    rows in/out, bytes read/written, memory and PI call latency. A stage's memory is the process RSS sampled every
+    settings.RSS_SAMPLE_SECONDS while it runs: its peak, and how far that peak rose above the RSS the stage started
+    at (concurrent stages see each other's allocations). When the run finishes its record, tagged with
+    settings.PLANT, is appended to settings.RUN_LOG_FILE (JSON lines) and written to a Prometheus textfile in settings.METRICS_DIR for the
+    node_exporter textfile collector. Outside a run every call is a cheap no-op.
+"""
+
+_run_lock = threading.Lock()
+_active_run = None
+_local = threading.local()
+# Stages whose memory the sampler thread is following
+_sampled = set()
+_sampler = None
+
+def peak_rss_mb():
+    """
+        Peak resident set size of the current process in MB, or None where it cannot be measured.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024, 1)
+    except ImportError:
+        try:
+            import psutil # type: ignore
+            return round(psutil.Process().memory_info().peak_wset / 1024 / 1024, 1)
+        except Exception:
+            return None
+
+def current_rss_mb():
+    """
+        Current resident set size of the process in MB, or None where it cannot be measured.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        try:
+            import psutil # type: ignore
+            return psutil.Process().memory_info().rss / 1024 / 1024
+        except Exception:
+            return None
+
+def _sample_rss():
+    global _sampler
+    while True:
+        time.sleep(settings.RSS_SAMPLE_SECONDS)
+        rss = current_rss_mb()
+        with _run_lock:
+            if not _sampled:
+                _sampler = None
+                return
+            for record in _sampled:
+                record.observe_rss(rss)
+
+def _follow_rss(record):
+    global _sampler
+    record.observe_rss(current_rss_mb())
+    with _run_lock:
+        _sampled.add(record)
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_rss, name="rss-sampler", daemon=True)
+            _sampler.start()
+
+def _unfollow_rss(record):
+    with _run_lock:
+        _sampled.discard(record)
+    record.observe_rss(current_rss_mb())
+    if record.peak_rss_mb is None:
+        # No current RSS on this platform: fall back to the process high-water mark
+        record.peak_rss_mb = peak_rss_mb()
+    else:
+        record.peak_rss_delta_mb = round(record.peak_rss_mb - record.start_rss_mb, 1)
+        record.peak_rss_mb = round(record.peak_rss_mb, 1)
+
+class StageRecord:
+    """
+        Measurements for one stage. Counters may be set directly or through the add_* helpers.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.status = "ok"
+        self.error = None
+        self.seconds = None
+        self.rows_in = None
+        self.rows_out = None
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.start_rss_mb = None
+        self.peak_rss_mb = None
+        self.peak_rss_delta_mb = None
+        self.pi_latencies = []
+        self.pi_failures = 0
+
+    def observe_rss(self, rss):
+        if rss is None:
+            return
+        if self.start_rss_mb is None:
+            self.start_rss_mb = rss
+        if self.peak_rss_mb is None or rss > self.peak_rss_mb:
+            self.peak_rss_mb = rss
+
+    def as_dict(self):
+        record = {
+            "stage": self.name,
+            "status": self.status,
+            "seconds": self.seconds,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "peak_rss_mb": self.peak_rss_mb,
+            "peak_rss_delta_mb": self.peak_rss_delta_mb,
+        }
+        if self.pi_latencies or self.pi_failures:
+            latencies = sorted(self.pi_latencies)
+            record.update({
+                "pi_calls": len(latencies) + self.pi_failures,
+                "pi_failures": self.pi_failures,
+                "pi_latency_mean_s": round(sum(latencies) / len(latencies), 4) if latencies else None,
+                "pi_latency_p95_s": round(latencies[int(0.95 * (len(latencies) - 1))], 4) if latencies else None,
+                "pi_latency_max_s": round(latencies[-1], 4) if latencies else None,
+            })
+        if self.error:
+            record["error"] = self.error
+        return record
+
+def _stage_stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+def current_stage():
+    """
+        Returns the innermost active stage of the calling thread, or None.
+    """
+    stack = _stage_stack()
+    return stack[-1] if stack else None
+
+def add_bytes_read(n):
+    record = current_stage()
+    if record is not None:
+        record.bytes_read += int(n)
+
+def add_bytes_written(n):
+    record = current_stage()
+    if record is not None:
+        record.bytes_written += int(n)
+
+def record_pi_call(seconds, ok=True, into=None):
+    """
+        Records one PI call against a stage record (default: the calling thread's innermost stage).
+        Worker threads pass the record explicitly since they do not share the caller's stage stack.
+    """
+    record = into or current_stage()
+    if record is None:
+        return
+    with _run_lock:
+        if ok:
+            record.pi_latencies.append(seconds)
+        else:
+            record.pi_failures += 1
+
+@contextmanager
+def stage(name):
+    """
+        Context manager measuring one stage of the active run.
+        Yields: StageRecord: Set rows_in / rows_out on it; bytes and PI calls are added by the I/O helpers.
+    """
+    record = StageRecord(name)
+    stack = _stage_stack()
+    stack.append(record)
+    _follow_rss(record)
+    began = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record.status = "error"
+        record.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record.seconds = round(time.perf_counter() - began, 4)
+        _unfollow_rss(record)
+        stack.pop()
+        with _run_lock:
+            if _active_run is not None:
+                _active_run["stages"].append(record)
+
+def instrumented(name):
+    """
+        Decorator form of stage(). Sets rows_out from the result when it has a length.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as record:
+                result = func(*args, **kwargs)
+                if record.rows_out is None and hasattr(result, "__len__"):
+                    record.rows_out = len(result)
+                return result
+        return wrapper
+    return decorator
+
+@contextmanager
+def pipeline_run(name):
+    """
+        Context manager for one pipeline execution. Persists the run record on exit, whether it succeeded or not.
+        Args: name (str): Run type, e.g. "daily", "backfill", "poll".
+    """
+    global _active_run
+    run = {
+        "run_id": uuid.uuid4().hex[:12], "run": name, "plant": settings.PLANT or None,
+        "started_at": datetime.now().isoformat(timespec="seconds"), "stages": [],
+    }
+    with _run_lock:
+        previous, _active_run = _active_run, run
+    began = time.perf_counter()
+    try:
+        yield run
+        run["status"] = "ok"
+    except Exception as e:
+        run["status"] = "error"
+        run["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        run["seconds"] = round(time.perf_counter() - began, 4)
+        run["peak_rss_mb"] = peak_rss_mb()
+        with _run_lock:
+            _active_run = previous
+        run["stages"] = [s.as_dict() for s in run["stages"]]
+        try:
+            write_run_log(run)
+            write_prometheus_textfile(run)
+        except Exception as e:
+            logging.warning(f"Could not persist run metrics: {e}")
+
+def _atomic_write_text(text, path):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def write_run_log(run):
+    """
+        Appends the run record as one JSON line. The plant processes share RUN_LOG_FILE, so the line goes out in a
+        single O_APPEND write and concurrent runs never interleave within a record.
+    """
+    os.makedirs(os.path.dirname(settings.RUN_LOG_FILE) or ".", exist_ok=True)
+    line = (json.dumps(run, default=str) + "\n").encode()
+    fd = os.open(settings.RUN_LOG_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+_PROMETHEUS_STAGE_METRICS = [
+    ("seconds", "activeqc_stage_duration_seconds", "Wall time of each stage in the last run."),
+    ("rows_in", "activeqc_stage_rows_in", "Rows consumed by each stage in the last run."),
+    ("rows_out", "activeqc_stage_rows_out", "Rows produced by each stage in the last run."),
+    ("bytes_read", "activeqc_stage_bytes_read", "Bytes read by each stage in the last run."),
+    ("bytes_written", "activeqc_stage_bytes_written", "Bytes written by each stage in the last run."),
+    ("peak_rss_mb", "activeqc_stage_peak_rss_megabytes", "Peak process RSS sampled while each stage ran."),
+    ("peak_rss_delta_mb", "activeqc_stage_peak_rss_delta_megabytes", "Rise of that peak over each stage's starting RSS."),
+    ("pi_calls", "activeqc_stage_pi_calls", "PI calls made by each stage in the last run."),
+    ("pi_failures", "activeqc_stage_pi_failures", "Failed PI calls in each stage in the last run."),
+    ("pi_latency_mean_s", "activeqc_stage_pi_latency_mean_seconds", "Mean PI call latency per stage."),
+    ("pi_latency_p95_s", "activeqc_stage_pi_latency_p95_seconds", "95th percentile PI call latency per stage."),
+    ("pi_latency_max_s", "activeqc_stage_pi_latency_max_seconds", "Slowest PI call per stage."),
+]
+
+_ADDITIVE = {"seconds", "rows_in", "rows_out", "bytes_read", "bytes_written", "pi_calls", "pi_failures"}
+
+def _merge_stages(stages):
+    """
+        Folds repeated stage names (e.g. one per date or thread) into one sample each: counters add, the rest take the max.
+    """
+    merged = {}
+    for record in stages:
+        into = merged.setdefault(record["stage"], {"stage": record["stage"]})
+        for key, value in record.items():
+            if key == "stage" or not isinstance(value, (int, float)):
+                continue
+            if into.get(key) is None:
+                into[key] = value
+            elif key in _ADDITIVE:
+                into[key] = round(into[key] + value, 4)
+            else:
+                into[key] = max(into[key], value)
+    return list(merged.values())
+
+def write_prometheus_textfile(run):
+    """
+        Writes the run as gauges to METRICS_DIR/activeqc_<run>.prom, replaced atomically on every run.
+    """
+    stages = _merge_stages(run["stages"])
+    label = f'run="{run["run"]}"'
+    lines = [
+        "# HELP activeqc_run_duration_seconds Wall time of the last run.",
+        "# TYPE activeqc_run_duration_seconds gauge",
+        f"activeqc_run_duration_seconds{{{label}}} {run['seconds']}",
+        "# HELP activeqc_run_success Whether the last run succeeded.",
+        "# TYPE activeqc_run_success gauge",
+        f"activeqc_run_success{{{label}}} {1 if run['status'] == 'ok' else 0}",
+        "# HELP activeqc_run_last_timestamp_seconds Unix time the last run finished.",
+        "# TYPE activeqc_run_last_timestamp_seconds gauge",
+        f"activeqc_run_last_timestamp_seconds{{{label}}} {int(time.time())}",
+    ]
+    for key, metric, help_text in _PROMETHEUS_STAGE_METRICS:
+        samples = [
+            f'{metric}{{{label},stage="{s["stage"]}"}} {s[key]}'
+            for s in stages if s.get(key) is not None
+        ]
+        if samples:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge", *samples]
+    _atomic_write_text("\n".join(lines) + "\n", os.path.join(settings.METRICS_DIR, f"activeqc_{run['run']}.prom"))
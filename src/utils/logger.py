@@ -1,39 +1,156 @@
+import atexit
+import glob
+import json
 import logging
+import logging.handlers
 import os
+import queue
 import sys
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from src.config.settings import settings
 
-def setup_logger():
+"""
+    Logging setup. Importing this module has no side effects: entry points (scheduler, daemon, dashboard)
+    call setup_logger() once at startup. Library modules keep using `from src.utils.logger import logging`.
+
+    Log calls never touch disk or the console: the root logger only has a QueueHandler, and a QueueListener
+    thread writes the queued records to a rotating file and stdout. Worker processes forward their records to
+    the parent's listener through process_log_queue() / setup_worker_logger(), so only one process ever writes
+    (and rotates) a given log file.
+"""
+
+LOG_FILE_PATH = None
+_listener = None
+_handlers = []
+_queue = None
+
+class JsonFormatter(logging.Formatter):
     """
-        Sets up logging manually without using basicConfig (Python 3.13+ safe). Returns the full path to the generated log file.
+        One JSON object per line: time, level, logger, process, thread, message and any exception text.
     """
-    log_file = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
-    logs_path = settings.LOG_DIR
-    os.makedirs(logs_path, exist_ok=True)
-    log_file_path = os.path.join(logs_path, log_file)
 
-    # Get the root logger
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
 
-    # Clear existing handlers to prevent duplicate logs
-    if logger.hasHandlers():
-        logger.handlers.clear()
+def _file_handler(log_file_path):
+    if settings.LOG_ROTATION == "size":
+        handler = logging.handlers.RotatingFileHandler(
+            log_file_path, maxBytes=settings.LOG_MAX_MB * 1024 * 1024, backupCount=settings.LOG_BACKUP_COUNT, encoding="utf-8",
+        )
+    else:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            log_file_path, when=settings.LOG_ROTATE_WHEN, backupCount=settings.LOG_BACKUP_COUNT, encoding="utf-8",
+        )
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(processName)s %(threadName)s %(name)s %(levelname)s %(message)s'))
+    return handler
+
+def _prune_legacy_logs(logs_path):
+    """
+        Removes per-run timestamped log files left by earlier versions, keeping the newest LOG_BACKUP_COUNT.
+    """
+    legacy = sorted(glob.glob(os.path.join(logs_path, "[0-9][0-9]_[0-9][0-9]_[0-9][0-9][0-9][0-9]_*.log")), key=os.path.getmtime)
+    for path in legacy[:max(0, len(legacy) - settings.LOG_BACKUP_COUNT)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def stop_logger():
+    """
+        Flushes the queued records and stops the writer thread. Registered at exit by setup_logger().
+    """
+    global _listener, _queue
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        _queue = None
+    for handler in _handlers:
+        handler.close()
+
+def setup_logger(force=False, name=None):
+    """
+        Sets up logging manually without using basicConfig (Python 3.13+ safe). Returns the full path to the log file.
+        Repeated calls keep the existing setup unless force is set, so re-executed scripts (Streamlit) do not add handlers.
+        Args:
+            force (bool): Rebuild the handlers and listener.
+            name (str | None): Log file name without extension, one per long-running process so no two processes
+                rotate the same file. Defaults to settings.LOG_NAME.
+        Returns: str: The log file path.
+    """
+    global LOG_FILE_PATH, _listener, _handlers, _queue
+    if LOG_FILE_PATH is not None and not force:
+        return LOG_FILE_PATH
+    stop_logger()
 
-    # File handler
-    file_handler = logging.FileHandler(log_file_path)
-    file_handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s %(message)s'))
+    logs_path = settings.LOG_DIR
+    os.makedirs(logs_path, exist_ok=True)
+    _prune_legacy_logs(logs_path)
+    log_file_path = os.path.join(logs_path, f"{name or settings.LOG_NAME}.log")
 
     # Console handler
     stream_handler = logging.StreamHandler(sys.stdout)
     stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
+    _handlers = [_file_handler(log_file_path), stream_handler]
 
-    # Add both handlers
-    logger.addHandler(file_handler)
-    logger.addHandler(stream_handler)
+    # Get the root logger; it only enqueues, the listener thread does the I/O
+    logger = logging.getLogger()
+    logger.setLevel(settings.LOG_LEVEL)
+    if logger.hasHandlers():
+        logger.handlers.clear()
+    _queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(_queue))
+    _listener = logging.handlers.QueueListener(_queue, *_handlers, respect_handler_level=True)
+    _listener.start()
 
+    if LOG_FILE_PATH is None:
+        atexit.register(stop_logger)
+    LOG_FILE_PATH = log_file_path
     return log_file_path
 
-# Initialize logging on import
-LOG_FILE_PATH = setup_logger()
\ No newline at end of file
+@contextmanager
+def process_log_queue(mp_context):
+    """
+        Yields a queue that worker processes hand to setup_worker_logger(); their records are moved into this
+        process's log queue, so its one listener writes them alongside its own. Yields None when this process has
+        not set up logging.
+        Args: mp_context: The multiprocessing context the workers are started with.
+    """
+    if _queue is None:
+        yield None
+        return
+    log_queue = mp_context.Queue()
+    # Forwards only: the records reach the handlers through the main listener's queue
+    forwarder = logging.handlers.QueueListener(log_queue, logging.handlers.QueueHandler(_queue))
+    forwarder.start()
+    try:
+        yield log_queue
+    finally:
+        forwarder.stop()
+
+def setup_worker_logger(log_queue):
+    """
+        Worker process initializer: sends every record to the parent's process_log_queue(). No-op for None.
+    """
+    if log_queue is None:
+        return
+    logger = logging.getLogger()
+    logger.setLevel(settings.LOG_LEVEL)
+    if logger.hasHandlers():
+        logger.handlers.clear()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
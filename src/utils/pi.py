@@ -0,0 +1,192 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, time
+from time import perf_counter
+import pandas as pd
+from src.config.settings import settings
+from src.utils.instrumentation import record_pi_call, stage
+from src.utils.logger import logging
+from src.utils import pi_cache
+
+"""
+    PI Server access layer.
+    The server connection and tag -> point resolutions are cached for the lifetime of the process,
+    since they never change between scheduled runs. Values are fetched concurrently through a bounded
+    thread pool so one slow tag does not stall the whole run. With settings.PI_CACHE, values are served from the
+    local PI value cache (pi_cache.py), which reads whole ranges per tag; only what it cannot answer is read per cell.
+"""
+
+PI_COLUMNS = {0: "QCS_Production", 1: "Reel_Production"}
+# Provenance of each PI value, stored next to it in the history
+PI_STATUS_COLUMNS = {"QCS_Production": "QCS_Status", "Reel_Production": "Reel_Status"}
+PI_STATUSES = ["ok", "missing", "failed"]
+
+_lock = threading.Lock()
+_server = None
+_points = {}
+
+def pi_timestamp(calculation_date):
+    """
+    Returns the PI read timestamp for a business date: the day tonnage totalisers close at
+    PI_DAY_END_HOUR on the following morning.
+    """
+    return datetime.combine(calculation_date + timedelta(days=1), time(settings.PI_DAY_END_HOUR))
+
+def get_pi_server():
+    """
+        Returns the process-wide PIServer connection, creating it on first use.
+        Returns: PIServer | None: None if the server cannot be reached.
+    """
+    global _server
+    with _lock:
+        if _server is None:
+            try:
+                from PIconnect.PI import PIServer # type: ignore
+                _server = PIServer(settings.PI_SERVER_ADDRESS)
+            except Exception as e:
+                logging.warning(f"PI Server unavailable: {e}")
+        return _server
+
+def invalidate_pi_cache(tags=None):
+    """
+        Drops cached point handles so they are resolved again on next use.
+        Args: tags (iterable | None): Tags to drop. None drops every handle and the server connection.
+    """
+    global _server
+    with _lock:
+        if tags is None:
+            _points.clear()
+            _server = None
+        else:
+            for tag in tags:
+                _points.pop(tag, None)
+
+def resolve_points(pi_server, tags=None):
+    """
+        Resolves tags to PI point handles, searching the server only for tags not already cached.
+        Args:
+            pi_server (PIServer): Connected PI server.
+            tags (iterable | None): Tags to resolve. Defaults to every tag in settings.PI_TAGS.
+        Returns: dict: Tag -> point handle for every tag that could be resolved.
+    """
+    if tags is None:
+        tags = [tag for pair in settings.PI_TAGS.values() for tag in pair]
+    with _lock:
+        missing = [tag for tag in tags if tag not in _points]
+    for tag in missing:
+        try:
+            found = pi_server.search(tag)
+        except Exception as e:
+            logging.warning(f"PI tag search failed for '{tag}': {e}")
+            continue
+        if not found:
+            logging.warning(f"PI tag '{tag}' not found or accessible.")
+            continue
+        with _lock:
+            _points[tag] = found[0]
+    with _lock:
+        return {tag: _points[tag] for tag in tags if tag in _points}
+
+def _read_sample(point, timestamp):
+    """
+        Returns: tuple: (timestamp of the recorded sample returned, its value as a float).
+    """
+    value = point.recorded_value(timestamp)
+    sample_time = timestamp
+    if hasattr(value, "iloc"):
+        if isinstance(value.index, pd.DatetimeIndex):
+            sample_time = value.index[0]
+        value = value.iloc[0]
+    return sample_time, float(value)
+
+def read_pi_cells(pi_server, cells, cancel=None):
+    """
+        Reads individual PI cells concurrently.
+        Args:
+            pi_server (PIServer): Connected PI server.
+            cells (list): (business date, machine, column) triples; column is one of PI_COLUMNS' values.
+            cancel (threading.Event | None): Once set, reads not yet started are skipped and reported missing.
+        Returns: dict: Cell -> (value | None, status), status being "ok", "missing" (tag unresolved or read
+            skipped) or "failed" (the read raised).
+    """
+    positions = {column: position for position, column in PI_COLUMNS.items()}
+    tags = {cell: settings.PI_TAGS[cell[1]][positions[cell[2]]] for cell in cells}
+
+    with stage("pi") as record:
+        by_tag = {}
+        for cell, tag in tags.items():
+            by_tag.setdefault(tag, []).append(cell)
+        points = resolve_points(pi_server, list(by_tag))
+        # Cell -> (value, status); cell -> timestamp of the sample a point read returned
+        results, read = {}, {}
+
+        def _lookup(tag):
+            if tag not in points or (cancel is not None and cancel.is_set()):
+                return {}
+            try:
+                return pi_cache.lookup(points[tag], tag, {pi_timestamp(cell[0]) for cell in by_tag[tag]}, record)
+            except Exception as e:
+                logging.warning(f"PI range read failed for {tag}, reading its cells one by one: {e}")
+                return {}
+
+        def _fetch(cell):
+            tag = tags[cell]
+            if tag not in points or (cancel is not None and cancel.is_set()):
+                return None, "missing"
+            day, machine, _ = cell
+            began = perf_counter()
+            try:
+                sample_time, value = _read_sample(points[tag], pi_timestamp(day))
+                record_pi_call(perf_counter() - began, True, record)
+                read[cell] = sample_time
+                return value, "ok"
+            except Exception as e:
+                record_pi_call(perf_counter() - began, False, record)
+                logging.warning(f"PI fetch failed for {machine} ({tag}) on {day}: {e}")
+                invalidate_pi_cache([tag])
+                return None, "failed"
+
+        with ThreadPoolExecutor(max_workers=settings.PI_MAX_WORKERS, thread_name_prefix="pi") as pool:
+            if settings.PI_CACHE:
+                for tag, cached in zip(by_tag, pool.map(_lookup, by_tag)):
+                    for cell in by_tag[tag]:
+                        if pi_timestamp(cell[0]) in cached:
+                            results[cell] = (cached[pi_timestamp(cell[0])], "ok")
+            remaining = [cell for cell in cells if cell not in results]
+            results.update(zip(remaining, pool.map(_fetch, remaining)))
+        if settings.PI_CACHE:
+            for tag, tag_cells in by_tag.items():
+                reads = [(pi_timestamp(cell[0]), read[cell], results[cell][0]) for cell in tag_cells if cell in read]
+                try:
+                    pi_cache.remember(tag, reads)
+                except Exception as e:
+                    logging.warning(f"Could not cache PI values of {tag}: {e}")
+        record.rows_out = len(cells)
+    return {cell: results[cell] for cell in cells}
+
+def fetch_pi_values(pi_server, dates, machines=None, cancel=None):
+    """
+        Fetches QCS and Reel tonnage for every (date, machine) concurrently, with the provenance of each value.
+        Args:
+            pi_server (PIServer | None): Connected PI server. None yields zero values, all "missing".
+            dates (list): Business dates to read.
+            machines (list | None): Machines to read. Defaults to every machine in settings.PI_TAGS.
+            cancel (threading.Event | None): Once set, reads not yet started are skipped and left at zero.
+        Returns: pd.DataFrame: QCS_Production and Reel_Production with their PI_STATUS_COLUMNS, indexed by
+            (calculation_date, machine_id). Values that could not be read are 0 with status "missing" or "failed".
+    """
+    machines = list(settings.PI_TAGS.keys()) if machines is None else list(machines)
+    index = pd.MultiIndex.from_product([dates, machines], names=["calculation_date", "machine_id"])
+    values = pd.DataFrame(0.0, index=index, columns=list(PI_COLUMNS.values()))
+    statuses = pd.DataFrame("missing", index=index, columns=list(PI_STATUS_COLUMNS.values()))
+
+    if pi_server:
+        cells = [(day, machine, column) for day in dates for machine in machines for column in PI_COLUMNS.values()]
+        for (day, machine, column), (value, status) in read_pi_cells(pi_server, cells, cancel).items():
+            if value is not None:
+                values.at[(day, machine), column] = value
+            statuses.at[(day, machine), PI_STATUS_COLUMNS[column]] = status
+
+    for column in statuses.columns:
+        values[column] = pd.Categorical(statuses[column], categories=PI_STATUSES)
+    return values
@@ -0,0 +1,310 @@
+import argparse
+import json
+import os
+import threading
+import time
+from bisect import bisect_right
+from time import perf_counter
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+from src.config.settings import settings
+from src.utils.history_store import atomic_write_json, atomic_write_npy
+from src.utils.instrumentation import record_pi_call
+from src.utils.logger import logging, setup_logger
+
+"""
+    Local cache of PI historian values.
+    Each tag's recorded values are one sorted array of (timestamp, value) samples in
+    PI_CACHE_DIR/<server>/<tag>.npy, memory-mapped on read, with a <tag>.json sidecar listing the time intervals
+    those samples cover completely. Lookups are answered from the covered intervals; only the gaps are read
+    from the historian, in bulk recorded_values() range reads of at most settings.PI_CACHE_FETCH_DAYS, so a
+    backfill costs one call per tag and range chunk instead of one per (date, machine) cell and a rerun costs none.
+    Timestamps are wall-clock seconds in settings.PI_TIMEZONE. Nothing newer than settings.PI_CACHE_SETTLE_MINUTES
+    is cached, since the historian may still receive late values for it.
+
+    Usage:
+        python -m src.utils.pi_cache invalidate --tags PSPD_TBN_PM01_QCS:DayTonnage
+"""
+
+SAMPLE = np.dtype([("t", "<i8"), ("v", "<f8")])
+_locks = {}
+_locks_lock = threading.Lock()
+
+def _tag_lock(tag):
+    with _locks_lock:
+        return _locks.setdefault(tag, threading.Lock())
+
+def _cache_dir():
+    return os.path.join(settings.PI_CACHE_DIR, quote(settings.PI_SERVER_ADDRESS or "default", safe=""))
+
+def _paths(tag):
+    base = os.path.join(_cache_dir(), quote(tag, safe=""))
+    return base + ".npy", base + ".json"
+
+def to_seconds(timestamp):
+    """
+        Wall-clock seconds in settings.PI_TIMEZONE; naive timestamps are taken to be in it already.
+    """
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(settings.PI_TIMEZONE).tz_localize(None)
+    return (timestamp - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+
+def to_datetime(seconds):
+    return pd.Timestamp(int(seconds), unit="s").to_pydatetime()
+
+def _horizon():
+    # Latest timestamp old enough to cache
+    return to_seconds(pd.Timestamp.now(tz=settings.PI_TIMEZONE)) - settings.PI_CACHE_SETTLE_MINUTES * 60
+
+def _merge(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _gaps(coverage, start, end):
+    """
+        Parts of [start, end] outside the (merged, sorted) covered intervals.
+    """
+    gaps, cursor = [], start
+    for covered_start, covered_end in coverage:
+        if covered_end < cursor:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > cursor:
+            gaps.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+def _chunks(gaps):
+    step = settings.PI_CACHE_FETCH_DAYS * 86400
+    return [(start, min(start + step, end)) for gap_start, end in gaps for start in range(gap_start, end, step)]
+
+def _load(tag, mmap=True):
+    """
+        Returns: tuple: (samples, covered intervals); empty when the tag is not cached or its files are unreadable.
+    """
+    data_path, meta_path = _paths(tag)
+    try:
+        with open(meta_path) as f:
+            coverage = [tuple(interval) for interval in json.load(f)["coverage"]]
+        samples = np.load(data_path, mmap_mode="r" if mmap else None)
+    except (OSError, ValueError, KeyError):
+        return np.empty(0, SAMPLE), []
+    return samples, coverage
+
+def _store(tag, samples, coverage):
+    data_path, meta_path = _paths(tag)
+    # Samples first: a sidecar that lags them only makes the next lookup re-read a gap
+    atomic_write_npy(samples, data_path)
+    atomic_write_json({"coverage": [list(interval) for interval in coverage], "updated_at": time.time()}, meta_path)
+
+def _update(tag, new_samples, intervals):
+    """
+        Merges samples and the intervals they cover completely into a tag's cache; new samples win on equal timestamps.
+        Call with the tag's lock held.
+        Returns: tuple: (samples, covered intervals) as stored.
+    """
+    samples, coverage = _load(tag, mmap=False)
+    combined = np.concatenate([np.asarray(new_samples, SAMPLE), samples])
+    _, first = np.unique(combined["t"], return_index=True)
+    samples, coverage = combined[first], _merge(coverage + list(intervals))
+    _store(tag, samples, coverage)
+    return samples, coverage
+
+def _series_samples(series):
+    """
+        Samples of a PI series; values that are not numeric (digital states such as "Bad Input") are kept as NaN.
+    """
+    if series is None or len(series) == 0:
+        return np.empty(0, SAMPLE)
+    index = pd.DatetimeIndex(series.index)
+    if index.tz is not None:
+        index = index.tz_convert(settings.PI_TIMEZONE).tz_localize(None)
+    samples = np.empty(len(index), SAMPLE)
+    samples["t"] = (index - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    samples["v"] = pd.to_numeric(pd.Series(np.asarray(series, dtype=object)), errors="coerce").to_numpy(dtype="float64")
+    return samples
+
+def _fetch_range(point, start, end, record):
+    began = perf_counter()
+    try:
+        series = point.recorded_values(to_datetime(start), to_datetime(end))
+    except Exception:
+        record_pi_call(perf_counter() - began, False, record)
+        raise
+    record_pi_call(perf_counter() - began, True, record)
+    return _series_samples(series)
+
+def _fill(point, tag, windows, record=None):
+    """
+        Reads the parts of the windows the tag's cache does not cover and adds them to it. Points without
+        recorded_values() are only served what remember() stored.
+        Args:
+            point: PI point handle.
+            tag (str): The point's tag.
+            windows (list): (start, end) second pairs, all at or before _horizon().
+            record (StageRecord | None): Stage the historian calls are recorded against.
+        Returns: tuple: (samples, covered intervals) after the fill.
+        Raises: Exception: Whatever the historian raised; ranges read before it are kept.
+    """
+    with _tag_lock(tag):
+        samples, coverage = _load(tag)
+        chunks = _chunks([gap for window in _merge(windows) for gap in _gaps(coverage, *window)])
+        if not chunks or not hasattr(point, "recorded_values"):
+            return samples, coverage
+        del samples
+        fetched, covered = [], []
+        try:
+            for start, end in chunks:
+                fetched.append(_fetch_range(point, start, end, record))
+                covered.append((start, end))
+        except Exception:
+            if covered:
+                _update(tag, np.concatenate(fetched), covered)
+            raise
+        logging.info(f"PI cache {tag}: {len(chunks)} range reads.")
+        return _update(tag, np.concatenate(fetched), covered)
+
+def _at_or_before(samples, coverage, starts, seconds):
+    """
+        Value of the last sample at or before `seconds` when the cache answers it: the sample and `seconds` lie in
+        one covered interval and the value is numeric. None otherwise.
+    """
+    position = int(np.searchsorted(samples["t"], seconds, side="right")) - 1
+    interval = bisect_right(starts, seconds) - 1
+    if position < 0 or interval < 0:
+        return None
+    covered_start, covered_end = coverage[interval]
+    sample_time, value = samples[position]
+    if seconds > covered_end or sample_time < covered_start or np.isnan(value):
+        return None
+    return float(value)
+
+def lookup(point, tag, timestamps, record=None):
+    """
+        Recorded values at (at or before) each timestamp that the cache can answer, after one bulk read of the
+        settings.PI_CACHE_LOOKBACK_HOURS before each timestamp it does not cover yet.
+        Args:
+            point: PI point handle with recorded_values(start, end).
+            tag (str): The point's tag.
+            timestamps (iterable): datetimes to look up.
+            record (StageRecord | None): Stage the historian calls are recorded against.
+        Returns: dict: Timestamp -> value for the timestamps answered. The rest (too recent to cache, no sample
+            within the look-back, non-numeric sample) are left to a point read and remember().
+        Raises: Exception: If a range read fails.
+    """
+    seconds = {timestamp: to_seconds(timestamp) for timestamp in timestamps}
+    horizon = _horizon()
+    settled = sorted({s for s in seconds.values() if s <= horizon})
+    if not settled:
+        return {}
+    lookback = max(1, settings.PI_CACHE_LOOKBACK_HOURS * 3600)
+    samples, coverage = _fill(point, tag, [(s - lookback, s) for s in settled], record)
+    starts = [start for start, _ in coverage]
+    answered = {s: _at_or_before(samples, coverage, starts, s) for s in settled}
+    return {timestamp: answered[s] for timestamp, s in seconds.items() if answered.get(s) is not None}
+
+def remember(tag, reads):
+    """
+        Stores the results of point reads so the same lookups are answered locally next time.
+        Args:
+            tag (str): The tag read.
+            reads (list): (timestamp asked for, timestamp of the recorded sample returned, value) triples.
+                PI returns the last sample at or before the time asked for, so each covers that span.
+    """
+    horizon = _horizon()
+    reads = [(to_seconds(sample_time), to_seconds(asked), value) for asked, sample_time, value in reads]
+    reads = [(sample_time, asked, value) for sample_time, asked, value in reads if sample_time <= asked <= horizon]
+    if not reads:
+        return
+    with _tag_lock(tag):
+        _update(
+            tag,
+            np.array([(sample_time, value) for sample_time, _, value in reads], SAMPLE),
+            [(sample_time, asked) for sample_time, asked, _ in reads],
+        )
+
+def read_range(point, tag, start, end, record=None):
+    """
+        Recorded values of a tag between two times (inclusive), served from the cache after reading its gaps.
+        The part newer than the settle window is read live and not cached.
+        Args:
+            point: PI point handle with recorded_values(start, end).
+            tag (str): The point's tag.
+            start (datetime): First time.
+            end (datetime): Last time.
+            record (StageRecord | None): Stage the historian calls are recorded against.
+        Returns: pd.Series: Values indexed by timestamp; non-numeric samples are NaN.
+    """
+    start, end = to_seconds(start), to_seconds(end)
+    horizon = _horizon()
+    parts = []
+    if start <= horizon:
+        samples, _ = _fill(point, tag, [(start, min(end, horizon))], record)
+        times = samples["t"]
+        parts.append(np.array(samples[np.searchsorted(times, start):np.searchsorted(times, min(end, horizon), side="right")]))
+        del samples, times
+    if end > horizon:
+        live = _fetch_range(point, max(start, horizon), end, record)
+        parts.append(live[live["t"] > horizon] if start <= horizon else live)
+    samples = np.concatenate(parts) if parts else np.empty(0, SAMPLE)
+    return pd.Series(samples["v"], index=pd.to_datetime(samples["t"], unit="s"), name=tag)
+
+def interpolated(point, tag, start, end, interval, record=None):
+    """
+        Values at a fixed interval, interpolated linearly between the recorded values from read_range().
+        Args:
+            interval (str | timedelta): Spacing, e.g. "1h".
+        Returns: pd.Series: Values indexed by timestamp; NaN before the first and after the last recorded value.
+    """
+    recorded = read_range(point, tag, start, end, record).dropna()
+    index = pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq=interval)
+    if recorded.empty:
+        return pd.Series(np.nan, index=index, name=tag)
+    x = (recorded.index - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    at = (index - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    return pd.Series(np.interp(at, x, recorded.to_numpy(), left=np.nan, right=np.nan), index=index, name=tag)
+
+def invalidate_pi_values(tags=None):
+    """
+        Removes cached values so they are read from the historian on next use.
+        Args: tags (iterable | None): Tags to drop. None drops every tag of the configured server.
+        Returns: int: Number of tags removed.
+    """
+    directory = _cache_dir()
+    if tags is None:
+        names = [name[:-len(".json")] for name in os.listdir(directory) if name.endswith(".json")] if os.path.isdir(directory) else []
+    else:
+        names = [quote(tag, safe="") for tag in tags]
+    removed = 0
+    for name in names:
+        # Sidecar first: samples without coverage are never used
+        for path in (os.path.join(directory, name + ".json"), os.path.join(directory, name + ".npy")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += path.endswith(".json")
+    logging.info(f"Invalidated {removed} cached PI tags.")
+    return removed
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ActiveQC PI value cache maintenance.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    invalidate = commands.add_parser("invalidate", help="Drop cached PI values so they are re-read.")
+    invalidate.add_argument("--tags", nargs="+", help="Defaults to every cached tag.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    setup_logger(name="pi_cache")
+    print(f"{invalidate_pi_values(args.tags)} cached PI tags removed.")
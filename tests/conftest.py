@@ -0,0 +1,92 @@
+import os
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.fake_pi import FakePIServer
+from benchmarks.synthetic import build_database, machine_config
+from src.components.processing import METRIC_COLUMNS
+from src.config.settings import settings
+from src.utils import pi
+
+"""
+    Shared fixtures: every test runs against its own scratch output directories, a fake PI server and, when it
+    needs SAP extracts, a synthetic SQLite database (built once per parameter set for the whole session).
+    Tests of the output stores write seeded base metric rows from the rows and days fixtures instead.
+"""
+
+START_DATE = date(2025, 1, 1)
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """
+        Points every output, state and cache path at tmp_path and installs a fake PI server.
+        Returns: pathlib.Path: The scratch directory.
+    """
+    paths = {
+        "HISTORY_FILE": "legacy_history.feather", "HISTORY_DIR": "history", "DERIVED_DIR": "derived",
+        "GRAIN_DIR": "grains", "ANOMALY_DIR": "anomalies", "SUMMARY_FILE": "dashboard_summary.json",
+        "ROLLUP_FILE": "rollups.json", "STATE_DIR": "state", "EXTRACT_CACHE_DIR": "cache/extracts",
+        "PI_CACHE_DIR": "cache/pi", "METRICS_DIR": "metrics", "RUN_LOG_FILE": "metrics/run_log.jsonl",
+        "LOG_DIR": "logs", "PLANTS_FILE": "",
+    }
+    for name, path in paths.items():
+        monkeypatch.setattr(settings, name, str(tmp_path / path) if path else path)
+    pi.invalidate_pi_cache()
+    monkeypatch.setattr(pi, "_server", FakePIServer())
+    yield tmp_path
+    pi.invalidate_pi_cache()
+
+@pytest.fixture
+def machines():
+    """
+        Machines the rows fixture builds rows for; override it in a test module for another set.
+    """
+    return ["PM1", "PM2", "PM3"]
+
+@pytest.fixture
+def rows(machines):
+    """
+        Returns a function make(days, seed=0, machines=None, scale=1.0) that builds base metric rows, one per day and
+        machine (defaulting to the machines fixture), with seeded random values times scale.
+    """
+    default_machines = machines
+
+    def make(days, seed=0, machines=None, scale=1.0):
+        rng = np.random.default_rng(seed)
+        frame = pd.DataFrame(
+            [(day, machine) for day in days for machine in machines or default_machines],
+            columns=["calculation_date", "machine_id"],
+        )
+        for column in METRIC_COLUMNS:
+            frame[column] = rng.gamma(4.0, 25.0, len(frame)).round(2) * scale
+        frame["machine_id"] = frame["machine_id"].astype("category")
+        return frame
+    return make
+
+@pytest.fixture
+def days():
+    """
+        Returns a function make(first, count) giving count consecutive dates from first.
+    """
+    def make(first, count):
+        return [first + timedelta(days=i) for i in range(count)]
+    return make
+
+@pytest.fixture(scope="session")
+def database_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("databases")
+
+@pytest.fixture
+def synthetic(workspace, database_dir, monkeypatch):
+    """
+        Returns a function configure(rows, machines, days) that points settings at a synthetic database and its
+        machine maps and PI tags.
+    """
+    def configure(rows=5000, machines=3, days=10):
+        path = os.path.join(database_dir, f"synthetic_{rows}_{machines}_{days}.db")
+        monkeypatch.setattr(settings, "DB_CONNECTION_STRING", build_database(path, rows, machines, days, START_DATE))
+        for name, value in machine_config(machines).items():
+            monkeypatch.setattr(settings, name, value)
+        return START_DATE
+    return configure
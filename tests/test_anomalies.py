@@ -0,0 +1,153 @@
+import json
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from src.components import anomalies, derived
+from src.components.anomalies import (
+    RunningStats, load_anomaly_state, monitored_values, rebuild_anomalies, update_anomalies,
+)
+from src.components.derived import upsert_derived
+from src.config.plants import PLANT_KEYS
+from src.config.settings import settings
+from src.utils.history_store import read_history, upsert_history
+
+START = date(2025, 1, 1)
+@pytest.fixture
+def machines():
+    return ["PM1", "PM2"]
+
+def _write(frame, open_day=None):
+    """
+        The history, derived and anomaly steps of write_outputs.
+    """
+    upsert_history(frame)
+    return update_anomalies(monitored_values(frame, upsert_derived(frame)), open_day)
+
+def _snapshot():
+    with open(anomalies._state_path()) as f:
+        state = json.load(f)
+    return state, read_history(root=settings.ANOMALY_DIR)
+
+def _build_history(rows, days):
+    # 90 days written as a 40-day backfill followed by 50 daily runs
+    _write(rows(days(START, 40)))
+    for i, day in enumerate(days(START + timedelta(days=40), 50)):
+        _write(rows([day], seed=100 + i))
+
+@pytest.fixture
+def history(workspace, rows, days):
+    _build_history(rows, days)
+    return workspace
+
+def _assert_matches_rebuild():
+    state, scores = _snapshot()
+    rebuild_anomalies(state["open_day"] and date.fromisoformat(state["open_day"]))
+    rebuilt, rebuilt_scores = _snapshot()
+    assert state == rebuilt
+    pd.testing.assert_frame_equal(scores, rebuilt_scores)
+
+def test_incremental_updates_match_rebuild(history, machines):
+    state, scores = _snapshot()
+    assert len(scores) == 90 * len(machines)
+    assert not scores["provisional"].any()
+    assert state["machines"]["PM1"]["last"] == (START + timedelta(days=89)).isoformat()
+    _assert_matches_rebuild()
+
+def test_rewriting_latest_day_replaces_it(history, rows):
+    day = START + timedelta(days=89)
+    _write(rows([day], seed=7))
+    _write(rows([day], seed=8))
+    _assert_matches_rebuild()
+
+def test_correction_replays_from_checkpoint(history, rows, monkeypatch):
+    reads = []
+    original = anomalies.read_history
+    monkeypatch.setattr(anomalies, "read_history", lambda start=None, *a, **k: reads.append(start) or original(start, *a, **k))
+    corrected = START + timedelta(days=75)
+    _write(rows([corrected], seed=9))
+    # Checkpoints every ANOMALY_WINDOW_DAYS (30) from the first day: days 0, 30, 60; day 75 replays after day 60
+    assert reads == [START + timedelta(days=61)]
+    _assert_matches_rebuild()
+
+def test_correction_before_every_checkpoint_replays_only_that_machine(workspace, monkeypatch, rows, days):
+    monkeypatch.setattr(settings, "ANOMALY_CHECKPOINTS", 1)
+    _build_history(rows, days)
+    state, _ = _snapshot()
+    assert [c["date"] for c in state["machines"]["PM1"]["checkpoints"]] == [(START + timedelta(days=60)).isoformat()]
+    frame = rows([START + timedelta(days=5)], seed=11)
+    _write(frame[frame["machine_id"] == "PM2"])
+    state, _ = _snapshot()
+    rebuild_anomalies()
+    rebuilt, _ = _snapshot()
+    assert state["machines"]["PM2"]["stats"] == rebuilt["machines"]["PM2"]["stats"]
+    assert state["machines"]["PM1"]["stats"] == rebuilt["machines"]["PM1"]["stats"]
+
+def test_open_day_is_scored_but_not_folded(history, rows):
+    before, _ = _snapshot()
+    open_day = START + timedelta(days=90)
+    _write(rows([open_day], seed=1, scale=0.2), open_day=open_day)
+    _write(rows([open_day], seed=2, scale=0.5), open_day=open_day)
+    state, scores = _snapshot()
+    assert state["machines"]["PM1"]["stats"] == before["machines"]["PM1"]["stats"]
+    assert state["machines"]["PM1"]["latest"]["provisional"]
+    assert scores.set_index("calculation_date").loc[open_day, "provisional"].all()
+    _assert_matches_rebuild()
+    # Closing the day folds it in
+    _write(rows([open_day], seed=3))
+    state, scores = _snapshot()
+    assert state["open_day"] is None
+    assert state["machines"]["PM1"]["last"] == open_day.isoformat()
+    _assert_matches_rebuild()
+
+def test_spike_is_flagged(history, rows):
+    day = START + timedelta(days=90)
+    frame = rows([day], seed=5)
+    frame.loc[frame["machine_id"] == "PM1", "Qc_Rejection"] *= 20
+    state = _write(frame)
+    assert state["machines"]["PM1"]["latest"]["metrics"]["Qc_Rejection"]["anomaly"]
+    assert not state["machines"]["PM2"]["latest"]["metrics"]["Qc_Rejection"]["anomaly"]
+
+def test_changed_settings_rebuild_state(history, rows, monkeypatch):
+    monkeypatch.setattr(settings, "ANOMALY_Z_THRESHOLD", 2.0)
+    assert load_anomaly_state() is None
+    _write(rows([START + timedelta(days=90)], seed=4))
+    assert load_anomaly_state()["params"]["threshold"] == 2.0
+    _assert_matches_rebuild()
+
+def test_recompute_rebuilds_scores_on_the_new_formula(history, monkeypatch):
+    doubled = [(name, lambda m, f=formula: f(m) * 2) for name, formula in derived.FORMULAS[1]]
+    monkeypatch.setitem(derived.FORMULAS, 2, doubled)
+    before = _snapshot()[0]["machines"]["PM1"]["latest"]["metrics"]["Total_Loss"]["value"]
+    derived.recompute_derived(2)
+    state = _snapshot()[0]
+    assert state["params"]["formula_version"] == 2
+    assert state["machines"]["PM1"]["latest"]["metrics"]["Total_Loss"]["value"] != before
+    monkeypatch.setattr(settings, "DERIVED_FORMULA_VERSION", 2)
+    assert load_anomaly_state() == state
+    _assert_matches_rebuild()
+
+def test_running_statistics_track_exact_values(monkeypatch):
+    monkeypatch.setattr(settings, "ANOMALY_WINDOW_DAYS", 30)
+    x = np.random.default_rng(0).lognormal(size=5000)
+    stats = RunningStats()
+    for value in x:
+        stats.add(float(value))
+    window = x[-30:]
+    assert stats.mean == pytest.approx(window.mean())
+    assert stats.m2 / 29 == pytest.approx(window.var(ddof=1))
+    assert [q.value() for q in stats.quartiles] == pytest.approx(np.quantile(x, [0.25, 0.5, 0.75]), rel=0.03)
+    # The state survives a JSON round trip unchanged
+    assert RunningStats(json.loads(json.dumps(stats.to_dict()))).to_dict() == stats.to_dict()
+
+@pytest.mark.parametrize("argv", [["rebuild", "--plant", "P1"], ["recompute", "--plant", "P1"]])
+@pytest.mark.parametrize("plants_file", [False, True])
+def test_unknown_plant_is_a_usage_error(workspace, monkeypatch, capsys, argv, plants_file):
+    if plants_file:
+        path = workspace / "plants.json"
+        path.write_text(json.dumps({"P2": {key: "" for key in PLANT_KEYS}}))
+        monkeypatch.setattr(settings, "PLANTS_FILE", str(path))
+    parse_args = anomalies.parse_args if argv[0] == "rebuild" else derived.parse_args
+    with pytest.raises(SystemExit):
+        parse_args(argv)
+    assert "Unknown plant 'P1'" in capsys.readouterr().err
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from src.pipeline import daemon
+from src.pipeline.daemon import IncrementalPoller
+from src.config.settings import settings
+
+@pytest.fixture
+def poller(synthetic):
+    day = synthetic(rows=3000, machines=3, days=3)
+    poller = IncrementalPoller(day)
+    assert poller.poll_deltas() > 0
+    poller.save()
+    return poller
+
+def _assert_same_state(restored, poller):
+    assert restored.business_date == poller.business_date
+    assert restored.generation == poller.generation
+    assert restored.watermarks == poller.watermarks
+    for table, seen in poller.seen.items():
+        np.testing.assert_array_equal(restored.seen[table].hashes, seen.hashes)
+    for table, sums in poller.sums.items():
+        pd.testing.assert_frame_equal(restored.sums[table].frame(), sums.frame())
+
+def test_state_round_trips(poller):
+    restored = IncrementalPoller.load()
+    _assert_same_state(restored, poller)
+    # Keyed tables re-read the rows at their watermark and drop them again; QC reads strictly past it
+    assert restored.poll_deltas() == 0
+    _assert_same_state(restored, poller)
+
+def test_save_keeps_only_the_current_generation(poller):
+    poller.save()
+    names = sorted(name for name in os.listdir(settings.STATE_DIR) if name.startswith("poller_"))
+    assert names and all(f".{poller.generation}." in name for name in names)
+    _assert_same_state(IncrementalPoller.load(), poller)
+
+def test_interrupted_save_keeps_the_previous_state(poller, monkeypatch):
+    saved = IncrementalPoller.load()
+    poller.seen["sap"] = type(poller.seen["sap"])(np.arange(5, dtype=np.uint64))
+    poller.watermarks["sap"] = None
+
+    def crash(obj, path):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(daemon, "atomic_write_json", crash)
+    with pytest.raises(OSError):
+        poller.save()
+    _assert_same_state(IncrementalPoller.load(), saved)
+
+def test_truncated_seen_file_restarts_the_day(poller):
+    path = os.path.join(settings.STATE_DIR, f"poller_sap_seen.{poller.generation}.npy")
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) // 2)
+    restored = IncrementalPoller.load()
+    assert restored.business_date == poller.business_date
+    assert all(value is None for value in restored.watermarks.values())
+    assert all(sums.totals is None for sums in restored.sums.values())
+    restored.poll_deltas()
+    for table, sums in poller.sums.items():
+        pd.testing.assert_frame_equal(restored.sums[table].frame(), sums.frame())
+
+def test_state_in_another_format_restarts_the_day(poller, monkeypatch):
+    poller.save()
+    monkeypatch.setattr(daemon, "STATE_FORMAT", daemon.STATE_FORMAT + 1)
+    restored = IncrementalPoller.load()
+    assert restored.business_date == poller.business_date
+    assert all(value is None for value in restored.watermarks.values())
+    restored.save()
+    # The discarded generation's files go with the first save
+    names = [name for name in os.listdir(settings.STATE_DIR) if name.startswith("poller_")]
+    assert names and all(name.endswith((".1.npy", ".1.feather")) for name in names)
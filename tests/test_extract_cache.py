@@ -0,0 +1,89 @@
+import os
+from datetime import date, timedelta
+import pandas as pd
+import pytest
+from src.components import extract_cache, ingestion
+from src.components.extract_cache import cached_extract
+from src.config.settings import settings
+
+DAYS = 5
+
+@pytest.fixture
+def source(synthetic):
+    """
+        Returns (first day, read) where read(start, end) reads the SAP extract and records each range it read.
+    """
+    start = synthetic(rows=3000, machines=3, days=DAYS)
+    reads = []
+
+    def read(run_start, run_end):
+        reads.append((run_start, run_end))
+        return ingestion._read_source("sap", run_start, run_end)
+
+    read.calls = reads
+    return start, read
+
+def _extract(start, read):
+    return cached_extract("sap", start, start + timedelta(days=DAYS - 1), "rows", read)
+
+def _open_every_day(monkeypatch, start):
+    monkeypatch.setattr(settings, "EXTRACT_CACHE_SETTLE_DAYS", (date.today() - start).days + 1)
+
+def test_settled_dates_are_sealed_and_served_without_sql(source, monkeypatch):
+    start, read = source
+    first = _extract(start, read)
+    assert read.calls == [(start, start + timedelta(days=DAYS - 1))]
+
+    def no_fingerprints(*args):
+        raise AssertionError("sealed dates need no revalidation")
+
+    monkeypatch.setattr(extract_cache, "_fingerprints", no_fingerprints)
+    pd.testing.assert_frame_equal(_extract(start, read), first)
+    assert len(read.calls) == 1
+
+def test_open_dates_are_reread_only_when_their_fingerprint_changes(source, monkeypatch):
+    start, read = source
+    _open_every_day(monkeypatch, start)
+    first = _extract(start, read)
+    pd.testing.assert_frame_equal(_extract(start, read), first)
+    assert len(read.calls) == 1
+
+    changed = start + timedelta(days=2)
+    fingerprints = extract_cache._fingerprints
+    monkeypatch.setattr(extract_cache, "_fingerprints", lambda *args: {
+        **fingerprints(*args), changed.isoformat(): [-1, "changed"],
+    })
+    pd.testing.assert_frame_equal(_extract(start, read), first)
+    assert read.calls[1:] == [(changed, changed)]
+
+def test_open_dates_are_reread_once_more_when_they_settle(source, monkeypatch):
+    start, read = source
+    _open_every_day(monkeypatch, start)
+    _extract(start, read)
+    monkeypatch.setattr(settings, "EXTRACT_CACHE_SETTLE_DAYS", 0)
+    _extract(start, read)
+    _extract(start, read)
+    assert len(read.calls) == 2
+
+def test_entry_removed_after_its_sidecar_was_read_is_a_miss(source, monkeypatch):
+    start, read = source
+    first = _extract(start, read)
+    gone = start + timedelta(days=1)
+    load_meta = extract_cache._load_meta
+
+    def evicted_meanwhile(table, day, mode):
+        meta = load_meta(table, day, mode)
+        if day == gone:
+            os.remove(extract_cache._entry_paths(table, day, mode)[0])
+        return meta
+
+    monkeypatch.setattr(extract_cache, "_load_meta", evicted_meanwhile)
+    pd.testing.assert_frame_equal(_extract(start, read), first)
+    assert read.calls[1:] == [(gone, gone)]
+
+def test_eviction_runs_once_per_fetch(synthetic, monkeypatch):
+    start = synthetic(rows=3000, machines=3, days=DAYS)
+    evictions = []
+    monkeypatch.setattr(ingestion, "evict_extracts", lambda: evictions.append(1))
+    ingestion.fetch_all_data(start, start + timedelta(days=DAYS - 1))
+    assert len(evictions) == 1
@@ -0,0 +1,38 @@
+from datetime import timedelta
+import pandas as pd
+from src.components import grains
+from src.components.fetch_output import write_outputs
+from src.components.ingestion import fetch_all_data
+from src.components.processing import compute_metrics
+from src.components.queries import build_query, posting_time_column
+from src.config.settings import settings
+from src.utils.history_store import list_partitions
+
+def _run(day, days):
+    data = fetch_all_data(day, day + timedelta(days=days - 1))
+    metrics, summary = compute_metrics(data)
+    write_outputs(metrics, summary, data.get("hourly_sums"))
+    return data
+
+def test_sub_day_grains_are_off_by_default(synthetic, monkeypatch):
+    day = synthetic(rows=3000, machines=3, days=3)
+    monkeypatch.setattr(settings, "POSTING_TIME_COLUMNS", {"sap": "", "rewinder": "", "qc": ""})
+    assert posting_time_column("sap") is None
+    assert "POSTING" not in build_query("sap", "rows").text
+    data = _run(day, 3)
+    assert "hourly_sums" not in data
+    assert grains.available_grains() == ("day", "month")
+    assert list_partitions(grains.grain_root("hour")) == []
+    assert list_partitions(grains.grain_root("month"))
+
+def test_sub_day_grains_sum_to_the_day(synthetic):
+    day = synthetic(rows=3000, machines=3, days=3)
+    _run(day, 3)
+    assert grains.available_grains() == grains.GRAINS
+    daily = pd.read_feather(grains.partition_path("2025-01", settings.HISTORY_DIR))
+    for grain in grains.BUCKET_COLUMNS:
+        frame = pd.read_feather(grains.partition_path("2025-01", grains.grain_root(grain)))
+        sums = frame.groupby(["calculation_date", "machine_id"], observed=True)["Rewinder_Input"].sum()
+        expected = daily.set_index(["calculation_date", "machine_id"])["Rewinder_Input"]
+        pd.testing.assert_series_equal(sums.sort_index(), expected.sort_index(), check_exact=False, rtol=1e-9,
+                                       check_index_type=False, check_categorical=False)
@@ -0,0 +1,51 @@
+import os
+from datetime import date
+import pandas as pd
+import pyarrow as pa
+from src.config.settings import settings
+from src.utils.history_store import (
+    list_partitions, partition_path, read_history, read_history_table, upsert_history, upsert_history_table,
+)
+
+START = date(2025, 1, 20)
+
+def _sorted(frame):
+    frame = frame.assign(machine_id=frame["machine_id"].astype(str))
+    return frame.sort_values(["calculation_date", "machine_id"]).reset_index(drop=True)
+
+def test_upsert_is_idempotent(workspace, rows, days):
+    # Spans January and February
+    frame = rows(days(START, 20))
+    assert upsert_history(frame).empty
+    first = read_history()
+    previous = upsert_history(frame)
+    pd.testing.assert_frame_equal(_sorted(previous), _sorted(frame))
+    pd.testing.assert_frame_equal(read_history(), first)
+    assert list_partitions() == ["2025-01", "2025-02"]
+
+def test_upsert_replaces_keys_and_rewrites_only_touched_months(workspace, rows, days, machines):
+    upsert_history(rows(days(START, 20)))
+    january = partition_path("2025-01")
+    os.utime(january, (0, 0))
+    correction = rows(days(date(2025, 2, 3), 2), seed=1)
+    previous = upsert_history(correction)
+    assert len(previous) == len(correction)
+    assert os.path.getmtime(january) == 0
+
+    stored = _sorted(read_history())
+    assert len(stored) == 20 * len(machines)
+    corrected = stored[stored["calculation_date"].isin(correction["calculation_date"])].reset_index(drop=True)
+    pd.testing.assert_frame_equal(corrected, _sorted(correction))
+
+def test_arrow_upsert_is_idempotent_and_matches_pandas(workspace, monkeypatch, rows, days):
+    frame = rows(days(START, 20))
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    assert upsert_history_table(table).num_rows == 0
+    first = read_history_table()
+    assert upsert_history_table(table).num_rows == table.num_rows
+    assert read_history_table().equals(first)
+
+    monkeypatch.setattr(settings, "HISTORY_DIR", str(workspace / "pandas_history"))
+    upsert_history(frame)
+    upsert_history(frame)
+    pd.testing.assert_frame_equal(_sorted(read_history()), _sorted(first.to_pandas()), check_dtype=False)
@@ -0,0 +1,51 @@
+import json
+import os
+import time
+import numpy as np
+import pytest
+from src.config.settings import settings
+from src.utils import instrumentation
+from src.utils.instrumentation import current_rss_mb, pipeline_run, stage
+
+needs_rss = pytest.mark.skipif(current_rss_mb() is None, reason="no RSS reading on this platform")
+
+@needs_rss
+def test_stage_memory_is_its_own_sampled_peak(workspace):
+    with stage("allocate") as allocating:
+        block = np.ones(200 * 1024 * 1024 // 8)
+        time.sleep(0.3)
+        del block
+    with stage("idle") as idle:
+        time.sleep(0.1)
+    assert allocating.peak_rss_delta_mb > 150
+    # The process high-water mark still holds the allocation; the next stage's reading does not
+    assert idle.peak_rss_delta_mb < 50
+    assert idle.peak_rss_mb < allocating.peak_rss_mb - 150
+
+@needs_rss
+def test_nested_stages_are_sampled_together(workspace):
+    with stage("outer") as outer:
+        with stage("inner") as inner:
+            block = np.ones(100 * 1024 * 1024 // 8)
+            time.sleep(0.2)
+            del block
+    assert inner.peak_rss_delta_mb > 75
+    assert outer.peak_rss_mb >= inner.peak_rss_mb
+
+def test_run_records_name_their_plant(workspace, monkeypatch):
+    with pipeline_run("daily"):
+        pass
+    monkeypatch.setattr(settings, "PLANT", "5000")
+    with pipeline_run("daily_5000"):
+        pass
+    with open(settings.RUN_LOG_FILE) as f:
+        assert [json.loads(line)["plant"] for line in f] == [None, "5000"]
+
+def test_failed_textfile_replace_leaves_no_temp_file(workspace, monkeypatch):
+    def fail(src, dst):
+        raise OSError("read-only target")
+
+    monkeypatch.setattr(instrumentation.os, "replace", fail)
+    with pytest.raises(OSError):
+        instrumentation._atomic_write_text("up 1\n", os.path.join(settings.METRICS_DIR, "activeqc_daily.prom"))
+    assert os.listdir(settings.METRICS_DIR) == []
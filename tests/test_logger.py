@@ -0,0 +1,45 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from src.utils import logger
+
+def _log_from_worker(message):
+    logging.getLogger("worker").warning(message)
+    return multiprocessing.current_process().name
+
+@pytest.fixture
+def log_setup(workspace):
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    path = logger.setup_logger(force=True, name="test")
+    yield path
+    logger.stop_logger()
+    logger.LOG_FILE_PATH = None
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+def test_worker_records_reach_the_main_listener(log_setup, monkeypatch):
+    writers = set()
+    for handler in logger._handlers:
+        def handle(record, handle=handler.handle):
+            writers.add(threading.current_thread())
+            return handle(record)
+        monkeypatch.setattr(handler, "handle", handle)
+    listener_thread = logger._listener._thread
+
+    context = multiprocessing.get_context("spawn")
+    with logger.process_log_queue(context) as log_queue, ProcessPoolExecutor(
+        max_workers=2, mp_context=context, initializer=logger.setup_worker_logger, initargs=(log_queue,),
+    ) as pool:
+        workers = list(pool.map(_log_from_worker, ["from worker 1", "from worker 2"]))
+    logging.getLogger("main").warning("from main")
+    logger.stop_logger()
+
+    assert writers == {listener_thread}
+    with open(log_setup) as f:
+        lines = f.read().splitlines()
+    for message in ("from worker 1", "from worker 2", "from main"):
+        assert sum(message in line for line in lines) == 1
+    assert any(name in line for name in workers for line in lines)
@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+from contextlib import contextmanager
+from datetime import date, timedelta
+import pandas as pd
+import pytest
+from src.components.anomalies import rebuild_anomalies
+from src.components.derived import recompute_derived
+from src.components.fetch_output import write_outputs
+from src.components.grains import grain_root, refresh_months, rederive_grains
+from src.components.rollups import rebuild_rollups
+from src.config.settings import settings
+from src.utils.file_lock import output_lock
+from src.utils.history_store import read_history
+
+START = date(2025, 3, 1)
+
+def _summary(frame):
+    return {"last_calculated_date": str(max(frame["calculation_date"]))}
+
+def _month_grain():
+    frame = read_history(root=grain_root("month"))
+    return frame.assign(machine_id=frame["machine_id"].astype(str)).sort_values("machine_id").reset_index(drop=True)
+
+def test_open_day_updates_month_grain_by_difference(workspace, rows, days):
+    closed = rows(days(START, 5))
+    write_outputs(closed, _summary(closed))
+    open_day = START + timedelta(days=5)
+    for seed in (1, 2, 3):
+        frame = rows([open_day], seed)
+        write_outputs(frame, _summary(frame), open_day=open_day)
+    incremental = _month_grain()
+    refresh_months(["2025-03"])
+    pd.testing.assert_frame_equal(incremental, _month_grain(), check_exact=False, rtol=1e-12)
+
+def test_output_lock_is_reentrant(workspace):
+    with output_lock():
+        with output_lock(timeout=0):
+            assert os.path.exists(os.path.join(settings.STATE_DIR, "outputs.lock"))
+
+@contextmanager
+def _held_by_another_process():
+    code = (
+        "import sys, time\n"
+        "from src.config.settings import settings\n"
+        "from src.utils.file_lock import output_lock\n"
+        f"settings.STATE_DIR = {settings.STATE_DIR!r}\n"
+        "with output_lock():\n"
+        "    print('locked', flush=True)\n"
+        "    sys.stdin.readline()\n"
+    )
+    holder = subprocess.Popen([sys.executable, "-c", code], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        yield
+    finally:
+        holder.communicate("\n", timeout=30)
+
+def test_output_lock_excludes_other_processes(workspace):
+    with _held_by_another_process():
+        with pytest.raises(TimeoutError):
+            with output_lock(timeout=0.2):
+                pass
+    with output_lock(timeout=5):
+        pass
+
+@pytest.mark.parametrize("rebuild", [recompute_derived, rebuild_rollups, rebuild_anomalies, rederive_grains])
+def test_rebuild_commands_take_the_output_lock(workspace, monkeypatch, rebuild):
+    monkeypatch.setattr(settings, "OUTPUT_LOCK_TIMEOUT_SECONDS", 0.2)
+    with _held_by_another_process():
+        with pytest.raises(TimeoutError):
+            rebuild()
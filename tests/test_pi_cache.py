@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.fake_pi import FakePIPoint
+from src.utils import pi_cache
+from src.utils.pi_cache import lookup, read_range, remember, to_seconds
+
+TAG = "PM1:DayTonnage"
+
+class CountingPoint(FakePIPoint):
+    """
+        Fake point recording every range read; fail_after makes the read after that many raise.
+    """
+
+    def __init__(self, fail_after=None):
+        super().__init__(TAG, 0.0)
+        self.ranges = []
+        self.fail_after = fail_after
+
+    def recorded_values(self, start_time, end_time):
+        if self.fail_after is not None and len(self.ranges) >= self.fail_after:
+            raise ConnectionError("historian unavailable")
+        self.ranges.append((pd.Timestamp(start_time), pd.Timestamp(end_time)))
+        return super().recorded_values(start_time, end_time)
+
+def _coverage():
+    return pi_cache._load(TAG, mmap=False)[1]
+
+def _span(first, last):
+    return to_seconds(first), to_seconds(last)
+
+@pytest.mark.parametrize("intervals, merged", [
+    ([], []),
+    ([(5, 9), (0, 3)], [(0, 3), (5, 9)]),
+    ([(0, 5), (3, 9)], [(0, 9)]),
+    ([(0, 5), (5, 9)], [(0, 9)]),
+    ([(0, 9), (2, 4), (10, 12)], [(0, 9), (10, 12)]),
+])
+def test_merge_joins_overlapping_and_touching_intervals(intervals, merged):
+    assert pi_cache._merge(intervals) == merged
+
+def test_gaps_are_the_uncovered_parts():
+    coverage = [(10, 20), (30, 40)]
+    assert pi_cache._gaps(coverage, 0, 50) == [(0, 10), (20, 30), (40, 50)]
+    assert pi_cache._gaps(coverage, 12, 18) == []
+    assert pi_cache._gaps(coverage, 15, 35) == [(20, 30)]
+
+def test_overlapping_reads_fetch_only_the_gap_and_merge_coverage(workspace):
+    point = CountingPoint()
+    first = read_range(point, TAG, datetime(2025, 1, 1), datetime(2025, 1, 10))
+    second = read_range(point, TAG, datetime(2025, 1, 5), datetime(2025, 1, 15))
+    assert point.ranges == [
+        (pd.Timestamp(2025, 1, 1), pd.Timestamp(2025, 1, 10)),
+        (pd.Timestamp(2025, 1, 10), pd.Timestamp(2025, 1, 15)),
+    ]
+    assert _coverage() == [_span(datetime(2025, 1, 1), datetime(2025, 1, 15))]
+    pd.testing.assert_series_equal(second.loc[:pd.Timestamp(2025, 1, 10)], first.loc[pd.Timestamp(2025, 1, 5):])
+    assert not second.index.duplicated().any()
+
+    read_range(point, TAG, datetime(2025, 1, 2), datetime(2025, 1, 14))
+    assert len(point.ranges) == 2
+
+def test_long_gaps_are_read_in_chunks(workspace, monkeypatch):
+    monkeypatch.setattr(pi_cache.settings, "PI_CACHE_FETCH_DAYS", 7)
+    point = CountingPoint()
+    read_range(point, TAG, datetime(2025, 1, 1), datetime(2025, 1, 31))
+    assert len(point.ranges) == 5
+    assert _coverage() == [_span(datetime(2025, 1, 1), datetime(2025, 1, 31))]
+
+def test_failed_read_keeps_the_chunks_read_before_it(workspace, monkeypatch):
+    monkeypatch.setattr(pi_cache.settings, "PI_CACHE_FETCH_DAYS", 7)
+    with pytest.raises(ConnectionError):
+        read_range(CountingPoint(fail_after=2), TAG, datetime(2025, 1, 1), datetime(2025, 1, 31))
+    assert _coverage() == [_span(datetime(2025, 1, 1), datetime(2025, 1, 15))]
+
+def test_remembered_point_reads_answer_lookups(workspace):
+    asked = [datetime(2025, 1, day, 23, 59) for day in (3, 4)]
+    point = CountingPoint()
+    remember(TAG, [(timestamp, timestamp - timedelta(minutes=59), 100.0 + i) for i, timestamp in enumerate(asked)])
+
+    class NoRanges:
+        pass
+
+    assert lookup(NoRanges(), TAG, asked) == {asked[0]: 100.0, asked[1]: 101.0}
+    assert point.ranges == []
+    # The look-back around a remembered read is read in two parts, either side of it, and merged with it
+    lookup(point, TAG, [datetime(2025, 1, 4, 12)])
+    assert point.ranges == [
+        (pd.Timestamp(2025, 1, 3, 12), pd.Timestamp(2025, 1, 3, 23)),
+        (pd.Timestamp(2025, 1, 3, 23, 59), pd.Timestamp(2025, 1, 4, 12)),
+    ]
+    assert _coverage() == [
+        _span(datetime(2025, 1, 3, 12), datetime(2025, 1, 4, 12)),
+        _span(datetime(2025, 1, 4, 23), datetime(2025, 1, 4, 23, 59)),
+    ]
+
+def test_new_samples_win_on_equal_timestamps(workspace):
+    read_range(CountingPoint(), TAG, datetime(2025, 1, 1), datetime(2025, 1, 2))
+    moment = datetime(2025, 1, 1, 12)
+    remember(TAG, [(moment, moment, -1.0)])
+    samples = pi_cache._load(TAG, mmap=False)[0]
+    assert samples["v"][samples["t"] == to_seconds(moment)].tolist() == [-1.0]
+    assert np.all(np.diff(samples["t"]) > 0)
+
+def test_recent_values_are_read_live_and_not_cached(workspace, monkeypatch):
+    point = CountingPoint()
+    end = pd.Timestamp.now(tz=pi_cache.settings.PI_TIMEZONE).tz_localize(None).floor("h")
+    horizon = pi_cache._horizon()
+    monkeypatch.setattr(pi_cache, "_horizon", lambda: horizon)
+    read_range(point, TAG, end - timedelta(days=2), end)
+    assert all(covered_end <= horizon for _, covered_end in _coverage())
+    read_range(point, TAG, end - timedelta(days=2), end)
+    # Only the unsettled tail is read again
+    assert len(point.ranges) == 3
+    assert point.ranges[2][0] >= pd.Timestamp(horizon, unit="s") - pd.Timedelta(seconds=1)
@@ -0,0 +1,41 @@
+from datetime import date
+import pandas as pd
+from src.components.rollups import load_rollups, rebuild_rollups, rollup_table, update_rollups
+from src.utils.history_store import upsert_history
+
+# Crosses a year and a month boundary, so the rolling windows reach back into the previous year
+START = date(2024, 12, 10)
+
+def _write(frame):
+    # As write_outputs does: the state is loaded (or first built) before the history changes
+    state = load_rollups()
+    update_rollups(frame, upsert_history(frame), state)
+
+def _assert_matches_rebuild():
+    pd.testing.assert_frame_equal(
+        rollup_table(load_rollups()), rollup_table(rebuild_rollups(save=False)), check_exact=False, rtol=1e-9
+    )
+
+def test_daily_updates_match_rebuild(workspace, rows, days):
+    for i, day in enumerate(days(START, 40)):
+        _write(rows([day], seed=i))
+        _assert_matches_rebuild()
+
+def test_corrections_and_late_days_match_rebuild(workspace, rows, days):
+    dates = days(START, 40)
+    _write(rows(dates[:30], seed=0))
+    _write(rows(dates[30:], seed=1))
+    # A day inside the rolling window, one in the previous month and year, and the latest day
+    for seed, day in enumerate([dates[35], dates[10], dates[-1]], start=2):
+        _write(rows([day], seed))
+        _assert_matches_rebuild()
+    # A machine appearing late with a backfilled day
+    _write(rows([dates[20], dates[38]], seed=9, machines=["PM4"]))
+    _assert_matches_rebuild()
+
+def test_rewriting_the_same_rows_changes_nothing(workspace, rows, days):
+    frame = rows(days(START, 10))
+    _write(frame)
+    before = rollup_table(load_rollups())
+    _write(frame)
+    pd.testing.assert_frame_equal(rollup_table(load_rollups()), before, check_exact=False, rtol=1e-12)
@@ -0,0 +1,20 @@
+import pandas as pd
+import pyarrow as pa
+from src.components.arrow_path import _quantity
+from src.components.schema import apply_extract_schema
+
+# A server-side sum that float32 cannot hold exactly (it would round to 16777216 kg)
+TOTAL = 16777217.061
+
+def test_row_quantities_are_downcast():
+    df = apply_extract_schema(pd.DataFrame({"LGORT": ["A", "B"], "MENGE": [1.5, 2.25]}))
+    assert df["MENGE"].dtype == "float32"
+    assert isinstance(df["LGORT"].dtype, pd.CategoricalDtype)
+
+def test_summed_quantities_keep_full_precision():
+    df = apply_extract_schema(pd.DataFrame({"LGORT": ["A"], "MENGE": [TOTAL], "ROW_COUNT": [3]}))
+    assert df["MENGE"].dtype == "float64"
+    assert df["MENGE"].iloc[0] == TOTAL
+    extract = pa.table({"LGORT": ["A"], "MENGE": [TOTAL], "ROW_COUNT": [3]})
+    assert _quantity(extract, "MENGE").to_pylist() == [TOTAL]
+    assert _quantity(extract.drop_columns(["ROW_COUNT"]), "MENGE").to_pylist() != [TOTAL]
@@ -0,0 +1,43 @@
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from src.components import streaming
+from src.components.ingestion import fetch_all_data
+from src.components.processing import compute_metrics
+from src.components.streaming import SeenKeys
+from src.config.settings import settings
+
+def test_seen_keys_keep_each_key_once():
+    rng = np.random.default_rng(0)
+    seen, kept = SeenKeys(), set()
+    for _ in range(20):
+        keys = pd.DataFrame({"BUDAT": rng.integers(0, 3, 500), "CHARG": rng.integers(0, 200, 500)})
+        mask = seen.filter_new(keys)
+        new = list(keys[mask].itertuples(index=False, name=None))
+        assert len(new) == len(set(new)) and not kept & set(new)
+        kept |= set(new)
+    assert len(seen) == len(kept)
+    assert np.all(np.diff(seen.hashes.astype(np.float64)) >= 0)
+
+def test_stream_mode_holds_one_date_of_keys_and_matches_rows_mode(synthetic, monkeypatch):
+    start = synthetic(rows=5000, machines=3, days=4)
+    monkeypatch.setattr(settings, "EXTRACT_CACHE", False)
+    end = start + timedelta(days=3)
+    expected, _ = compute_metrics(fetch_all_data(start, end))
+
+    sizes = []
+    filter_new = SeenKeys.filter_new
+
+    def recording(self, keys):
+        keep = filter_new(self, keys)
+        assert keys["BUDAT"].nunique() == 1
+        sizes.append(len(self))
+        return keep
+
+    monkeypatch.setattr(SeenKeys, "filter_new", recording)
+    monkeypatch.setattr(streaming, "chunk_rows", lambda: 1000)
+    monkeypatch.setattr(settings, "INGEST_MODE", "stream")
+    actual, _ = compute_metrics(fetch_all_data(start, end))
+    # Rows mode holds row quantities as float32; the streamed sums are float64
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-6)
+    assert sizes and max(sizes) < 5000